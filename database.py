@@ -2,6 +2,9 @@ import os
 import pyodbc
 import time
 
+from utils.arabic_utils import normalize_arabic, trigrams
+from utils.query_cache import query_cache
+
 # SQL Server connection configuration
 DATABASE = "stock"
 SERVER = r".\SQLEXPRESS"
@@ -18,6 +21,36 @@ def get_db_connection():
     )
     return pyodbc.connect(conn_str)
 
+def fetch_cached(sql, params=(), tables=(), max_age=None):
+    """
+    Run a read query through the shared query cache (opt-in per query)
+    tables: Every table the query reads; a write to any of them invalidates the result
+    Returns: Tuple of result rows; raises pyodbc.Error like a direct query would
+    """
+    key = query_cache.make_key(sql, params)
+    rows = query_cache.get(key, max_age)
+    if rows is not None:
+        return rows
+    
+    # Snapshot generations before reading so a concurrent write leaves the entry stale
+    generations = query_cache.generations(tables)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+        rows = tuple(tuple(row) for row in cursor.fetchall())
+    finally:
+        conn.close()
+    query_cache.put(key, tables, generations, rows)
+    return rows
+
+def invalidate_tables(*tables):
+    """Invalidate cached query results that read any of these tables; call after committing a write"""
+    query_cache.bump(*tables)
+
 def create_database_if_not_exists():
     """Create the database if it doesn't exist"""
     try:
@@ -146,6 +179,349 @@ def migrate_items_quantity_type(cursor):
     except Exception as e:
         print(f"Migration error: {e}")
 
+def migrate_product_stock_table(cursor):
+    """Create the product_stock aggregate table and seed it from existing lots"""
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='product_stock' AND xtype='U'")
+        
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE product_stock (
+                    id INT IDENTITY(1,1) PRIMARY KEY,
+                    item_name NVARCHAR(255) NOT NULL,
+                    quantity_type NVARCHAR(50) NOT NULL DEFAULT 'unit',
+                    on_hand_quantity INT NOT NULL DEFAULT 0,
+                    lot_count INT NOT NULL DEFAULT 0,
+                    stock_value DECIMAL(14,2) NOT NULL DEFAULT 0,
+                    last_updated DATETIME NOT NULL DEFAULT GETDATE(),
+                    CONSTRAINT UQ_product_stock_product UNIQUE (item_name, quantity_type)
+                )
+            """)
+            
+            # Seed the aggregate from the lots already in stock
+            cursor.execute("""
+                INSERT INTO product_stock
+                    (item_name, quantity_type, on_hand_quantity, lot_count, stock_value, last_updated)
+                SELECT item_name, COALESCE(quantity_type, 'unit'),
+                       SUM(quantity),
+                       SUM(CASE WHEN quantity > 0 THEN 1 ELSE 0 END),
+                       SUM(quantity * price_per_unit),
+                       GETDATE()
+                FROM items
+                GROUP BY item_name, COALESCE(quantity_type, 'unit')
+            """)
+            
+            print("Created product_stock aggregate table")
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_supplier_balances_table(cursor):
+    """Create the supplier_balances aggregate table and seed it from existing invoices"""
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='supplier_balances' AND xtype='U'")
+        
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE supplier_balances (
+                    supplier_name NVARCHAR(255) NOT NULL PRIMARY KEY,
+                    invoice_count INT NOT NULL DEFAULT 0,
+                    total_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+                    paid_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+                    last_updated DATETIME NOT NULL DEFAULT GETDATE()
+                )
+            """)
+            
+            # Seed the balances from the invoices already recorded
+            cursor.execute("""
+                INSERT INTO supplier_balances
+                    (supplier_name, invoice_count, total_amount, paid_amount, last_updated)
+                SELECT supplier_name, COUNT(*), SUM(total_amount), SUM(COALESCE(paid_amount, 0)), GETDATE()
+                FROM invoices
+                GROUP BY supplier_name
+            """)
+            
+            print("Created supplier_balances aggregate table")
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_invoice_payments_table(cursor):
+    """Create the invoice_payments ledger and backfill opening balances from existing invoices"""
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='invoice_payments' AND xtype='U'")
+        
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE invoice_payments (
+                    id INT IDENTITY(1,1) PRIMARY KEY,
+                    invoice_id INT NOT NULL FOREIGN KEY REFERENCES invoices(id),
+                    supplier_name NVARCHAR(255) NOT NULL,
+                    amount DECIMAL(10,2) NOT NULL,
+                    payment_date DATETIME NOT NULL DEFAULT GETDATE(),
+                    recorded_by NVARCHAR(255),
+                    payment_method NVARCHAR(50),
+                    notes NVARCHAR(500)
+                )
+            """)
+            
+            # Invoice payment history
+            cursor.execute("CREATE INDEX IX_invoice_payments_invoice ON invoice_payments (invoice_id, payment_date)")
+            # Per-supplier payment statements
+            cursor.execute("""
+                CREATE INDEX IX_invoice_payments_supplier_date ON invoice_payments (supplier_name, payment_date)
+                INCLUDE (amount, invoice_id, payment_method, recorded_by)
+            """)
+            # Daily cash-out totals
+            cursor.execute("CREATE INDEX IX_invoice_payments_date ON invoice_payments (payment_date) INCLUDE (amount)")
+            
+            # Amounts paid before the ledger existed become a single opening-balance payment
+            cursor.execute("""
+                INSERT INTO invoice_payments (invoice_id, supplier_name, amount, payment_date, payment_method, notes)
+                SELECT id, supplier_name, paid_amount, COALESCE(issue_date, GETDATE()), 'opening_balance',
+                       N'رصيد افتتاحي'
+                FROM invoices
+                WHERE paid_amount > 0
+            """)
+            
+            print("Created invoice_payments ledger table")
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_modern_column_types(cursor):
+    """Replace deprecated NTEXT columns with NVARCHAR and use native date types for date columns"""
+    # (table, column, new type); ALTER fails rather than truncates if existing text does not fit
+    text_columns = [
+        ('invoices', 'notes', 'NVARCHAR(MAX)'),
+        ('suppliers', 'address', 'NVARCHAR(500)'),
+        ('suppliers', 'notes', 'NVARCHAR(MAX)'),
+        ('branches', 'address', 'NVARCHAR(500)'),
+        ('branches', 'notes', 'NVARCHAR(MAX)'),
+        ('settings', 'setting_value', 'NVARCHAR(4000)'),
+    ]
+    date_columns = [
+        ('items', 'date_added', 'DATETIME2(0) NOT NULL', 'datetime2'),
+        ('extractions', 'date_extracted', 'DATETIME2(0) NOT NULL', 'datetime2'),
+        ('invoices', 'issue_date', 'DATE NOT NULL', 'date'),
+        ('invoices', 'due_date', 'DATE NULL', 'date'),
+    ]
+    
+    for table, column, new_type in text_columns:
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = ? AND COLUMN_NAME = ? AND DATA_TYPE = 'ntext'
+            """, (table, column))
+            if cursor.fetchone()[0] > 0:
+                cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} {new_type}")
+                # Rewrite the values so they move from the old off-row text pages into the row
+                cursor.execute(f"UPDATE {table} SET {column} = {column}")
+                print(f"Converted {table}.{column} to {new_type}")
+        except Exception as e:
+            print(f"Migration error: {e}")
+    
+    for table, column, new_type, data_type in date_columns:
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = ? AND COLUMN_NAME = ? AND DATA_TYPE <> ?
+            """, (table, column, data_type))
+            if cursor.fetchone()[0] > 0:
+                cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} {new_type}")
+                print(f"Converted {table}.{column} to {new_type}")
+        except Exception as e:
+            print(f"Migration error: {e}")
+    
+    # Indexes so date range filters become seeks
+    date_indexes = [
+        ('IX_items_date_added', 'items', '(date_added)'),
+        ('IX_extractions_date_extracted', 'extractions', '(date_extracted)'),
+        ('IX_invoices_supplier_issue_date', 'invoices', '(supplier_name, issue_date)'),
+    ]
+    for index_name, table, columns in date_indexes:
+        try:
+            cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = ?", (index_name,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"CREATE INDEX {index_name} ON {table} {columns}")
+        except Exception as e:
+            print(f"Migration error: {e}")
+
+def migrate_invoices_outstanding_amount(cursor):
+    """Add the persisted outstanding_amount column to invoices and index it for unpaid-invoice queries"""
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_NAME = 'invoices' AND COLUMN_NAME = 'outstanding_amount'
+        """)
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                ALTER TABLE invoices
+                ADD outstanding_amount AS (total_amount - ISNULL(paid_amount, 0)) PERSISTED
+            """)
+            print("Added outstanding_amount column to invoices table")
+        
+        # Filtered indexes cannot reference computed columns, so key the index on the
+        # balance itself: "outstanding_amount > 0" is a range seek past the paid invoices
+        cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = 'IX_invoices_outstanding'")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE INDEX IX_invoices_outstanding ON invoices (outstanding_amount)
+                INCLUDE (supplier_name, invoice_number, issue_date)
+            """)
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_item_name_search(cursor):
+    """Add normalized item names and the trigram table used for item name search"""
+    try:
+        for table in ('items', 'product_stock'):
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = ? AND COLUMN_NAME = 'name_normalized'
+            """, (table,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"ALTER TABLE {table} ADD name_normalized NVARCHAR(255) NULL")
+                print(f"Added name_normalized column to {table} table")
+        
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='item_name_trigrams' AND xtype='U'")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE item_name_trigrams (
+                    trigram NCHAR(3) NOT NULL,
+                    name_normalized NVARCHAR(255) NOT NULL,
+                    PRIMARY KEY (trigram, name_normalized)
+                )
+            """)
+            cursor.execute("CREATE INDEX IX_item_name_trigrams_name ON item_name_trigrams (name_normalized)")
+            print("Created item_name_trigrams table")
+        
+        for index_name, table in (('IX_items_name_normalized', 'items'),
+                                  ('IX_product_stock_name_normalized', 'product_stock')):
+            cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = ?", (index_name,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"CREATE INDEX {index_name} ON {table} (name_normalized)")
+        
+        # Backfill names that have not been normalized yet; normalization is done in Python
+        cursor.execute("SELECT DISTINCT item_name FROM items WHERE name_normalized IS NULL")
+        names = [row[0] for row in cursor.fetchall()]
+        for item_name in names:
+            name_normalized = normalize_arabic(item_name)
+            cursor.execute("UPDATE items SET name_normalized = ? WHERE item_name = ?", (name_normalized, item_name))
+            cursor.execute("UPDATE product_stock SET name_normalized = ? WHERE item_name = ?",
+                           (name_normalized, item_name))
+            grams = trigrams(name_normalized)
+            if not grams:
+                continue
+            cursor.execute("SELECT COUNT(*) FROM item_name_trigrams WHERE name_normalized = ?", (name_normalized,))
+            if cursor.fetchone()[0] == 0:
+                cursor.executemany(
+                    "INSERT INTO item_name_trigrams (trigram, name_normalized) VALUES (?, ?)",
+                    [(gram, name_normalized) for gram in grams])
+        if names:
+            print(f"Indexed {len(names)} item names for search")
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_table_versions_table(cursor):
+    """Create the table_versions change counters used to validate cached reference data"""
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='table_versions' AND xtype='U'")
+        
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE table_versions (
+                    table_name NVARCHAR(128) NOT NULL PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0,
+                    last_updated DATETIME2(0) NOT NULL DEFAULT SYSDATETIME()
+                )
+            """)
+            print("Created table_versions table")
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_change_tracking(cursor):
+    """Add row_version columns and delete tombstones so items, invoices and extractions support delta reads"""
+    try:
+        for table in ('items', 'invoices', 'extractions'):
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = ? AND COLUMN_NAME = 'row_version'
+            """, (table,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"ALTER TABLE {table} ADD row_version ROWVERSION NOT NULL")
+                cursor.execute(f"CREATE INDEX IX_{table}_row_version ON {table} (row_version)")
+                print(f"Added row_version column to {table} table")
+        
+        cursor.execute("SELECT COUNT(*) FROM sysobjects WHERE name='deleted_rows' AND xtype='U'")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("""
+                CREATE TABLE deleted_rows (
+                    id BIGINT IDENTITY(1,1) PRIMARY KEY,
+                    table_name NVARCHAR(128) NOT NULL,
+                    row_id INT NOT NULL,
+                    row_version ROWVERSION NOT NULL,
+                    deleted_at DATETIME2(0) NOT NULL DEFAULT SYSDATETIME()
+                )
+            """)
+            cursor.execute("CREATE INDEX IX_deleted_rows_table_version ON deleted_rows (table_name, row_version) INCLUDE (row_id)")
+            print("Created deleted_rows table")
+        
+        for table in ('items', 'invoices', 'extractions'):
+            trigger_name = f"TR_{table}_track_delete"
+            cursor.execute("SELECT COUNT(*) FROM sys.triggers WHERE name = ?", (trigger_name,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"""
+                    CREATE TRIGGER {trigger_name} ON {table} AFTER DELETE AS
+                    BEGIN
+                        SET NOCOUNT ON;
+                        INSERT INTO deleted_rows (table_name, row_id)
+                        SELECT '{table}', id FROM deleted;
+                    END
+                """)
+            
+    except Exception as e:
+        print(f"Migration error: {e}")
+
+def migrate_item_query_indexes(cursor):
+    """Index the items columns that Item.query_items filters on"""
+    item_indexes = [
+        ('IX_items_invoice_number', '(invoice_number)'),
+        ('IX_items_supplier_name', '(supplier_name, date_added)'),
+    ]
+    for index_name, columns in item_indexes:
+        try:
+            cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = ?", (index_name,))
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(f"CREATE INDEX {index_name} ON items {columns}")
+        except Exception as e:
+            print(f"Migration error: {e}")
+
+def migrate_extraction_indexes(cursor):
+    """Index extractions by branch for the branch reports"""
+    try:
+        # Covers Branch.get_activity_report; an index created without branch_name is rebuilt
+        cursor.execute("""
+            SELECT COUNT(*),
+                   SUM(CASE WHEN c.name = 'branch_name' THEN 1 ELSE 0 END)
+            FROM sys.indexes ix
+            JOIN sys.index_columns ic ON ic.object_id = ix.object_id AND ic.index_id = ix.index_id
+            JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+            WHERE ix.name = 'IX_extractions_branch_id' AND ix.object_id = OBJECT_ID('extractions')
+        """)
+        column_count, has_branch_name = cursor.fetchone()
+        if column_count == 0 or not has_branch_name:
+            rebuild = " WITH (DROP_EXISTING = ON)" if column_count else ""
+            cursor.execute(f"""
+                CREATE INDEX IX_extractions_branch_id ON extractions (branch_id)
+                INCLUDE (item_id, quantity_extracted, branch_name){rebuild}
+            """)
+    except Exception as e:
+        print(f"Migration error: {e}")
+
 def create_tables():
     """Create the necessary tables if they don't exist"""
     # Ensure database exists before creating tables
@@ -165,7 +541,7 @@ def create_tables():
                             price_per_unit DECIMAL(10,2) NOT NULL,
                             invoice_number NVARCHAR(100) NOT NULL,
                             supplier_name NVARCHAR(255),
-                            date_added DATETIME NOT NULL
+                            date_added DATETIME2(0) NOT NULL
                         )
                         END"""
         
@@ -179,7 +555,7 @@ def create_tables():
                                 branch_name NVARCHAR(255),
                                 quantity_extracted INT NOT NULL,
                                 extracted_by NVARCHAR(255),
-                                date_extracted DATETIME NOT NULL,
+                                date_extracted DATETIME2(0) NOT NULL,
                                 FOREIGN KEY (item_id) REFERENCES items (id),
                                 FOREIGN KEY (branch_id) REFERENCES branches (id)
                             )
@@ -195,9 +571,9 @@ def create_tables():
                             total_amount DECIMAL(10,2) NOT NULL,
                             payment_status NVARCHAR(50) NOT NULL,
                             paid_amount DECIMAL(10,2) DEFAULT 0,
-                            issue_date DATETIME NOT NULL,
-                            due_date DATETIME,
-                            notes NTEXT
+                            issue_date DATE NOT NULL,
+                            due_date DATE,
+                            notes NVARCHAR(MAX)
                         )
                         END"""
         
@@ -223,7 +599,7 @@ def create_tables():
                             CREATE TABLE settings (
                             id INT IDENTITY(1,1) PRIMARY KEY,
                             setting_name NVARCHAR(100) NOT NULL UNIQUE,
-                            setting_value NTEXT,
+                            setting_value NVARCHAR(4000),
                             setting_type NVARCHAR(50)
                         )
                         END"""
@@ -237,9 +613,9 @@ def create_tables():
                              contact_person NVARCHAR(255),
                              phone NVARCHAR(50),
                              email NVARCHAR(255),
-                             address NTEXT,
+                             address NVARCHAR(500),
                              payment_terms NVARCHAR(100),
-                             notes NTEXT,
+                             notes NVARCHAR(MAX),
                              date_added DATETIME NOT NULL DEFAULT GETDATE(),
                              is_active BIT DEFAULT 1
                          )
@@ -254,9 +630,9 @@ def create_tables():
                             branch_code NVARCHAR(50),
                             manager_name NVARCHAR(255),
                             phone NVARCHAR(50),
-                            address NTEXT,
+                            address NVARCHAR(500),
                             opening_date DATETIME,
-                            notes NTEXT,
+                            notes NVARCHAR(MAX),
                             date_added DATETIME NOT NULL DEFAULT GETDATE(),
                             is_active BIT DEFAULT 1
                         )
@@ -280,6 +656,36 @@ def create_tables():
         # Migrate items table to include quantity_type
         migrate_items_quantity_type(cursor)
         
+        # Create the per-product stock aggregate
+        migrate_product_stock_table(cursor)
+        
+        # Create the per-supplier balance aggregate
+        migrate_supplier_balances_table(cursor)
+        
+        # Create the payment ledger
+        migrate_invoice_payments_table(cursor)
+        
+        # Move NTEXT and legacy date columns to current types
+        migrate_modern_column_types(cursor)
+        
+        # Add the persisted outstanding balance to invoices
+        migrate_invoices_outstanding_amount(cursor)
+        
+        # Add the normalized item name search index
+        migrate_item_name_search(cursor)
+        
+        # Create the version counters for cached reference data
+        migrate_table_versions_table(cursor)
+        
+        # Add change tokens and delete tombstones for delta reads
+        migrate_change_tracking(cursor)
+        
+        # Index the invoice and supplier filters of the stock query
+        migrate_item_query_indexes(cursor)
+
+        # Index extractions by branch for the branch activity report
+        migrate_extraction_indexes(cursor)
+
         # No need to add is_admin column since table now uses role column
         
         # Check if admin user exists, if not create default admin user
@@ -293,7 +699,15 @@ def create_tables():
         default_settings = [
             ('default_printer', '', 'text'),
             ('company_logo', '', 'file_path'),
-            ('auto_print', 'true', 'boolean')
+            ('auto_print', 'true', 'boolean'),
+            # Relay for change notifications between terminals (see utils/notification_broker.py);
+            # empty until a broker is set up, terminals poll for changes meanwhile
+            ('notification_broker_host', '', 'text'),
+            ('notification_broker_port', '45454', 'integer'),
+            # Build the other main window tabs in the background after login
+            ('prebuild_tabs', 'true', 'boolean'),
+            # Seconds a cached query result may hide changes made by other terminals
+            ('query_cache_max_age', '60', 'integer')
         ]
         
         for setting in default_settings:
@@ -6,6 +6,16 @@ from PySide6.QtCore import Qt, QTimer
 from ui.main_window import MainWindow
 from ui.login import LoginWidget
 from database import create_tables
+from utils.notification_broker import start_notifications
+from utils.local_cache import local_cache
+from utils.query_cache import query_cache
+from utils.event_bus import event_bus, SettingsChanged
+from models.settings import Settings
+
+def configure_query_cache(event=None):
+    """Apply the query_cache_max_age setting, now and whenever it changes"""
+    if event is None or event.setting_name in (None, 'query_cache_max_age'):
+        query_cache.max_age = Settings.get_setting('query_cache_max_age', query_cache.max_age)
 
 def main():
     # Create the application
@@ -35,6 +45,16 @@ def main():
         error_dialog.exec()
         return
     
+    configure_query_cache()
+    event_bus.subscribe(SettingsChanged, configure_query_cache)
+    
+    # Share committed changes with the other terminals
+    notification_broker, notification_client = start_notifications(app)
+    app.aboutToQuit.connect(notification_client.stop)
+    
+    # Save what the views show so the next start can paint it immediately
+    app.aboutToQuit.connect(local_cache.flush)
+    
     # Create login widget
     login_widget = LoginWidget()
     
@@ -1,6 +1,9 @@
 import pyodbc
 from datetime import datetime
-from database import get_db_connection
+from database import get_db_connection, fetch_cached, invalidate_tables
+from models.table_versions import TableVersions
+from utils.versioned_cache import VersionedCache
+from utils.event_bus import event_bus, BranchChanged
 
 class Branch:
     @staticmethod
@@ -21,7 +24,11 @@ class Branch:
             
             # Get the inserted ID
             inserted_id = cursor.fetchone()[0]
+            TableVersions.bump(cursor, 'branches')
             conn.commit()
+            invalidate_tables('branches')
+            _branches_cache.invalidate()
+            event_bus.publish(BranchChanged(inserted_id))
             return inserted_id
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -31,10 +38,10 @@ class Branch:
                 conn.close()
     
     @staticmethod
-    def get_all_branches():
-        """Get all active branches from the database"""
+    def _fetch_active_branches():
+        """Read all active branches from the database (raises pyodbc.Error); cached by get_all_branches"""
+        conn = get_db_connection()
         try:
-            conn = get_db_connection()
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM branches WHERE is_active = 1 ORDER BY branch_name")
             branches = []
@@ -52,12 +59,17 @@ class Branch:
                     'is_active': row[9]
                 })
             return branches
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def get_all_branches():
+        """Get all active branches (served from the versioned reference cache)"""
+        try:
+            return [dict(record) for record in _branches_cache.get()]
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
     @staticmethod
     def get_branch_by_id(branch_id):
@@ -103,8 +115,14 @@ class Branch:
             
             cursor.execute(sql, (branch_name, branch_code, manager_name, phone,
                                 address, opening_date, notes, branch_id))
+            updated = cursor.rowcount > 0
+            TableVersions.bump(cursor, 'branches')
             conn.commit()
-            return cursor.rowcount > 0
+            invalidate_tables('branches')
+            _branches_cache.invalidate()
+            if updated:
+                event_bus.publish(BranchChanged(branch_id))
+            return updated
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return False
@@ -120,8 +138,14 @@ class Branch:
             cursor = conn.cursor()
             
             cursor.execute("UPDATE branches SET is_active = 0 WHERE id = ?", (branch_id,))
+            updated = cursor.rowcount > 0
+            TableVersions.bump(cursor, 'branches')
             conn.commit()
-            return cursor.rowcount > 0
+            invalidate_tables('branches')
+            _branches_cache.invalidate()
+            if updated:
+                event_bus.publish(BranchChanged(branch_id))
+            return updated
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return False
@@ -132,14 +156,39 @@ class Branch:
     @staticmethod
     def get_branch_names():
         """Get list of branch names for dropdowns"""
+        return [record['branch_name'] for record in Branch.get_all_branches()]
+
+    @staticmethod
+    def get_activity_report():
+        """
+        Get extraction totals of every branch that has extractions, largest quantity first
+        Cached until extractions, items or branches change
+        Returns: list of (branch_name, total_extractions, total_quantity, unique_items, branch_code, manager_name),
+                 or None if the database could not be read
+        """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT branch_name FROM branches WHERE is_active = 1 ORDER BY branch_name")
-            return [row[0] for row in cursor.fetchall()]
+            # Grouped on branch_id (indexed) and joined to branches once per branch, not per extraction
+            return list(fetch_cached("""
+                SELECT COALESCE(b.branch_name, totals.branch_name), totals.total_extractions,
+                       totals.total_quantity, totals.unique_items, b.branch_code, b.manager_name
+                FROM (
+                    SELECT e.branch_id, MAX(e.branch_name) AS branch_name, COUNT(*) AS total_extractions,
+                           SUM(e.quantity_extracted) AS total_quantity,
+                           COUNT(DISTINCT i.item_name) AS unique_items
+                    FROM extractions e
+                    JOIN items i ON e.item_id = i.id
+                    GROUP BY e.branch_id
+                ) totals
+                LEFT JOIN branches b ON b.id = totals.branch_id
+                ORDER BY totals.total_quantity DESC
+            """, tables=('extractions', 'items', 'branches')))
         except pyodbc.Error as e:
             print(f"Database error: {e}")
-            return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def invalidate_cache():
+        """Drop the cached branch list, e.g. after another terminal changed it"""
+        _branches_cache.invalidate()
+
+_branches_cache = VersionedCache(Branch._fetch_active_branches, lambda: TableVersions.get('branches'))
@@ -0,0 +1,92 @@
+from database import get_db_connection
+
+class ChangeTracking:
+    """Delta reads over tables that carry a row_version ROWVERSION column.
+
+    A change token is the database's MIN_ACTIVE_ROWVERSION() as an integer:
+    every row changed by a transaction committed before the token was read
+    has a lower row_version, and nothing committed later will. Deletes are
+    recorded as tombstones in deleted_rows by AFTER DELETE triggers; the
+    tombstone gets its own rowversion from the same database-wide counter.
+    """
+    TRACKED_TABLES = ('items', 'invoices', 'extractions')
+
+    @staticmethod
+    def current_token():
+        """Get a change token for "now" without reading any rows (raises pyodbc.Error)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)")
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def changed_tables(token):
+        """
+        Find which tracked tables had rows changed or deleted since a token
+        Returns: (set of table names, new token); raises pyodbc.Error
+        """
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)")
+            new_token = cursor.fetchone()[0]
+            
+            # One index seek per table on row_version
+            checks = " UNION ALL ".join(
+                f"SELECT '{table_name}' WHERE EXISTS (SELECT 1 FROM {table_name} "
+                f"WHERE row_version >= CAST(? AS BINARY(8)) AND row_version < CAST(? AS BINARY(8)))"
+                for table_name in ChangeTracking.TRACKED_TABLES)
+            cursor.execute(f"""
+                {checks}
+                UNION ALL
+                SELECT DISTINCT table_name FROM deleted_rows
+                WHERE row_version >= CAST(? AS BINARY(8)) AND row_version < CAST(? AS BINARY(8))
+            """, (token, new_token) * (len(ChangeTracking.TRACKED_TABLES) + 1))
+            return {row[0] for row in cursor.fetchall()}, new_token
+        finally:
+            conn.close()
+
+    @staticmethod
+    def fetch_changes(table_name, columns, token=None, from_sql=None):
+        """
+        Get the rows of a tracked table changed since a token
+        columns: Select list (qualified with the alias "t" when from_sql is given)
+        token: Token from a previous call, or None to fetch every row
+        from_sql: Optional FROM clause that aliases the tracked table as "t" (e.g. to join names)
+        Returns: (changed rows, deleted row ids, new token); raises pyodbc.Error
+        """
+        if table_name not in ChangeTracking.TRACKED_TABLES:
+            raise ValueError(f"{table_name} is not change tracked")
+        from_sql = from_sql or f"{table_name} t"
+        
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            # Read the new token first; rows at or above it are picked up by the next call
+            cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT)")
+            new_token = cursor.fetchone()[0]
+            
+            if token is None:
+                cursor.execute(f"""
+                    SELECT {columns} FROM {from_sql}
+                    WHERE t.row_version < CAST(? AS BINARY(8))
+                """, (new_token,))
+                return cursor.fetchall(), [], new_token
+            
+            cursor.execute(f"""
+                SELECT {columns} FROM {from_sql}
+                WHERE t.row_version >= CAST(? AS BINARY(8)) AND t.row_version < CAST(? AS BINARY(8))
+            """, (token, new_token))
+            changed = cursor.fetchall()
+            
+            cursor.execute("""
+                SELECT row_id FROM deleted_rows
+                WHERE table_name = ? AND row_version >= CAST(? AS BINARY(8)) AND row_version < CAST(? AS BINARY(8))
+            """, (table_name, token, new_token))
+            deleted = [row[0] for row in cursor.fetchall()]
+            return changed, deleted, new_token
+        finally:
+            conn.close()
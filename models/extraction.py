@@ -1,7 +1,10 @@
 import pyodbc
 from datetime import datetime
-from database import get_db_connection
+from database import get_db_connection, invalidate_tables
 from models.item import Item
+from models.product_stock import ProductStock
+from models.change_tracking import ChangeTracking
+from utils.event_bus import event_bus, StockExtracted
 
 class Extraction:
     def __init__(self, id=None, item_id=None, branch_id=None, branch_name="", quantity_extracted=0, extracted_by="", date_extracted=None):
@@ -11,7 +14,7 @@ class Extraction:
         self.branch_name = branch_name
         self.quantity_extracted = quantity_extracted
         self.extracted_by = extracted_by
-        self.date_extracted = date_extracted if date_extracted else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.date_extracted = date_extracted if date_extracted else datetime.now()
 
     @staticmethod
     def extract_item(item_id, branch_id, quantity_extracted, extracted_by=""):
@@ -56,10 +59,11 @@ class Extraction:
             new_quantity = current_quantity - quantity_extracted
             print(f"Updating item quantity from {current_quantity} to {new_quantity}")
             cur.execute("UPDATE items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
+            ProductStock.apply_quantity_change(cur, item_id, current_quantity, new_quantity)
             print("Item quantity updated")
             
             # Record the extraction with both branch_id, branch_name, and extracted_by
-            date_extracted = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            date_extracted = datetime.now()
             print(f"Inserting extraction record: item_id={item_id}, branch_id={branch_id}, branch_name={branch_name}, quantity={quantity_extracted}, extracted_by={extracted_by}, date={date_extracted}")
             cur.execute(
                 "INSERT INTO extractions (item_id, branch_id, branch_name, quantity_extracted, extracted_by, date_extracted) VALUES (?, ?, ?, ?, ?, ?)",
@@ -70,7 +74,9 @@ class Extraction:
             # Commit the transaction
             print("Committing transaction")
             conn.commit()
+            invalidate_tables('items', 'extractions', 'product_stock')
             print("Transaction committed successfully")
+            event_bus.publish(StockExtracted((item_id,), branch_id))
             return True, "Item extracted successfully"
             
         except pyodbc.Error as e:
@@ -120,6 +126,35 @@ class Extraction:
         
         return extractions
 
+    @staticmethod
+    def get_changed_since(token=None):
+        """Get the extractions recorded or changed since a change token (all extractions if token is None)
+        Returns: (changed extraction dictionaries, deleted extraction IDs, new token), or None on error
+        """
+        try:
+            rows, deleted_ids, new_token = ChangeTracking.fetch_changes(
+                'extractions',
+                "t.id, t.item_id, i.item_name, t.branch_id, t.branch_name, t.quantity_extracted, "
+                "t.extracted_by, t.date_extracted",
+                token,
+                from_sql="extractions t LEFT JOIN items i ON t.item_id = i.id")
+            extractions = []
+            for row in rows:
+                extractions.append({
+                    'id': row[0],
+                    'item_id': row[1],
+                    'item_name': row[2],
+                    'branch_id': row[3],
+                    'branch_name': row[4],
+                    'quantity_extracted': row[5],
+                    'extracted_by': row[6],
+                    'date_extracted': row[7]
+                })
+            return extractions, deleted_ids, new_token
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+
     @staticmethod
     def extract_multiple_items(items_list, branch_id, extracted_by=""):
         """Extract multiple items to a branch in a single transaction
@@ -142,20 +177,27 @@ class Extraction:
             branch_name = branch_row[0]
             print(f"Branch name: {branch_name}")
             
-            # Validate all items first
+            # Read every item once, locked until commit so the validated stock cannot change underneath
+            item_ids = list(dict.fromkeys(item_data['item_id'] for item_data in items_list))
+            stock = {}
+            for start in range(0, len(item_ids), Item.MAX_IDS_PER_QUERY):
+                chunk = item_ids[start:start + Item.MAX_IDS_PER_QUERY]
+                placeholders = ", ".join("?" for _ in chunk)
+                cur.execute(f"SELECT id, quantity, item_name FROM items WITH (UPDLOCK) WHERE id IN ({placeholders})",
+                            chunk)
+                for item_id, quantity, item_name in cur.fetchall():
+                    stock[item_id] = [quantity, item_name]
+            
+            # Validate all items first (an item listed twice is checked against its total)
+            requested = {}
             for item_data in items_list:
-                item_id = item_data['item_id']
-                quantity_extracted = item_data['quantity']
-                
-                # Get the current item
-                cur.execute("SELECT quantity, item_name FROM items WHERE id = ?", (item_id,))
-                row = cur.fetchone()
-                
-                if not row:
+                requested[item_data['item_id']] = requested.get(item_data['item_id'], 0) + item_data['quantity']
+            for item_id, quantity_extracted in requested.items():
+                if item_id not in stock:
                     conn.rollback()
                     return False, f"Item with ID {item_id} not found"
                 
-                current_quantity, item_name = row
+                current_quantity, item_name = stock[item_id]
                 
                 # Check if there's enough stock
                 if current_quantity < quantity_extracted:
@@ -163,21 +205,20 @@ class Extraction:
                     return False, f"Not enough stock for {item_name}. Available: {current_quantity}, Requested: {quantity_extracted}"
             
             # If all validations pass, perform the extractions
-            date_extracted = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            date_extracted = datetime.now()
             extraction_results = []
             
             for item_data in items_list:
                 item_id = item_data['item_id']
                 quantity_extracted = item_data['quantity']
-                
-                # Get current quantity again
-                cur.execute("SELECT quantity FROM items WHERE id = ?", (item_id,))
-                current_quantity = cur.fetchone()[0]
+                current_quantity = stock[item_id][0]
                 
                 # Update the item quantity
                 new_quantity = current_quantity - quantity_extracted
                 print(f"Updating item {item_id} quantity from {current_quantity} to {new_quantity}")
                 cur.execute("UPDATE items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
+                ProductStock.apply_quantity_change(cur, item_id, current_quantity, new_quantity)
+                stock[item_id][0] = new_quantity
                 
                 # Record the extraction
                 print(f"Inserting extraction record: item_id={item_id}, quantity={quantity_extracted}")
@@ -195,7 +236,9 @@ class Extraction:
             # Commit the transaction
             print("Committing transaction")
             conn.commit()
+            invalidate_tables('items', 'extractions', 'product_stock')
             print("Transaction committed successfully")
+            event_bus.publish(StockExtracted(tuple(item_ids), branch_id))
             return True, f"Successfully extracted {len(items_list)} items"
             
         except pyodbc.Error as e:
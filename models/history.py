@@ -0,0 +1,125 @@
+import pyodbc
+from database import get_db_connection
+from models.name_index import NameIndex
+
+class History:
+    """Stock operations (lots added and lots extracted) as one timeline, newest first.
+
+    Both tables are merged with UNION ALL in SQL and read a page at a time
+    with keyset pagination: the next page starts after the (date, kind, id)
+    key of the last entry shown, so every page is a seek on the date
+    indexes however deep the user scrolls.
+    """
+    ADDITION = 0
+    EXTRACTION = 1
+    PAGE_SIZE = 500
+
+    @staticmethod
+    def page_key(entry):
+        """Get the key of an entry, to pass as `after` for the next page"""
+        return entry['date'], entry['kind'], entry['id']
+
+    @staticmethod
+    def _keyset_condition(kind, date_column, id_column, after):
+        """Condition selecting this kind's rows that come after the key in (date, kind, id) DESC order"""
+        after_date, after_kind, after_id = after
+        if kind < after_kind:
+            return f"{date_column} <= ?", [after_date]
+        if kind > after_kind:
+            return f"{date_column} < ?", [after_date]
+        return f"({date_column} < ? OR ({date_column} = ? AND {id_column} < ?))", [after_date, after_date, after_id]
+
+    @staticmethod
+    def get_history(date_from=None, date_to=None, branch_id=None, product=None, user=None, after=None, limit=PAGE_SIZE):
+        """Get a page of stock operations, newest first
+        date_from, date_to: Range of operation dates; date_to is excluded
+        branch_id, user: Only extractions to this branch / by this person (additions have neither)
+        product: Product name search, matched like Item.search_items
+        after: History.page_key() of the last entry of the previous page, None for the first page
+        Returns: list of entry dictionaries (kind is History.ADDITION or History.EXTRACTION)
+        """
+        search = NameIndex.build_search(product, column="i.name_normalized") if product else None
+
+        # (kind, SELECT, date column, id column, conditions, params) of each merged table
+        sources = []
+        if branch_id is None and not user:
+            sources.append((History.ADDITION, """
+                SELECT TOP (?) 0 AS kind, i.id, i.date_added AS operation_date, i.item_name,
+                       i.quantity, i.invoice_number, NULL AS branch_name, NULL AS extracted_by
+                FROM items i""", "i.date_added", "i.id", [], []))
+        extraction_conditions = []
+        extraction_params = []
+        if branch_id is not None:
+            extraction_conditions.append("e.branch_id = ?")
+            extraction_params.append(branch_id)
+        if user:
+            extraction_conditions.append("e.extracted_by = ?")
+            extraction_params.append(user)
+        sources.append((History.EXTRACTION, """
+                SELECT TOP (?) 1 AS kind, e.id, e.date_extracted AS operation_date, i.item_name,
+                       e.quantity_extracted, NULL AS invoice_number, e.branch_name, e.extracted_by
+                FROM extractions e
+                LEFT JOIN items i ON e.item_id = i.id""", "e.date_extracted", "e.id",
+                        extraction_conditions, extraction_params))
+
+        parts = []
+        params = [limit]
+        for kind, select_sql, date_column, id_column, conditions, source_params in sources:
+            # Each table is limited and ordered on its own so both seek on their date index
+            source_params = [limit, *source_params]
+            if date_from is not None:
+                conditions.append(f"{date_column} >= ?")
+                source_params.append(date_from)
+            if date_to is not None:
+                conditions.append(f"{date_column} < ?")
+                source_params.append(date_to)
+            if search:
+                conditions.append(search[0])
+                source_params.extend(search[1])
+            if after is not None:
+                condition, condition_params = History._keyset_condition(kind, date_column, id_column, after)
+                conditions.append(condition)
+                source_params.extend(condition_params)
+            where_sql = " WHERE " + " AND ".join(conditions) if conditions else ""
+            parts.append(f"SELECT * FROM ({select_sql}{where_sql}"
+                         f" ORDER BY {date_column} DESC, {id_column} DESC) source_{kind}")
+            params.extend(source_params)
+
+        query = f"""
+            SELECT TOP (?) kind, id, operation_date, item_name, quantity, invoice_number, branch_name, extracted_by
+            FROM ({" UNION ALL ".join(parts)}) history
+            ORDER BY operation_date DESC, kind DESC, id DESC
+        """
+        entries = []
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(query, params)
+            for row in cur.fetchall():
+                entries.append({
+                    'kind': row[0],
+                    'id': row[1],
+                    'date': row[2],
+                    'item_name': row[3] or '',
+                    'quantity': row[4],
+                    'invoice_number': row[5],
+                    'branch_name': row[6],
+                    'extracted_by': row[7] or ''
+                })
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+        return entries
+
+    @staticmethod
+    def get_all_history(**filters):
+        """Get every stock operation matching the filters of get_history, newest first"""
+        entries = []
+        while True:
+            page = History.get_history(after=History.page_key(entries[-1]) if entries else None, **filters)
+            entries.extend(page)
+            if len(page) < History.PAGE_SIZE:
+                return entries
@@ -1,6 +1,9 @@
 import pyodbc
-from datetime import datetime
-from database import get_db_connection
+from datetime import date
+from database import get_db_connection, fetch_cached, invalidate_tables
+from models.supplier_balance import SupplierBalance
+from models.change_tracking import ChangeTracking
+from utils.event_bus import event_bus, InvoiceSaved, PaymentRecorded
 
 class Invoice:
     PAYMENT_STATUS = {
@@ -9,13 +12,40 @@ class Invoice:
         'DELAYED': 'متأخر'
     }
     
+    PAYMENT_METHODS = {
+        'CASH': 'نقدي',
+        'BANK_TRANSFER': 'تحويل بنكي',
+        'CHEQUE': 'شيك'
+    }
+    
+    # Column list shared by the invoice queries, in _invoice_from_row order
+    COLUMNS = ("id, invoice_number, supplier_name, total_amount, payment_status, paid_amount, "
+               "issue_date, due_date, notes, outstanding_amount")
+    
+    @staticmethod
+    def _invoice_from_row(row):
+        """Map a row selected with Invoice.COLUMNS to an invoice dictionary"""
+        return {
+            'id': row[0],
+            'invoice_number': row[1],
+            'supplier_name': row[2],
+            'total_amount': row[3],
+            'payment_status': row[4],
+            'paid_amount': row[5],
+            'issue_date': row[6],
+            'due_date': row[7],
+            'notes': row[8],
+            'outstanding_amount': row[9]
+        }
+    
     @staticmethod
-    def add_invoice(invoice_number, supplier_name, total_amount, payment_status, paid_amount=0, due_date=None, notes=None):
-        """Add a new invoice to the database"""
+    def add_invoice(invoice_number, supplier_name, total_amount, payment_status, paid_amount=0, due_date=None, notes=None,
+                    recorded_by=None, payment_method=None):
+        """Add a new invoice to the database; an upfront paid amount is recorded in the payment ledger"""
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            issue_date = datetime.now().strftime('%Y-%m-%d')
+            issue_date = date.today()
             
             # Validate payment status
             if payment_status not in Invoice.PAYMENT_STATUS.values():
@@ -27,7 +57,7 @@ class Invoice:
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
             
             cursor.execute(sql, (invoice_number, supplier_name, total_amount, payment_status, 
-                                paid_amount, issue_date, due_date, notes))
+                                0, issue_date, due_date, notes))
             
             # Get the last inserted ID using SCOPE_IDENTITY()
             cursor.execute("SELECT SCOPE_IDENTITY()")
@@ -40,7 +70,15 @@ class Invoice:
                 result = cursor.fetchone()
                 invoice_id = int(result[0]) if result and result[0] is not None else 1
             
+            SupplierBalance.apply_change(cursor, supplier_name, 1, total_amount, 0)
+            
+            # The paid amount is maintained from the ledger, so record the upfront payment there
+            if paid_amount:
+                Invoice._insert_payment(cursor, invoice_id, "?", (paid_amount,), recorded_by, payment_method)
+            
             conn.commit()
+            invalidate_tables('invoices', 'invoice_payments', 'supplier_balances')
+            event_bus.publish(InvoiceSaved(invoice_id, invoice_number, supplier_name))
             return invoice_id
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -55,20 +93,8 @@ class Invoice:
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM invoices ORDER BY issue_date DESC")
-            invoices = []
-            for row in cursor.fetchall():
-                invoices.append({
-                    'id': row[0],
-                    'invoice_number': row[1],
-                    'supplier_name': row[2],
-                    'total_amount': row[3],
-                    'payment_status': row[4],
-                    'paid_amount': row[5],
-                    'issue_date': row[6],
-                    'due_date': row[7],
-                    'notes': row[8]
-                })
+            cursor.execute(f"SELECT {Invoice.COLUMNS} FROM invoices ORDER BY issue_date DESC")
+            invoices = [Invoice._invoice_from_row(row) for row in cursor.fetchall()]
             return invoices
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -84,22 +110,12 @@ class Invoice:
             conn = get_db_connection()
             cursor = conn.cursor()
             cursor.execute(
-                "SELECT * FROM invoices WHERE invoice_number = ?",
+                f"SELECT {Invoice.COLUMNS} FROM invoices WHERE invoice_number = ?",
                 (invoice_number,)
             )
             row = cursor.fetchone()
             if row:
-                return {
-                    'id': row[0],
-                    'invoice_number': row[1],
-                    'supplier_name': row[2],
-                    'total_amount': row[3],
-                    'payment_status': row[4],
-                    'paid_amount': row[5],
-                    'issue_date': row[6],
-                    'due_date': row[7],
-                    'notes': row[8]
-                }
+                return Invoice._invoice_from_row(row)
             return None
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -153,23 +169,209 @@ class Invoice:
     
     @staticmethod
     def get_invoices_by_supplier(supplier_name):
-        """Get all invoices for a specific supplier"""
+        """Get all invoices for a specific supplier (cached until invoices change)
+        Returns: list of invoices, or None if the database could not be read
+        """
+        try:
+            rows = fetch_cached(f"SELECT {Invoice.COLUMNS} FROM invoices WHERE supplier_name = ? ORDER BY issue_date DESC",
+                                (supplier_name,), tables=('invoices',))
+            return [Invoice._invoice_from_row(row) for row in rows]
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+    
+    @staticmethod
+    def get_supplier_summary(supplier_name, date_from=None, date_to=None):
+        """Get the invoice count and totals of a supplier, optionally for issue dates from date_from up to
+        (not including) date_to. Unfiltered totals come from the maintained supplier balance; both are cached
+        until invoices change.
+        Returns: dictionary with invoice_count, total_amount, paid_amount and remaining_amount, or None on error
+        """
+        if date_from is None and date_to is None:
+            return SupplierBalance.get_balance(supplier_name)
+        
+        summary = {
+            'supplier_name': supplier_name,
+            'invoice_count': 0,
+            'total_amount': 0,
+            'paid_amount': 0,
+            'remaining_amount': 0
+        }
+        conditions, params = Invoice._supplier_invoice_filter(supplier_name, date_from, date_to)
+        try:
+            rows = fetch_cached(f"""
+                SELECT COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(SUM(paid_amount), 0),
+                       COALESCE(SUM(outstanding_amount), 0)
+                FROM invoices
+                WHERE {conditions}
+            """, params, tables=('invoices',))
+            summary['invoice_count'], summary['total_amount'], summary['paid_amount'], summary['remaining_amount'] = rows[0]
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+        return summary
+    
+    @staticmethod
+    def _supplier_invoice_filter(supplier_name, date_from=None, date_to=None):
+        # Half-open range on the raw column so the (supplier_name, issue_date) index is used
+        conditions = ["supplier_name = ?"]
+        params = [supplier_name]
+        if date_from is not None:
+            conditions.append("issue_date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("issue_date < ?")
+            params.append(date_to)
+        return " AND ".join(conditions), params
+    
+    @staticmethod
+    def get_supplier_invoices(supplier_name, date_from=None, date_to=None, offset=0, limit=None):
+        """Get a page of a supplier's invoices, newest first, filtered like get_supplier_summary
+        Returns: list of (invoice_number, supplier_name, total_amount, payment_status, paid_amount,
+        issue_date, outstanding_amount) tuples; every invoice if limit is None
+        """
+        conditions, params = Invoice._supplier_invoice_filter(supplier_name, date_from, date_to)
+        query = f"""
+            SELECT invoice_number, supplier_name, total_amount, payment_status,
+                   paid_amount, issue_date, outstanding_amount
+            FROM invoices
+            WHERE {conditions}
+            ORDER BY issue_date DESC, id DESC
+        """
+        if limit is not None:
+            query += " OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+            params.extend([offset, limit])
+        
+        invoices = []
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(query, params)
+            invoices = [tuple(row) for row in cur.fetchall()]
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+        finally:
+            if 'conn' in locals():
+                conn.close()
+        
+        return invoices
+    
+    @staticmethod
+    def _insert_payment(cursor, invoice_id, target_paid_sql, params, recorded_by=None, payment_method=None, notes=None):
+        """Record the difference between an invoice's paid amount and a target in invoice_payments
+        target_paid_sql is a SQL expression over the invoices row (e.g. "?" or "paid_amount + ?").
+        The target is capped at the invoice total and a payment never lowers the paid amount.
+        Returns: (amount recorded, supplier name) or (0, None) if nothing was recorded (caller commits)
+        """
+        target = f"CASE WHEN {target_paid_sql} > total_amount THEN total_amount ELSE {target_paid_sql} END"
+        cursor.execute(f"""
+            INSERT INTO invoice_payments
+                (invoice_id, supplier_name, amount, payment_date, recorded_by, payment_method, notes)
+            OUTPUT INSERTED.amount, INSERTED.supplier_name
+            SELECT id, supplier_name, {target} - COALESCE(paid_amount, 0), GETDATE(), ?, ?, ?
+            FROM invoices WITH (UPDLOCK)
+            WHERE id = ? AND {target} > COALESCE(paid_amount, 0)
+        """, (*params, *params, recorded_by, payment_method, notes, invoice_id, *params, *params))
+        row = cursor.fetchone()
+        if not row:
+            return 0, None
+        
+        amount, supplier_name = row
+        cursor.execute("UPDATE invoices SET paid_amount = COALESCE(paid_amount, 0) + ? WHERE id = ?",
+                       (amount, invoice_id))
+        SupplierBalance.apply_change(cursor, supplier_name, paid_delta=amount)
+        return amount, supplier_name
+    
+    @staticmethod
+    def update_payment_status(invoice_id, payment_status, paid_amount=None, recorded_by=None, payment_method=None):
+        """Update the payment status of an invoice
+        paid_amount is the new total paid; any increase is recorded as a payment in the ledger
+        """
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM invoices WHERE supplier_name = ? ORDER BY issue_date DESC", (supplier_name,))
+            
+            # Validate payment status
+            if payment_status not in Invoice.PAYMENT_STATUS.values():
+                return False
+            
+            recorded, supplier_name = 0, None
+            if paid_amount is not None:
+                recorded, supplier_name = Invoice._insert_payment(cursor, invoice_id, "?", (paid_amount,),
+                                                                  recorded_by, payment_method)
+            
+            sql = "UPDATE invoices SET payment_status = ? WHERE id = ?"
+            cursor.execute(sql, (payment_status, invoice_id))
+            updated = cursor.rowcount > 0
+            
+            conn.commit()
+            invalidate_tables('invoices', 'invoice_payments', 'supplier_balances')
+            if updated:
+                event_bus.publish(PaymentRecorded(invoice_id, supplier_name, recorded))
+            return updated
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return False
+        finally:
+            if 'conn' in locals():
+                conn.close()
+    
+    @staticmethod
+    def record_payment(invoice_id, amount, payment_status=None, recorded_by=None, payment_method=None, notes=None):
+        """Record an additional payment against an invoice
+        Returns: The amount actually recorded (capped at the remaining balance) or None on error
+        """
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            
+            if payment_status is not None and payment_status not in Invoice.PAYMENT_STATUS.values():
+                return None
+            
+            recorded, supplier_name = Invoice._insert_payment(cursor, invoice_id, "COALESCE(paid_amount, 0) + ?",
+                                                              (amount,), recorded_by, payment_method, notes)
+            if payment_status is not None:
+                cursor.execute("UPDATE invoices SET payment_status = ? WHERE id = ?", (payment_status, invoice_id))
+            
+            conn.commit()
+            invalidate_tables('invoices', 'invoice_payments', 'supplier_balances')
+            if recorded or payment_status is not None:
+                event_bus.publish(PaymentRecorded(invoice_id, supplier_name, recorded))
+            return recorded
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+        finally:
+            if 'conn' in locals():
+                conn.close()
+    
+    @staticmethod
+    def get_unpaid_invoices(supplier_name=None):
+        """Get invoices with an outstanding balance, largest balance first
+        Served from the outstanding_amount index instead of scanning every invoice
+        """
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            query = """
+                SELECT id, invoice_number, supplier_name, issue_date, outstanding_amount
+                FROM invoices
+                WHERE outstanding_amount > 0
+            """
+            params = []
+            if supplier_name:
+                query += " AND supplier_name = ?"
+                params.append(supplier_name)
+            query += " ORDER BY outstanding_amount DESC"
+            cursor.execute(query, params)
             invoices = []
             for row in cursor.fetchall():
                 invoices.append({
                     'id': row[0],
                     'invoice_number': row[1],
                     'supplier_name': row[2],
-                    'total_amount': row[3],
-                    'payment_status': row[4],
-                    'paid_amount': row[5],
-                    'issue_date': row[6],
-                    'due_date': row[7],
-                    'notes': row[8]
+                    'issue_date': row[3],
+                    'outstanding_amount': row[4]
                 })
             return invoices
         except pyodbc.Error as e:
@@ -180,55 +382,140 @@ class Invoice:
                 conn.close()
     
     @staticmethod
-    def update_payment_status(invoice_id, payment_status, paid_amount=None):
-        """Update the payment status of an invoice"""
+    def get_outstanding_by_supplier():
+        """Get what is still owed to each supplier: list of (supplier name, unpaid invoice count, amount)"""
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            
-            # Validate payment status
-            if payment_status not in Invoice.PAYMENT_STATUS.values():
-                return False
-            
-            if paid_amount is not None:
-                # Get current invoice data to check existing paid amount and total amount
-                cursor.execute("SELECT paid_amount, total_amount FROM invoices WHERE id = ?", (invoice_id,))
-                row = cursor.fetchone()
-                if not row:
-                    return False
-                
-                current_paid, total_amount = row
-                
-                # If new paid amount is less than current, keep the current amount
-                # This prevents decreasing the already paid amount
-                if paid_amount < current_paid:
-                    paid_amount = current_paid
-                
-                # Ensure paid amount doesn't exceed total amount
-                if paid_amount > total_amount:
-                    paid_amount = total_amount
-                
-                sql = "UPDATE invoices SET payment_status = ?, paid_amount = ? WHERE id = ?"
-                cursor.execute(sql, (payment_status, paid_amount, invoice_id))
-            else:
-                sql = "UPDATE invoices SET payment_status = ? WHERE id = ?"
-                cursor.execute(sql, (payment_status, invoice_id))
-            
-            conn.commit()
-            return cursor.rowcount > 0
+            cursor.execute("""
+                SELECT supplier_name, COUNT(*), SUM(outstanding_amount)
+                FROM invoices
+                WHERE outstanding_amount > 0
+                GROUP BY supplier_name
+                ORDER BY SUM(outstanding_amount) DESC
+            """)
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
         except pyodbc.Error as e:
             print(f"Database error: {e}")
-            return False
+            return []
+        finally:
+            if 'conn' in locals():
+                conn.close()
+    
+    @staticmethod
+    def get_changed_since(token=None):
+        """Get the invoices added or changed since a change token (all invoices if token is None)
+        Returns: (changed invoice dictionaries, deleted invoice IDs, new token), or None on error
+        """
+        try:
+            rows, deleted_ids, new_token = ChangeTracking.fetch_changes('invoices', Invoice.COLUMNS, token)
+            return [Invoice._invoice_from_row(row) for row in rows], deleted_ids, new_token
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+    
+    @staticmethod
+    def get_payments(invoice_id):
+        """Get the payment history of an invoice, oldest first"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, amount, payment_date, recorded_by, payment_method, notes
+                FROM invoice_payments
+                WHERE invoice_id = ?
+                ORDER BY payment_date, id
+            """, (invoice_id,))
+            payments = []
+            for row in cursor.fetchall():
+                payments.append({
+                    'id': row[0],
+                    'amount': row[1],
+                    'payment_date': row[2],
+                    'recorded_by': row[3],
+                    'payment_method': row[4],
+                    'notes': row[5]
+                })
+            return payments
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return []
+        finally:
+            if 'conn' in locals():
+                conn.close()
+    
+    @staticmethod
+    def get_supplier_payment_statement(supplier_name, from_date=None, to_date=None):
+        """Get all payments made to a supplier, newest first, optionally within [from_date, to_date)"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            query = """
+                SELECT p.id, p.invoice_id, i.invoice_number, p.amount, p.payment_date,
+                       p.recorded_by, p.payment_method
+                FROM invoice_payments p
+                INNER JOIN invoices i ON i.id = p.invoice_id
+                WHERE p.supplier_name = ?
+            """
+            params = [supplier_name]
+            if from_date is not None:
+                query += " AND p.payment_date >= ?"
+                params.append(from_date)
+            if to_date is not None:
+                query += " AND p.payment_date < ?"
+                params.append(to_date)
+            query += " ORDER BY p.payment_date DESC, p.id DESC"
+            cursor.execute(query, params)
+            payments = []
+            for row in cursor.fetchall():
+                payments.append({
+                    'id': row[0],
+                    'invoice_id': row[1],
+                    'invoice_number': row[2],
+                    'amount': row[3],
+                    'payment_date': row[4],
+                    'recorded_by': row[5],
+                    'payment_method': row[6]
+                })
+            return payments
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return []
+        finally:
+            if 'conn' in locals():
+                conn.close()
+    
+    @staticmethod
+    def get_daily_payment_totals(from_date, to_date):
+        """Get the total paid out per day within [from_date, to_date)
+        Returns: List of (date, payment count, total amount) tuples
+        """
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT CAST(payment_date AS DATE) AS payment_day, COUNT(*), SUM(amount)
+                FROM invoice_payments
+                WHERE payment_date >= ? AND payment_date < ?
+                GROUP BY CAST(payment_date AS DATE)
+                ORDER BY payment_day
+            """, (from_date, to_date))
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return []
         finally:
             if 'conn' in locals():
                 conn.close()
     
     @staticmethod
     def get_all_suppliers():
-        """Get a list of all suppliers from the suppliers table"""
+        """Get a list of all suppliers from the suppliers table
+        Returns: list of supplier names, or None if the database could not be read
+        """
         try:
             from models.supplier import Supplier
-            return Supplier.get_supplier_names()
+            return [record['supplier_name'] for record in Supplier.read_all_suppliers()]
         except Exception as e:
             print(f"Database error: {e}")
-            return []
\ No newline at end of file
+            return None
\ No newline at end of file
@@ -1,9 +1,28 @@
 import pyodbc
-from datetime import datetime
-from database import get_db_connection
+from datetime import date, datetime
+from database import get_db_connection, invalidate_tables
 from models.invoice import Invoice
+from models.product_stock import ProductStock
+from models.supplier_balance import SupplierBalance
+from models.name_index import NameIndex
+from models.change_tracking import ChangeTracking
+from utils.arabic_utils import normalize_arabic
+from utils.event_bus import event_bus, ItemAdded
 
 class Item:
+    # Column list for explicit item queries, in _item_from_row order
+    COLUMNS = "id, item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added"
+    # SQL Server accepts at most 2100 parameters per statement
+    MAX_IDS_PER_QUERY = 1000
+    # ORDER BY clauses for query_items; id breaks ties so pages never overlap
+    SORTS = {
+        'name': "name_normalized, id",
+        'quantity_asc': "quantity, id",
+        'quantity_desc': "quantity DESC, id",
+        'date_desc': "date_added DESC, id DESC",
+        'date_asc': "date_added, id",
+    }
+    
     def __init__(self, id=None, item_name="", quantity=0, quantity_type="unit", price_per_unit=0.0, 
                  invoice_number="", supplier_name="", date_added=None):
         self.id = id
@@ -13,7 +32,26 @@ class Item:
         self.price_per_unit = price_per_unit
         self.invoice_number = invoice_number
         self.supplier_name = supplier_name
-        self.date_added = date_added if date_added else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.date_added = date_added if date_added else datetime.now()
+
+    def to_row(self):
+        """Get the item's values in Item.COLUMNS order (the inverse of _item_from_row)"""
+        return [self.id, self.item_name, self.quantity, self.quantity_type, self.price_per_unit,
+                self.invoice_number, self.supplier_name, self.date_added]
+
+    @staticmethod
+    def _item_from_row(row):
+        """Build an Item from a row selected with Item.COLUMNS"""
+        return Item(
+            id=row[0],
+            item_name=row[1],
+            quantity=int(row[2]) if row[2] is not None and str(row[2]).isdigit() else 0,
+            quantity_type=row[3] if row[3] else "unit",
+            price_per_unit=float(row[4]) if row[4] is not None else 0.0,
+            invoice_number=row[5],
+            supplier_name=row[6],
+            date_added=row[7]
+        )
 
     @staticmethod
     def add_item(item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name=None, payment_status=None):
@@ -21,33 +59,15 @@ class Item:
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            date_added = datetime.now().strftime('%Y-%m-%d')
-            
-            # Insert item
-            sql = '''INSERT INTO items
-                    (item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)'''
+            date_added = datetime.now()
             
-            print(f"Executing SQL: {sql}")
-            cursor.execute(sql, (item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added))
-            
-            # Get the last inserted ID
-            cursor.execute("SELECT SCOPE_IDENTITY()")
-            result = cursor.fetchone()
-            if result and result[0] is not None:
-                item_id = int(result[0])
-                print(f"Inserted item ID: {item_id}")
-            else:
-                # Fallback: get the max ID from items table
-                cursor.execute("SELECT MAX(id) FROM items WHERE item_name = ? AND invoice_number = ?", 
-                             (item_name, invoice_number))
-                result = cursor.fetchone()
-                item_id = int(result[0]) if result and result[0] is not None else 1
-                print(f"Fallback item ID: {item_id}")
-
+            # Insert item and roll it into the product aggregate
+            item_id = Item.insert_lot(cursor, item_name, quantity, quantity_type, price_per_unit,
+                                      invoice_number, supplier_name, date_added)
+            print(f"Inserted item ID: {item_id}")
             
             # Check if invoice exists
-            cursor.execute("SELECT id, total_amount FROM invoices WHERE invoice_number = ?", (invoice_number,))
+            cursor.execute("SELECT id, total_amount, supplier_name FROM invoices WITH (UPDLOCK) WHERE invoice_number = ?", (invoice_number,))
             invoice = cursor.fetchone()
             
             total_amount = quantity * price_per_unit
@@ -58,18 +78,20 @@ class Item:
             
             if invoice:
                 # Update existing invoice
-                invoice_id, current_total = invoice
+                invoice_id, current_total, supplier_name = invoice
                 new_total = current_total + total_amount
                 cursor.execute("UPDATE invoices SET total_amount = ? WHERE id = ?", (new_total, invoice_id))
+                SupplierBalance.apply_change(cursor, supplier_name, total_delta=total_amount)
             else:
                 # Create new invoice within the same transaction
                 # Instead of calling Invoice.add_invoice which opens a new connection,
                 # we'll insert the invoice directly here
-                issue_date = datetime.now().strftime('%Y-%m-%d')
+                issue_date = date.today()
                 
                 # Validate payment status
                 if payment_status not in Invoice.PAYMENT_STATUS.values():
                     payment_status = Invoice.PAYMENT_STATUS['DELAYED']
+                supplier_name = supplier_name or "Unknown"
                 
                 # Insert invoice
                 invoice_sql = '''INSERT INTO invoices
@@ -78,7 +100,7 @@ class Item:
                 
                 cursor.execute(invoice_sql, (
                     invoice_number, 
-                    supplier_name or "Unknown", 
+                    supplier_name, 
                     total_amount, 
                     payment_status, 
                     0, # Default paid_amount
@@ -95,8 +117,12 @@ class Item:
                     cursor.execute("SELECT MAX(id) FROM invoices WHERE invoice_number = ?", (invoice_number,))
                     result = cursor.fetchone()
                     invoice_id = int(result[0]) if result and result[0] is not None else 1
+                
+                SupplierBalance.apply_change(cursor, supplier_name, 1, total_amount, 0)
             
             conn.commit()
+            invalidate_tables('items', 'product_stock', 'item_name_trigrams', 'invoices', 'supplier_balances')
+            event_bus.publish(ItemAdded(invoice_number, supplier_name, (item_id,)))
             return item_id
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -106,9 +132,78 @@ class Item:
             if conn:
                 conn.close()
 
+    @staticmethod
+    def insert_lot(cursor, item_name, quantity, quantity_type, price_per_unit, invoice_number,
+                   supplier_name=None, date_added=None):
+        """Insert a single lot row and update the product aggregate and name index (caller commits)
+        Returns: The new item ID
+        """
+        if date_added is None:
+            date_added = datetime.now()
+        
+        name_normalized = normalize_arabic(item_name)
+        # items has a delete-tracking trigger, so OUTPUT must go INTO a table variable
+        cursor.execute('''SET NOCOUNT ON;
+                DECLARE @ids TABLE (id INT);
+                INSERT INTO items
+                (item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added,
+                 name_normalized)
+                OUTPUT INSERTED.id INTO @ids
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+                SELECT id FROM @ids;''',
+            (item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added,
+             name_normalized))
+        item_id = int(cursor.fetchone()[0])
+        
+        ProductStock.apply_receipt(cursor, item_name, quantity_type, quantity, price_per_unit)
+        NameIndex.add_name(cursor, name_normalized)
+        return item_id
+
+    @staticmethod
+    def add_items_to_invoice(invoice_number, supplier_name, items_list):
+        """Add several lots to an invoice that already exists
+        items_list: List of dictionaries with 'item_name', 'quantity', 'quantity_type' and 'price_per_unit' keys
+        Returns: (number of items added, list of item names that failed)
+        """
+        added_ids = []
+        failed_items = []
+        processed = 0
+        
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            date_added = datetime.now()
+            
+            for item in items_list:
+                try:
+                    item_id = Item.insert_lot(cursor, item['item_name'], item['quantity'], item['quantity_type'],
+                                              item['price_per_unit'], invoice_number, supplier_name, date_added)
+                    conn.commit()
+                    invalidate_tables('items', 'product_stock', 'item_name_trigrams')
+                    added_ids.append(item_id)
+                except pyodbc.Error as e:
+                    print(f"Failed to add item {item['item_name']}: {e}")
+                    conn.rollback()
+                    failed_items.append(item['item_name'])
+                processed += 1
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            failed_items.extend(item['item_name'] for item in items_list[processed:])
+        finally:
+            if 'conn' in locals():
+                conn.close()
+        
+        if added_ids:
+            event_bus.publish(ItemAdded(invoice_number, supplier_name, tuple(added_ids)))
+        return len(added_ids), failed_items
+
     @staticmethod
     def get_all_items():
-        """Get all items from the database"""
+        """Get all items from the database
+        Not cached: the full table would crowd every other result out of the query cache, and the
+        stock view keeps its own copy current with get_changed_since deltas
+        Returns: list of Items, or None if the database could not be read
+        """
         items = []
         
         try:
@@ -144,6 +239,7 @@ class Item:
                 items.append(item)
         except pyodbc.Error as e:
             print(f"Database error: {e}")
+            return None
         finally:
             if 'conn' in locals():
                 conn.close()
@@ -151,57 +247,64 @@ class Item:
         return items
 
     @staticmethod
-    def get_item_by_id(item_id):
-        """Get an item by its ID"""
+    def get_item_by_id(item_id, identity_map=None):
+        """Get an item by its ID (see get_items_by_ids for identity_map)"""
+        return Item.get_items_by_ids([item_id], identity_map).get(item_id)
+
+    @staticmethod
+    def get_items_by_ids(item_ids, identity_map=None):
+        """Get several items with one query per MAX_IDS_PER_QUERY IDs
+        identity_map: Optional dictionary of item ID -> Item shared by the lookups of one operation;
+        items already in it are not read again and the ones read are added to it
+        Returns: Dictionary of item ID -> Item; IDs that do not exist are left out
+        """
+        items = {}
+        missing_ids = []
+        for item_id in dict.fromkeys(item_ids):
+            if identity_map is not None and item_id in identity_map:
+                items[item_id] = identity_map[item_id]
+            else:
+                missing_ids.append(item_id)
+        if not missing_ids:
+            return items
+        
         try:
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("SELECT * FROM items WHERE id = ?", (item_id,))
-            row = cur.fetchone()
-            
-            if row:
-                # Handle both old and new table structure
-                if len(row) >= 8:  # New structure with quantity_type
-                    item = Item(
-                        id=row[0],
-                        item_name=row[1],
-                        quantity=int(row[2]) if row[2] is not None and str(row[2]).isdigit() else 0,
-                        quantity_type=row[3] if row[3] else "unit",
-                        price_per_unit=float(row[4]) if row[4] is not None else 0.0,
-                        invoice_number=row[5],
-                        supplier_name=row[6],
-                        date_added=row[7]
-                    )
-                else:  # Old structure without quantity_type
-                    item = Item(
-                        id=row[0],
-                        item_name=row[1],
-                        quantity=int(row[2]) if row[2] is not None and str(row[2]).isdigit() else 0,
-                        quantity_type="unit",
-                        price_per_unit=float(row[3]) if row[3] is not None else 0.0,
-                        invoice_number=row[4],
-                        supplier_name=row[5],
-                        date_added=row[6]
-                    )
-                return item
+            for start in range(0, len(missing_ids), Item.MAX_IDS_PER_QUERY):
+                chunk = missing_ids[start:start + Item.MAX_IDS_PER_QUERY]
+                placeholders = ", ".join("?" for _ in chunk)
+                cur.execute(f"SELECT {Item.COLUMNS} FROM items WHERE id IN ({placeholders})", chunk)
+                for row in cur.fetchall():
+                    item = Item._item_from_row(row)
+                    items[item.id] = item
+                    if identity_map is not None:
+                        identity_map[item.id] = item
         except pyodbc.Error as e:
             print(f"Database error: {e}")
         finally:
             if 'conn' in locals():
                 conn.close()
         
-        return None
+        return items
 
     @staticmethod
     def update_quantity(item_id, new_quantity):
         """Update the quantity of an item"""
         try:
             conn = get_db_connection()
-            sql = '''UPDATE items SET quantity = ? WHERE id = ?'''
             cur = conn.cursor()
-            cur.execute(sql, (new_quantity, item_id))
+            cur.execute("SELECT quantity FROM items WITH (UPDLOCK) WHERE id = ?", (item_id,))
+            row = cur.fetchone()
+            if not row:
+                return False
+            
+            cur.execute("UPDATE items SET quantity = ? WHERE id = ?", (new_quantity, item_id))
+            updated = cur.rowcount > 0
+            ProductStock.apply_quantity_change(cur, item_id, row[0], new_quantity)
             conn.commit()
-            return cur.rowcount > 0
+            invalidate_tables('items', 'product_stock')
+            return updated
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return False
@@ -210,41 +313,29 @@ class Item:
                 conn.close()
 
     @staticmethod
-    def search_items(search_term):
-        """Search for items by name"""
+    def search_items(search_term, in_stock_only=False):
+        """Search for items by name, best matches first
+        Arabic spelling variants match each other; exact, prefix and word-prefix matches rank above infix ones.
+        """
         items = []
+        search = NameIndex.build_search(search_term)
+        if search is None:
+            return Item.get_all_items() or []
+        where_sql, where_params, rank_sql, rank_params = search
         
         try:
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("SELECT * FROM items WHERE item_name LIKE ?", (f'%{search_term}%',))
-            rows = cur.fetchall()
-            
-            for row in rows:
-                # Handle both old and new table structure
-                if len(row) >= 8:  # New structure with quantity_type
-                    item = Item(
-                        id=row[0],
-                        item_name=row[1],
-                        quantity=int(row[2]) if row[2] is not None and str(row[2]).isdigit() else 0,
-                        quantity_type=row[3] if row[3] else "unit",
-                        price_per_unit=float(row[4]) if row[4] is not None else 0.0,
-                        invoice_number=row[5],
-                        supplier_name=row[6],
-                        date_added=row[7]
-                    )
-                else:  # Old structure without quantity_type
-                    item = Item(
-                        id=row[0],
-                        item_name=row[1],
-                        quantity=int(row[2]) if row[2] is not None and str(row[2]).isdigit() else 0,
-                        quantity_type="unit",
-                        price_per_unit=float(row[3]) if row[3] is not None else 0.0,
-                        invoice_number=row[4],
-                        supplier_name=row[5],
-                        date_added=row[6]
-                    )
-                items.append(item)
+            query = f"""
+                SELECT {Item.COLUMNS}
+                FROM items
+                WHERE {where_sql}
+            """
+            if in_stock_only:
+                query += " AND quantity > 0"
+            query += f" ORDER BY {rank_sql}, item_name, id"
+            cur.execute(query, [*where_params, *rank_params])
+            items = [Item._item_from_row(row) for row in cur.fetchall()]
         except pyodbc.Error as e:
             print(f"Database error: {e}")
         finally:
@@ -253,6 +344,95 @@ class Item:
         
         return items
 
+    @staticmethod
+    def get_changed_since(token=None):
+        """Get the lots added or changed since a change token (all lots if token is None)
+        Returns: (changed Items, deleted item IDs, new token), or None on error so the caller can reload
+        """
+        try:
+            rows, deleted_ids, new_token = ChangeTracking.fetch_changes('items', Item.COLUMNS, token)
+            return [Item._item_from_row(row) for row in rows], deleted_ids, new_token
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    @staticmethod
+    def query_items(name=None, invoice_number=None, supplier_name=None, date_from=None, date_to=None,
+                    in_stock_only=False, sort='name', offset=0, limit=None):
+        """Filter, sort and page lots with one query
+        name: Substring of the item name (Arabic-normalized, served by the trigram index)
+        invoice_number: Substring of the invoice number
+        supplier_name: Exact supplier name
+        date_from, date_to: Range of date_added; date_to is excluded
+        sort: A key of Item.SORTS, or 'relevance' for best name matches first
+        offset, limit: Page window; limit None returns every matching lot
+        Returns: (list of Items, total number of matching lots), or ([], 0) on error
+        """
+        conditions = []
+        params = []
+        rank_sql, rank_params = None, []
+        
+        if name:
+            search = NameIndex.build_search(name)
+            if search:
+                name_sql, name_params, rank_sql, rank_params = search
+                conditions.append(name_sql)
+                params.extend(name_params)
+        if invoice_number:
+            escaped = invoice_number.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('[', '\\[')
+            # Matches anywhere like filter_by_invoice did; the scan can read the narrow invoice_number
+            # index instead of the whole table
+            conditions.append("invoice_number LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        if supplier_name:
+            conditions.append("supplier_name = ?")
+            params.append(supplier_name)
+        if date_from is not None:
+            conditions.append("date_added >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("date_added < ?")
+            params.append(date_to)
+        if in_stock_only:
+            conditions.append("quantity > 0")
+        
+        where_sql = "WHERE " + " AND ".join(conditions) if conditions else ""
+        query_params = list(params)
+        if sort == 'relevance' and rank_sql:
+            order_sql = f"{rank_sql}, name_normalized, id"
+            query_params.extend(rank_params)
+        else:
+            order_sql = Item.SORTS.get(sort, Item.SORTS['name'])
+        
+        query = f"""
+            SELECT {Item.COLUMNS}, COUNT(*) OVER () AS total_count
+            FROM items
+            {where_sql}
+            ORDER BY {order_sql}
+        """
+        if limit is not None:
+            query += " OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+            query_params.extend([offset, limit])
+        
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(query, query_params)
+            rows = cur.fetchall()
+            if rows:
+                return [Item._item_from_row(row) for row in rows], rows[0][-1]
+            if offset:
+                # Past the last page the window function has no row to report the total on
+                cur.execute(f"SELECT COUNT(*) FROM items {where_sql}", params)
+                return [], cur.fetchone()[0]
+            return [], 0
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return [], 0
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
     @staticmethod
     def filter_by_invoice(invoice_number):
         """Filter items by invoice number"""
@@ -0,0 +1,99 @@
+import pyodbc
+from database import get_db_connection, invalidate_tables
+from utils.arabic_utils import normalize_arabic, trigrams
+
+class NameIndex:
+    """Trigram index over normalized item names, kept in the item_name_trigrams table.
+
+    Each distinct normalized name is stored once with all of its trigrams, so a
+    substring search becomes a seek on the trigrams of the search term instead
+    of a LIKE '%term%' scan over every lot. add_name() takes the caller's cursor
+    so the index is written in the same transaction as the new lot.
+    """
+
+    @staticmethod
+    def add_name(cursor, name_normalized):
+        """Index a normalized name if it is not indexed yet (caller commits)"""
+        grams = trigrams(name_normalized)
+        if not grams:
+            return
+        cursor.execute("SELECT TOP 1 1 FROM item_name_trigrams WHERE name_normalized = ?", (name_normalized,))
+        if cursor.fetchone():
+            return
+        # Another terminal may be indexing the same new name; the key-range lock makes the
+        # second insert wait for the first and then skip the row instead of violating the key.
+        # Sorted so both lock the trigrams in the same order and cannot deadlock.
+        cursor.executemany("""
+            INSERT INTO item_name_trigrams (trigram, name_normalized)
+            SELECT ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM item_name_trigrams WITH (UPDLOCK, HOLDLOCK)
+                WHERE trigram = ? AND name_normalized = ?
+            )
+        """, [(gram, name_normalized, gram, name_normalized) for gram in sorted(grams)])
+
+    @staticmethod
+    def build_search(search_term, column="name_normalized"):
+        """Build a ranked search over a normalized-name column
+        Returns: (where_sql, where_params, rank_sql, rank_params), or None if the term is empty.
+        rank_sql orders exact matches first, then prefix, word-prefix and infix matches.
+        """
+        term = normalize_arabic(search_term)
+        if not term:
+            return None
+        
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('[', '\\[')
+        grams = sorted(trigrams(term))
+        if grams:
+            # Every trigram of the term must appear in the name; LIKE then confirms they are contiguous
+            placeholders = ", ".join("?" for _ in grams)
+            where_sql = f"""{column} IN (
+                    SELECT name_normalized FROM item_name_trigrams
+                    WHERE trigram IN ({placeholders})
+                    GROUP BY name_normalized
+                    HAVING COUNT(*) = ?
+                ) AND {column} LIKE ? ESCAPE '\\'"""
+            where_params = [*grams, len(grams), f'%{escaped}%']
+        else:
+            # Too short for trigrams: prefix match, which can still seek on the column index
+            where_sql = f"{column} LIKE ? ESCAPE '\\'"
+            where_params = [f'{escaped}%']
+        
+        rank_sql = f"""CASE WHEN {column} = ? THEN 0
+                    WHEN {column} LIKE ? ESCAPE '\\' THEN 1
+                    WHEN {column} LIKE ? ESCAPE '\\' THEN 2
+                    ELSE 3 END"""
+        rank_params = [term, f'{escaped}%', f'% {escaped}%']
+        return where_sql, where_params, rank_sql, rank_params
+
+    @staticmethod
+    def rebuild():
+        """Recompute normalized names and the trigram index from the items table (repair job)"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT item_name FROM items")
+            names = [row[0] for row in cursor.fetchall()]
+            
+            cursor.execute("DELETE FROM item_name_trigrams")
+            indexed = set()
+            for item_name in names:
+                name_normalized = normalize_arabic(item_name)
+                cursor.execute("UPDATE items SET name_normalized = ? WHERE item_name = ?", (name_normalized, item_name))
+                cursor.execute("UPDATE product_stock SET name_normalized = ? WHERE item_name = ?",
+                               (name_normalized, item_name))
+                if name_normalized not in indexed:
+                    NameIndex.add_name(cursor, name_normalized)
+                    indexed.add(name_normalized)
+            
+            conn.commit()
+            invalidate_tables('items', 'product_stock', 'item_name_trigrams')
+            return len(indexed)
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            if 'conn' in locals():
+                conn.rollback()
+            return None
+        finally:
+            if 'conn' in locals():
+                conn.close()
@@ -0,0 +1,153 @@
+import pyodbc
+from database import get_db_connection, fetch_cached, invalidate_tables
+from models.name_index import NameIndex
+from utils.arabic_utils import normalize_arabic
+
+class ProductStock:
+    """Per-product stock-on-hand aggregate kept in the product_stock table.
+
+    A product is an (item_name, quantity_type) pair; every lot in the items
+    table rolls up into exactly one product row. The apply_* helpers take the
+    caller's cursor so the aggregate is written in the same transaction as the
+    items change, and rebuild() recomputes everything from the items table.
+    """
+
+    @staticmethod
+    def apply_receipt(cursor, item_name, quantity_type, quantity, price_per_unit):
+        """Add a newly received lot to its product row (caller commits)"""
+        cursor.execute("""
+            MERGE product_stock WITH (HOLDLOCK) AS target
+            USING (SELECT ? AS item_name, ? AS quantity_type) AS source
+            ON target.item_name = source.item_name AND target.quantity_type = source.quantity_type
+            WHEN MATCHED THEN
+                UPDATE SET on_hand_quantity = target.on_hand_quantity + ?,
+                           lot_count = target.lot_count + ?,
+                           stock_value = target.stock_value + ?,
+                           last_updated = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (item_name, quantity_type, on_hand_quantity, lot_count, stock_value, last_updated,
+                        name_normalized)
+                VALUES (source.item_name, source.quantity_type, ?, ?, ?, GETDATE(), ?);
+        """, (item_name, quantity_type or 'unit',
+              quantity, 1 if quantity > 0 else 0, quantity * price_per_unit,
+              quantity, 1 if quantity > 0 else 0, quantity * price_per_unit, normalize_arabic(item_name)))
+
+    @staticmethod
+    def apply_quantity_change(cursor, item_id, old_quantity, new_quantity):
+        """Reflect a lot quantity change (extraction or correction) in its product row (caller commits)"""
+        delta = new_quantity - old_quantity
+        lot_delta = (1 if new_quantity > 0 else 0) - (1 if old_quantity > 0 else 0)
+        cursor.execute("""
+            UPDATE ps SET on_hand_quantity = ps.on_hand_quantity + ?,
+                          lot_count = ps.lot_count + ?,
+                          stock_value = ps.stock_value + ? * i.price_per_unit,
+                          last_updated = GETDATE()
+            FROM product_stock ps
+            INNER JOIN items i ON i.item_name = ps.item_name
+                              AND COALESCE(i.quantity_type, 'unit') = ps.quantity_type
+            WHERE i.id = ?
+        """, (delta, lot_delta, delta, item_id))
+
+    @staticmethod
+    def rebuild():
+        """Recompute the whole aggregate from the items table (repair job)"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM product_stock")
+            cursor.execute("""
+                INSERT INTO product_stock
+                    (item_name, quantity_type, on_hand_quantity, lot_count, stock_value, last_updated, name_normalized)
+                SELECT item_name, COALESCE(quantity_type, 'unit'),
+                       SUM(quantity),
+                       SUM(CASE WHEN quantity > 0 THEN 1 ELSE 0 END),
+                       SUM(quantity * price_per_unit),
+                       GETDATE(),
+                       MAX(name_normalized)
+                FROM items
+                GROUP BY item_name, COALESCE(quantity_type, 'unit')
+            """)
+            rebuilt = cursor.rowcount
+            conn.commit()
+            invalidate_tables('product_stock')
+            return rebuilt
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            if 'conn' in locals():
+                conn.rollback()
+            return None
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @staticmethod
+    def get_all_products(search_term=None, in_stock_only=False):
+        """Get the stock-on-hand rows for all products (one row per product, not per lot)
+        With a search term, products are ranked like Item.search_items; results are cached until stock changes
+        """
+        try:
+            query = """
+                SELECT item_name, quantity_type, on_hand_quantity, lot_count, stock_value, last_updated
+                FROM product_stock
+                WHERE 1 = 1
+            """
+            params = []
+            order_by = "item_name"
+            search = NameIndex.build_search(search_term) if search_term else None
+            if search:
+                where_sql, where_params, rank_sql, rank_params = search
+                query += f" AND {where_sql}"
+                params.extend(where_params)
+                order_by = f"{rank_sql}, item_name"
+            if in_stock_only:
+                query += " AND on_hand_quantity > 0"
+            query += f" ORDER BY {order_by}"
+            rows = fetch_cached(query, (*params, *(rank_params if search else [])),
+                                tables=('product_stock', 'item_name_trigrams'))
+            products = []
+            for row in rows:
+                products.append({
+                    'item_name': row[0],
+                    'quantity_type': row[1],
+                    'on_hand_quantity': row[2],
+                    'lot_count': row[3],
+                    'stock_value': row[4],
+                    'last_updated': row[5]
+                })
+            return products
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    @staticmethod
+    def get_product_stock(item_name, quantity_type=None):
+        """Get the on-hand totals for a single product; sums all quantity types if none is given"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            if quantity_type:
+                cursor.execute("""
+                    SELECT on_hand_quantity, lot_count, stock_value
+                    FROM product_stock WHERE item_name = ? AND quantity_type = ?
+                """, (item_name, quantity_type))
+            else:
+                cursor.execute("""
+                    SELECT SUM(on_hand_quantity), SUM(lot_count), SUM(stock_value)
+                    FROM product_stock WHERE item_name = ?
+                """, (item_name,))
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                return {
+                    'item_name': item_name,
+                    'quantity_type': quantity_type,
+                    'on_hand_quantity': row[0],
+                    'lot_count': row[1],
+                    'stock_value': row[2]
+                }
+            return None
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+        finally:
+            if 'conn' in locals():
+                conn.close()
@@ -1,51 +1,73 @@
+import threading
 import pyodbc
 from database import get_db_connection
+from models.table_versions import TableVersions
+from utils.event_bus import event_bus, SettingsChanged
 
 class Settings:
+    """Application settings.
+
+    All settings are read once into an in-process cache; get_setting() is
+    served from it without a database round trip and update_setting() writes
+    through to both the database and the cache. refresh() reloads the cache,
+    e.g. after another terminal changed a setting.
+    """
+    _cache = None
+    _cache_lock = threading.Lock()
+
     @staticmethod
-    def get_setting(setting_name, default_value=None):
-        """
-        Get a setting value from the database
-        Returns: The setting value or default_value if not found
-        """
+    def _convert(value, type_name):
+        """Convert a stored setting value to its Python type"""
+        if type_name == 'boolean':
+            return value.lower() == 'true' if value else False
+        elif type_name == 'integer':
+            return int(value) if value else 0
+        elif type_name == 'float':
+            return float(value) if value else 0.0
+        else:  # text or file_path
+            return value
+
+    @staticmethod
+    def _load_all():
+        """Read all settings from the database (raises pyodbc.Error)"""
+        conn = get_db_connection()
         try:
-            conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT setting_value, setting_type FROM settings WHERE setting_name = ?", 
-                (setting_name,)
-            )
-            result = cursor.fetchone()
-            
-            if result:
-                value, type_name = result
-                # Convert value based on type
-                if type_name == 'boolean':
-                    return value.lower() == 'true'
-                elif type_name == 'integer':
-                    return int(value) if value else 0
-                elif type_name == 'float':
-                    return float(value) if value else 0.0
-                else:  # text or file_path
-                    return value
-            else:
-                return default_value
-        except pyodbc.Error as e:
-            print(f"Database error while getting setting: {e}")
-            return default_value
+            cursor.execute("SELECT setting_name, setting_value, setting_type FROM settings")
+            return {name: Settings._convert(value, type_name) for name, value, type_name in cursor.fetchall()}
         finally:
             conn.close()
-    
+
+    @staticmethod
+    def _cached_settings():
+        """Get the settings cache, loading it on first use; a failed load is retried on the next call"""
+        with Settings._cache_lock:
+            if Settings._cache is None:
+                try:
+                    Settings._cache = Settings._load_all()
+                except pyodbc.Error as e:
+                    print(f"Database error while loading settings: {e}")
+                    return {}
+            return Settings._cache
+
+    @staticmethod
+    def get_setting(setting_name, default_value=None):
+        """
+        Get a setting value from the settings cache
+        Returns: The setting value or default_value if not found
+        """
+        return Settings._cached_settings().get(setting_name, default_value)
+
     @staticmethod
     def update_setting(setting_name, setting_value, setting_type='text'):
         """
-        Update a setting in the database
+        Update a setting in the database and in the settings cache
         Returns: True if successful, False otherwise
         """
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
-            
+
             # Convert value to string for storage
             if isinstance(setting_value, bool):
                 str_value = 'true' if setting_value else 'false'
@@ -63,7 +85,15 @@ class Settings:
                 VALUES (source.setting_name, source.setting_value, source.setting_type);
             """
             cursor.execute(merge_sql, (setting_name, str_value, setting_type))
+            # Lets terminals without a notification broker connection notice the change
+            TableVersions.bump(cursor, 'settings')
             conn.commit()
+
+            # Write through so the cache holds exactly what a reload would return
+            with Settings._cache_lock:
+                if Settings._cache is not None:
+                    Settings._cache[setting_name] = Settings._convert(str_value, setting_type)
+            event_bus.publish(SettingsChanged(setting_name))
             return True
         except pyodbc.Error as e:
             print(f"Database error while updating setting: {e}")
@@ -71,33 +101,32 @@ class Settings:
         finally:
             if 'conn' in locals():
                 conn.close()
-    
+
     @staticmethod
     def get_all_settings():
         """
-        Get all settings from the database
+        Get all settings from the settings cache
         Returns: Dictionary of settings or empty dict on error
         """
+        return dict(Settings._cached_settings())
+
+    @staticmethod
+    def refresh():
+        """
+        Reload the settings cache from the database
+        Returns: True if successful, False otherwise (the previous cache is kept)
+        """
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT setting_name, setting_value, setting_type FROM settings")
-            settings = {}
-            for row in cursor.fetchall():
-                name, value, type_name = row
-                # Convert value based on type
-                if type_name == 'boolean':
-                    settings[name] = value.lower() == 'true'
-                elif type_name == 'integer':
-                    settings[name] = int(value) if value else 0
-                elif type_name == 'float':
-                    settings[name] = float(value) if value else 0.0
-                else:  # text or file_path
-                    settings[name] = value
-            return settings
+            settings = Settings._load_all()
         except pyodbc.Error as e:
-            print(f"Database error while getting all settings: {e}")
-            return {}
-        finally:
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+            print(f"Database error while refreshing settings: {e}")
+            return False
+        with Settings._cache_lock:
+            Settings._cache = settings
+        return True
+
+    @staticmethod
+    def invalidate():
+        """Drop the settings cache so the next read reloads it"""
+        with Settings._cache_lock:
+            Settings._cache = None
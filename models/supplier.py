@@ -1,8 +1,19 @@
 import pyodbc
 from datetime import datetime
-from database import get_db_connection
+from database import get_db_connection, invalidate_tables
+from models.table_versions import TableVersions
+from utils.versioned_cache import VersionedCache
+from utils.event_bus import event_bus, SupplierChanged
 
 class Supplier:
+    # Fields of the supplier list (get_all_suppliers); address and notes are only read for editing
+    LIST_FIELDS = ('id', 'supplier_name', 'contact_person', 'phone', 'email', 'payment_terms', 'date_added')
+    
+    @staticmethod
+    def list_entry(supplier):
+        """Narrow a supplier dictionary to the fields of get_all_suppliers"""
+        return {field: supplier.get(field) for field in Supplier.LIST_FIELDS}
+    
     @staticmethod
     def add_supplier(supplier_name, contact_person=None, phone=None, email=None, 
                     address=None, payment_terms=None, notes=None):
@@ -21,7 +32,11 @@ class Supplier:
             
             # Get the inserted ID
             inserted_id = cursor.fetchone()[0]
+            TableVersions.bump(cursor, 'suppliers')
             conn.commit()
+            invalidate_tables('suppliers')
+            _suppliers_cache.invalidate()
+            event_bus.publish(SupplierChanged(inserted_id))
             return inserted_id
         except pyodbc.Error as e:
             print(f"Database error: {e}")
@@ -31,12 +46,16 @@ class Supplier:
                 conn.close()
     
     @staticmethod
-    def get_all_suppliers():
-        """Get all active suppliers from the database"""
+    def _fetch_active_suppliers():
+        """Read all active suppliers from the database (raises pyodbc.Error); cached by get_all_suppliers"""
+        conn = get_db_connection()
         try:
-            conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM suppliers WHERE is_active = 1 ORDER BY supplier_name")
+            # Only the listed columns; address and notes are read by get_supplier_by_id when editing
+            cursor.execute("""
+                SELECT id, supplier_name, contact_person, phone, email, payment_terms, date_added
+                FROM suppliers WHERE is_active = 1 ORDER BY supplier_name
+            """)
             suppliers = []
             for row in cursor.fetchall():
                 suppliers.append({
@@ -45,19 +64,28 @@ class Supplier:
                     'contact_person': row[2],
                     'phone': row[3],
                     'email': row[4],
-                    'address': row[5],
-                    'payment_terms': row[6],
-                    'notes': row[7],
-                    'date_added': row[8],
-                    'is_active': row[9]
+                    'payment_terms': row[5],
+                    'date_added': row[6]
                 })
             return suppliers
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def read_all_suppliers():
+        """Like get_all_suppliers, but raises pyodbc.Error instead of returning an empty list"""
+        return [dict(record) for record in _suppliers_cache.get()]
+    
+    @staticmethod
+    def get_all_suppliers():
+        """Get all active suppliers (served from the versioned reference cache)
+        Returns: list of dictionaries with id, supplier_name, contact_person, phone, email, payment_terms, date_added
+        """
+        try:
+            return Supplier.read_all_suppliers()
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
     @staticmethod
     def get_supplier_by_id(supplier_id):
@@ -103,8 +131,14 @@ class Supplier:
             
             cursor.execute(sql, (supplier_name, contact_person, phone, email,
                                 address, payment_terms, notes, supplier_id))
+            updated = cursor.rowcount > 0
+            TableVersions.bump(cursor, 'suppliers')
             conn.commit()
-            return cursor.rowcount > 0
+            invalidate_tables('suppliers')
+            _suppliers_cache.invalidate()
+            if updated:
+                event_bus.publish(SupplierChanged(supplier_id))
+            return updated
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return False
@@ -120,8 +154,14 @@ class Supplier:
             cursor = conn.cursor()
             
             cursor.execute("UPDATE suppliers SET is_active = 0 WHERE id = ?", (supplier_id,))
+            updated = cursor.rowcount > 0
+            TableVersions.bump(cursor, 'suppliers')
             conn.commit()
-            return cursor.rowcount > 0
+            invalidate_tables('suppliers')
+            _suppliers_cache.invalidate()
+            if updated:
+                event_bus.publish(SupplierChanged(supplier_id))
+            return updated
         except pyodbc.Error as e:
             print(f"Database error: {e}")
             return False
@@ -132,14 +172,11 @@ class Supplier:
     @staticmethod
     def get_supplier_names():
         """Get list of supplier names for dropdowns"""
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT supplier_name FROM suppliers WHERE is_active = 1 ORDER BY supplier_name")
-            return [row[0] for row in cursor.fetchall()]
-        except pyodbc.Error as e:
-            print(f"Database error: {e}")
-            return []
-        finally:
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+        return [record['supplier_name'] for record in Supplier.get_all_suppliers()]
+    
+    @staticmethod
+    def invalidate_cache():
+        """Drop the cached supplier list, e.g. after another terminal changed it"""
+        _suppliers_cache.invalidate()
+
+_suppliers_cache = VersionedCache(Supplier._fetch_active_suppliers, lambda: TableVersions.get('suppliers'))
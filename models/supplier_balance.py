@@ -0,0 +1,107 @@
+import pyodbc
+from database import get_db_connection, fetch_cached, invalidate_tables
+
+class SupplierBalance:
+    """Per-supplier invoice totals kept in the supplier_balances table.
+
+    apply_change() takes the caller's cursor so the balance is written in the
+    same transaction as the invoice change; rebuild() recomputes every row
+    from the invoices table.
+    """
+
+    @staticmethod
+    def apply_change(cursor, supplier_name, invoice_count_delta=0, total_delta=0, paid_delta=0):
+        """Add deltas to a supplier's balance row, creating it if needed (caller commits)"""
+        cursor.execute("""
+            MERGE supplier_balances WITH (HOLDLOCK) AS target
+            USING (SELECT ? AS supplier_name) AS source
+            ON target.supplier_name = source.supplier_name
+            WHEN MATCHED THEN
+                UPDATE SET invoice_count = target.invoice_count + ?,
+                           total_amount = target.total_amount + ?,
+                           paid_amount = target.paid_amount + ?,
+                           last_updated = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (supplier_name, invoice_count, total_amount, paid_amount, last_updated)
+                VALUES (source.supplier_name, ?, ?, ?, GETDATE());
+        """, (supplier_name,
+              invoice_count_delta, total_delta, paid_delta,
+              invoice_count_delta, total_delta, paid_delta))
+
+    @staticmethod
+    def rebuild():
+        """Recompute all supplier balances from the invoices table (repair job)"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM supplier_balances")
+            cursor.execute("""
+                INSERT INTO supplier_balances
+                    (supplier_name, invoice_count, total_amount, paid_amount, last_updated)
+                SELECT supplier_name, COUNT(*), SUM(total_amount), SUM(COALESCE(paid_amount, 0)), GETDATE()
+                FROM invoices
+                GROUP BY supplier_name
+            """)
+            rebuilt = cursor.rowcount
+            conn.commit()
+            invalidate_tables('supplier_balances')
+            return rebuilt
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            if 'conn' in locals():
+                conn.rollback()
+            return None
+        finally:
+            if 'conn' in locals():
+                conn.close()
+
+    @staticmethod
+    def get_balance(supplier_name):
+        """Get the balance of one supplier (zeros if the supplier has no invoices, None on error;
+        cached until balances change)"""
+        balance = {
+            'supplier_name': supplier_name,
+            'invoice_count': 0,
+            'total_amount': 0,
+            'paid_amount': 0,
+            'remaining_amount': 0
+        }
+        try:
+            rows = fetch_cached("""
+                SELECT invoice_count, total_amount, paid_amount
+                FROM supplier_balances WHERE supplier_name = ?
+            """, (supplier_name,), tables=('supplier_balances',))
+            if rows:
+                row = rows[0]
+                balance['invoice_count'] = row[0]
+                balance['total_amount'] = row[1]
+                balance['paid_amount'] = row[2]
+                balance['remaining_amount'] = row[1] - row[2]
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+        return balance
+
+    @staticmethod
+    def get_all_balances():
+        """Get the balances of all suppliers, largest outstanding amount first (cached until balances change)"""
+        try:
+            rows = fetch_cached("""
+                SELECT supplier_name, invoice_count, total_amount, paid_amount, last_updated
+                FROM supplier_balances
+                ORDER BY total_amount - paid_amount DESC, supplier_name
+            """, tables=('supplier_balances',))
+            balances = []
+            for row in rows:
+                balances.append({
+                    'supplier_name': row[0],
+                    'invoice_count': row[1],
+                    'total_amount': row[2],
+                    'paid_amount': row[3],
+                    'remaining_amount': row[2] - row[3],
+                    'last_updated': row[4]
+                })
+            return balances
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return []
@@ -0,0 +1,48 @@
+from database import get_db_connection
+
+class TableVersions:
+    """Per-table change counters kept in the table_versions table.
+
+    Writers call bump() with their own cursor so the counter moves in the same
+    transaction as the change; readers compare get() with the version their
+    cached copy was loaded at and refetch only when it differs.
+    """
+
+    @staticmethod
+    def bump(cursor, table_name):
+        """Increment a table's version (caller commits)"""
+        cursor.execute("""
+            MERGE table_versions WITH (HOLDLOCK) AS target
+            USING (SELECT ? AS table_name) AS source
+            ON target.table_name = source.table_name
+            WHEN MATCHED THEN
+                UPDATE SET version = target.version + 1, last_updated = SYSDATETIME()
+            WHEN NOT MATCHED THEN
+                INSERT (table_name, version, last_updated)
+                VALUES (source.table_name, 1, SYSDATETIME());
+        """, (table_name,))
+
+    @staticmethod
+    def get_many(table_names):
+        """Get the current version of several tables in one round trip (raises pyodbc.Error)
+        Returns: Dictionary of table name -> version; tables never bumped are at version 0
+        """
+        versions = {table_name: 0 for table_name in table_names}
+        if not versions:
+            return versions
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" for _ in versions)
+            cursor.execute(f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})",
+                           list(versions))
+            for table_name, version in cursor.fetchall():
+                versions[table_name] = version
+            return versions
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get(table_name):
+        """Get the current version of one table (raises pyodbc.Error)"""
+        return TableVersions.get_many([table_name])[table_name]
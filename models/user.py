@@ -1,6 +1,6 @@
 import pyodbc
 import hashlib
-from database import get_db_connection
+from database import get_db_connection, invalidate_tables
 
 class User:
     # User status constants
@@ -82,6 +82,7 @@ class User:
                 (new_password, user_id)
             )
             conn.commit()
+            invalidate_tables('users')
             return cursor.rowcount > 0
         except pyodbc.Error as e:
             print(f"Database error during password change: {e}")
@@ -147,6 +148,7 @@ class User:
                 )
             
             conn.commit()
+            invalidate_tables('users')
             return (True, "")
         except pyodbc.Error as e:
             if "UNIQUE constraint" in str(e) or "duplicate" in str(e).lower():
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Repair job that rebuilds the maintained aggregate tables from the base tables
+"""
+
+from database import create_tables
+from models.product_stock import ProductStock
+from models.supplier_balance import SupplierBalance
+from models.name_index import NameIndex
+
+def main():
+    """Rebuild all aggregate and search index tables"""
+    print("Rebuilding aggregate tables...")
+    try:
+        create_tables()
+        
+        # Normalized names first: product_stock copies them from items
+        names = NameIndex.rebuild()
+        if names is None:
+            print("Failed to rebuild item_name_trigrams")
+        else:
+            print(f"item_name_trigrams rebuilt: {names} names")
+        
+        products = ProductStock.rebuild()
+        if products is None:
+            print("Failed to rebuild product_stock")
+        else:
+            print(f"product_stock rebuilt: {products} products")
+        
+        suppliers = SupplierBalance.rebuild()
+        if suppliers is None:
+            print("Failed to rebuild supplier_balances")
+        else:
+            print(f"supplier_balances rebuilt: {suppliers} suppliers")
+    except Exception as e:
+        print(f"Error rebuilding aggregates: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,19 @@ from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
                                 QMessageBox, QDateEdit, QCheckBox)
 from PySide6.QtCore import Qt, QDate
 from PySide6.QtGui import QFont
+from datetime import datetime
 from models.supplier import Supplier
 
 class SupplierDialog(QDialog):
     def __init__(self, parent=None, supplier_data=None):
         super().__init__(parent)
-        self.supplier_data = supplier_data
         self.is_edit_mode = supplier_data is not None
+        if self.is_edit_mode:
+            # List rows carry only the listed columns; edit the full record
+            supplier_data = Supplier.get_supplier_by_id(supplier_data['id']) or supplier_data
+        self.supplier_data = supplier_data
+        # The supplier as saved, for the caller to show once the dialog is accepted
+        self.supplier = None
         self.init_ui()
         
         if self.is_edit_mode:
@@ -171,6 +177,15 @@ class SupplierDialog(QDialog):
         payment_terms = self.payment_terms_edit.text().strip() or None
         notes = self.notes_edit.toPlainText().strip() or None
         
+        # The list row of the saved supplier, built from the form instead of read back
+        saved = {
+            'supplier_name': supplier_name,
+            'contact_person': contact_person,
+            'phone': phone,
+            'email': email,
+            'payment_terms': payment_terms
+        }
+        
         try:
             if self.is_edit_mode:
                 # Update existing supplier
@@ -186,6 +201,7 @@ class SupplierDialog(QDialog):
                 )
                 if success:
                     QMessageBox.information(self, "نجح", "تم تحديث بيانات المورد بنجاح")
+                    self.supplier = Supplier.list_entry({**self.supplier_data, **saved})
                     self.accept()
                 else:
                     QMessageBox.critical(self, "خطأ", "فشل في تحديث بيانات المورد")
@@ -202,6 +218,8 @@ class SupplierDialog(QDialog):
                 )
                 if supplier_id:
                     QMessageBox.information(self, "نجح", "تم إضافة المورد بنجاح")
+                    # date_added defaults to the insert time; the list shows only its date
+                    self.supplier = Supplier.list_entry({**saved, 'id': supplier_id, 'date_added': datetime.now()})
                     self.accept()
                 else:
                     QMessageBox.critical(self, "خطأ", "فشل في إضافة المورد")
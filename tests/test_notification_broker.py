@@ -0,0 +1,83 @@
+"""
+Tests for the parts of the notification broker that need no database:
+the JSON line encoding of events and the broker relaying lines between terminals.
+Run from the repository root with ``python -m pytest tests``.
+"""
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("PySide6")
+pytest.importorskip("pyodbc")
+
+from PySide6.QtCore import QCoreApplication, QElapsedTimer
+from PySide6.QtNetwork import QHostAddress, QTcpSocket
+
+from utils.event_bus import ItemAdded, PaymentRecorded, SettingsChanged, SupplierChanged, StockExtracted
+from utils.notification_broker import NotificationBroker, decode_event, encode_event, polled_tables
+
+TIMEOUT = 5000  # ms
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+def process_events_until(app, condition):
+    """Run the event loop until condition() is true; returns False on timeout"""
+    timer = QElapsedTimer()
+    timer.start()
+    while not condition():
+        if timer.elapsed() > TIMEOUT:
+            return False
+        app.processEvents()
+    return True
+
+def test_event_round_trip():
+    event = ItemAdded("INV-7", "مورد", (3, 4))
+    assert decode_event(encode_event(event, "terminal-1").decode('utf-8')) == (event, "terminal-1")
+
+def test_decimal_is_sent_as_float():
+    event, origin = decode_event(encode_event(PaymentRecorded(5, None, Decimal("12.50")), "terminal-1"))
+    assert event == PaymentRecorded(5, None, 12.5)
+    assert isinstance(event.amount, float)
+
+def test_lists_are_decoded_as_tuples():
+    event, _ = decode_event(encode_event(StockExtracted([1, 2], 9), "terminal-1"))
+    assert event == StockExtracted((1, 2), 9)
+
+@pytest.mark.parametrize("line", ["not json", '{"event": "Unknown", "fields": {}}',
+                                  '{"event": "SupplierChanged", "fields": {"wrong": 1}}'])
+def test_unknown_lines_are_ignored(line):
+    assert decode_event(line) == (None, None)
+
+def test_polled_tables():
+    assert polled_tables(StockExtracted((), None)) == {'items', 'extractions'}
+    assert polled_tables(SupplierChanged(1)) == {'suppliers'}
+    assert polled_tables(SettingsChanged('printer')) == {'settings'}
+
+def test_broker_relays_to_the_other_terminals(app):
+    broker = NotificationBroker()
+    assert broker.listen(0, QHostAddress.LocalHost)
+    port = broker.server.serverPort()
+
+    sockets = [QTcpSocket() for _ in range(3)]
+    for socket in sockets:
+        socket.connectToHost(QHostAddress(QHostAddress.LocalHost), port)
+        assert socket.waitForConnected(TIMEOUT)
+    assert process_events_until(app, lambda: len(broker.clients) == len(sockets))
+
+    sender, *receivers = sockets
+    line = encode_event(SupplierChanged(7), "terminal-1")
+    sender.write(line)
+    assert process_events_until(app, lambda: all(socket.canReadLine() for socket in receivers))
+    for socket in receivers:
+        assert bytes(socket.readLine()) == line
+
+    # Nothing is echoed back to the terminal that sent it
+    app.processEvents()
+    assert not sender.bytesAvailable()
+
+    for socket in sockets:
+        socket.abort()
+    assert process_events_until(app, lambda: not broker.clients)
+    broker.server.close()
@@ -0,0 +1,70 @@
+from collections import namedtuple
+
+from PySide6.QtWidgets import QStyledItemDelegate, QStyle
+from PySide6.QtCore import Qt, QRect, QEvent, QModelIndex, Signal
+from PySide6.QtGui import QColor, QCursor, QPainter
+
+# key: reported by action_clicked; text: button label; color: color name, or row -> color name
+Action = namedtuple('Action', ['key', 'text', 'color'])
+
+class ActionButtonsDelegate(QStyledItemDelegate):
+    """Draws a row of buttons in a table cell and reports clicks on them.
+
+    Nothing is created per row, unlike buttons put in cells with
+    setCellWidget: the buttons are painted when the cell is painted and
+    clicks are hit-tested against the same rectangles, so a table with
+    thousands of rows costs no more than one with ten. The row is taken
+    from the model's Qt.UserRole (see RowTableModel).
+    """
+    action_clicked = Signal(str, QModelIndex)
+    MARGIN = 2
+    SPACING = 5
+
+    def __init__(self, actions, view):
+        super().__init__(view)
+        self.actions = actions
+        self.view = view
+        # The view only repaints a cell when the mouse enters or leaves it
+        view.setMouseTracking(True)
+
+    def button_rects(self, cell_rect):
+        rect = cell_rect.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        width = (rect.width() - self.SPACING * (len(self.actions) - 1)) // len(self.actions)
+        return [QRect(rect.left() + i * (width + self.SPACING), rect.top(), width, rect.height())
+                for i in range(len(self.actions))]
+
+    def paint(self, painter, option, index):
+        # Background and selection as for any other cell
+        super().paint(painter, option, index)
+
+        row = index.data(Qt.UserRole)
+        hovered = None
+        if option.state & QStyle.State_MouseOver:
+            hovered = self.view.viewport().mapFromGlobal(QCursor.pos())
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        font = painter.font()
+        font.setPixelSize(11)
+        painter.setFont(font)
+        for action, rect in zip(self.actions, self.button_rects(option.rect)):
+            color = QColor(action.color(row) if callable(action.color) else action.color)
+            if hovered is not None and rect.contains(hovered):
+                color = color.darker(115)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(color)
+            painter.drawRoundedRect(rect, 4, 4)
+            painter.setPen(Qt.white)
+            painter.drawText(rect, Qt.AlignCenter, action.text)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseMove:
+            self.view.viewport().update(option.rect)
+        elif event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            position = event.position().toPoint()
+            for action, rect in zip(self.actions, self.button_rects(option.rect)):
+                if rect.contains(position):
+                    self.action_clicked.emit(action.key, index)
+                    return True
+        return super().editorEvent(event, model, option, index)
@@ -5,14 +5,15 @@ from PySide6.QtWidgets import (QWidget, QVBoxLayout, QFormLayout, QLineEdit,
                               QGroupBox, QGridLayout, QTextEdit, QScrollArea)
 from PySide6.QtCore import Qt, QDate, Signal
 import pyodbc
-from datetime import datetime
 
 from models.item import Item
 from models.invoice import Invoice
 from models.supplier import Supplier
+from utils.event_bus import event_bus, SupplierChanged
+from ui.stale_refresh import StaleRefreshMixin
 from database import get_db_connection
 
-class AddMultipleItemsWidget(QWidget):
+class AddMultipleItemsWidget(StaleRefreshMixin, QWidget):
     # Signal to notify when items are added successfully
     items_added = Signal(str)  # Signal with invoice number
     
@@ -155,6 +156,17 @@ class AddMultipleItemsWidget(QWidget):
         
         # Load suppliers
         self.load_suppliers()
+        event_bus.subscribe(SupplierChanged, self.on_suppliers_changed)
+    
+    def on_suppliers_changed(self, event):
+        self.mark_stale('suppliers')
+    
+    def refresh_parts(self, parts):
+        current_supplier = self.supplier_combo.currentText()
+        self.load_suppliers()
+        index = self.supplier_combo.findText(current_supplier)
+        if index >= 0:
+            self.supplier_combo.setCurrentIndex(index)
     
     def load_suppliers(self):
         """Load suppliers from the suppliers table"""
@@ -297,42 +309,8 @@ class AddMultipleItemsWidget(QWidget):
                 QMessageBox.critical(self, "خطأ", "فشل في إنشاء الفاتورة")
                 return
             
-            # Add all items using a different approach
-            items_added = 0
-            failed_items = []
-            
-            for item in self.items_list:
-                try:
-                    # Add item directly to the database without creating/updating invoice
-                    # since we already created the invoice
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    date_added = datetime.now().strftime('%Y-%m-%d')
-                    
-                    # Insert item
-                    sql = '''INSERT INTO items
-                            (item_name, quantity, quantity_type, price_per_unit, invoice_number, supplier_name, date_added)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)'''
-                    
-                    cursor.execute(sql, (
-                        item['item_name'], 
-                        item['quantity'], 
-                        item['quantity_type'], 
-                        item['price_per_unit'], 
-                        invoice_number, 
-                        supplier_name, 
-                        date_added
-                    ))
-                    
-                    conn.commit()
-                    items_added += 1
-                    
-                except Exception as e:
-                    print(f"Failed to add item {item['item_name']}: {e}")
-                    failed_items.append(item['item_name'])
-                finally:
-                    if 'conn' in locals():
-                        conn.close()
+            # Add all items to the invoice we just created
+            items_added, failed_items = Item.add_items_to_invoice(invoice_number, supplier_name, self.items_list)
             
             if items_added == len(self.items_list):
                 QMessageBox.information(self, "نجح", f"تم حفظ الفاتورة بنجاح مع {items_added} منتج")
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from PySide6.QtWidgets import QLabel
+from PySide6.QtCore import QThread, Signal
+
+from utils.date_utils import format_date
+
+class BackgroundTask(QThread):
+    """Runs a function off the UI thread and delivers its return value through result_ready"""
+    result_ready = Signal(object)
+
+    def __init__(self, function, *args, parent=None):
+        super().__init__(parent)
+        self.function = function
+        self.args = args
+
+    def run(self):
+        self.result_ready.emit(self.function(*self.args))
+
+# Threads detached from closed windows, referenced until they finish so they are not destroyed while running
+_detached_threads = set()
+
+def detach_thread(thread):
+    """Let a running thread finish on its own after the window that started it has closed
+    The signals its class declares (e.g. result_ready) are disconnected so the result is dropped.
+    """
+    for name, value in vars(type(thread)).items():
+        if isinstance(value, Signal):
+            try:
+                getattr(thread, name).disconnect()
+            except (RuntimeError, TypeError):
+                pass  # nothing was connected
+    thread.setParent(None)
+    _detached_threads.add(thread)
+    thread.finished.connect(lambda: _detached_threads.discard(thread))
+
+class LastUpdatedLabel(QLabel):
+    """Shows whether a view displays saved data that is being revalidated, or fresh data"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("color: #7f8c8d; font-size: 12px;")
+        # When the data shown was read from the database (None if nothing was read yet)
+        self.read_at = None
+
+    def show_loading(self):
+        self.setText("جاري التحميل...")
+
+    def show_cached(self, saved_at):
+        self.read_at = saved_at
+        self.setText(f"بيانات محفوظة من {format_date(saved_at, with_time=True)} - جاري التحديث...")
+
+    def show_fresh(self):
+        """Call only after the data shown was read successfully"""
+        self.read_at = datetime.now()
+        self.setText(f"آخر تحديث: {format_date(self.read_at, with_time=True)}")
+
+    def show_failed(self):
+        """The database could not be read; the data shown, if any, is kept"""
+        if self.read_at is None:
+            self.setText("تعذر تحميل البيانات")
+        else:
+            self.setText(f"تعذر التحديث - بيانات من {format_date(self.read_at, with_time=True)}")
@@ -1,20 +1,62 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QFormLayout, QLineEdit, 
                               QSpinBox, QPushButton, QLabel, QMessageBox,
                               QComboBox, QTableWidget, QTableWidgetItem, 
-                              QHBoxLayout, QGroupBox, QHeaderView, QScrollArea)
-from PySide6.QtCore import Qt, Signal
+                              QHBoxLayout, QGroupBox, QHeaderView, QScrollArea, QCompleter)
+from PySide6.QtCore import Qt, Signal, QTimer, QAbstractListModel, QModelIndex
 
 from models.item import Item
 from models.extraction import Extraction
 from models.branch import Branch
+from utils.event_bus import event_bus, ItemAdded, StockExtracted, BranchChanged
+from utils.local_cache import local_cache
+from utils.arabic_utils import normalize_arabic, match_rank
+from ui.stale_refresh import StaleRefreshMixin
+from ui.background import BackgroundTask, LastUpdatedLabel
 
-class ExtractItemWidget(QWidget):
+class LotListModel(QAbstractListModel):
+    """In-stock lots for the item combo box; the item id is the Qt.UserRole data"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lots = []
+    
+    def set_items(self, items):
+        self.beginResetModel()
+        self.lots = [item for item in items if item.quantity > 0]
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lots)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.lots[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return f"{item.item_name} (#{item.id})"
+        if role == Qt.UserRole:
+            return item.id
+        return None
+
+class ExtractItemWidget(StaleRefreshMixin, QWidget):
     # Signal to notify when an extraction is completed successfully
     extraction_completed = Signal(list, str, str)  # items_list, branch_name, extracted_by
+    # Typing pause before the item list is filtered
+    SEARCH_DELAY = 150  # ms
     
     def __init__(self):
         super().__init__()
         self.items_to_extract = []  # List to store items before extraction
+        # Quantity of each item already in the list, and the item's row in it
+        self.allocated = {}
+        self.extract_rows = {}
+        # Every lot, for searching in memory (None until loaded); self.items holds the ones shown
+        self.all_items = None
+        self.normalized_names = {}
+        # Bumped by every reload of the lots; the result of an older one is dropped
+        self.items_generation = 0
+        # Bumped by every search; a database search answering an older one is dropped
+        self.search_generation = 0
         
         # Create scroll area for the widget
         scroll_area = QScrollArea()
@@ -47,12 +89,25 @@ class ExtractItemWidget(QWidget):
         item_layout = QFormLayout(item_group)
         
         # Create form fields
+        self.item_search = QLineEdit()
+        self.item_search.setPlaceholderText("ابحث عن منتج بالاسم")
+        # Lots can be picked by typing any part of their name
+        self.lot_model = LotListModel(self)
         self.item_combo = QComboBox()
+        self.item_combo.setModel(self.lot_model)
+        self.item_combo.setEditable(True)
+        self.item_combo.setInsertPolicy(QComboBox.NoInsert)
+        completer = QCompleter(self.lot_model, self.item_combo)
+        completer.setFilterMode(Qt.MatchContains)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        completer.setCompletionMode(QCompleter.PopupCompletion)
+        self.item_combo.setCompleter(completer)
         self.quantity = QSpinBox()
         self.quantity.setMinimum(1)
         self.quantity.setMaximum(10000)
         
         # Add fields to form layout
+        item_layout.addRow("بحث:", self.item_search)
         item_layout.addRow("المنتج *:", self.item_combo)
         item_layout.addRow("الكمية للاستخراج *:", self.quantity)
         
@@ -96,7 +151,10 @@ class ExtractItemWidget(QWidget):
         button_layout.addWidget(self.extract_button)
         button_layout.addWidget(self.clear_form_button)
         
+        self.last_updated_label = LastUpdatedLabel()
+        
         # Add all groups to main layout
+        layout.addWidget(self.last_updated_label)
         layout.addWidget(extraction_group)
         layout.addWidget(item_group)
         layout.addWidget(list_group)
@@ -112,127 +170,241 @@ class ExtractItemWidget(QWidget):
         self.remove_item_button.clicked.connect(self.remove_selected_item)
         self.clear_all_button.clicked.connect(self.clear_items_list)
         self.item_combo.currentIndexChanged.connect(self.update_available_quantity)
+        self.item_combo.editTextChanged.connect(self.update_available_quantity)
+        
+        # Search as the user types, once typing pauses
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.filter_items)
+        self.item_search.textChanged.connect(self.search_timer.start)
         
-        # Initialize items and branches
+        # Paint the lots and branches saved at the last exit, then reload them in the background
         self.items = []
-        self.refresh_items()
-        self.load_branches()
+        self.items_by_id = {}
+        local_cache.register('branches', self.local_cache_branches)
+        self.load_from_local_cache()
+        
+        # Reload the item and branch lists when they change
+        event_bus.subscribe(ItemAdded, self.on_items_changed)
+        event_bus.subscribe(StockExtracted, self.on_items_changed)
+        event_bus.subscribe(BranchChanged, self.on_branches_changed)
+    
+    def on_items_changed(self, event):
+        self.mark_stale('items')
+    
+    def on_branches_changed(self, event):
+        self.mark_stale('branches')
+    
+    def refresh_parts(self, parts):
+        if 'items' in parts:
+            self.refresh_items()
+        if 'branches' in parts:
+            current_branch_id = self.branch_combo.currentData()
+            self.load_branches()
+            index = self.branch_combo.findData(current_branch_id)
+            if index >= 0:
+                self.branch_combo.setCurrentIndex(index)
+    
+    def local_cache_branches(self):
+        branches = [[self.branch_combo.itemData(i), self.branch_combo.itemText(i)]
+                    for i in range(1, self.branch_combo.count())]
+        return branches or None
+    
+    def load_from_local_cache(self):
+        # The lots are saved by the stock view
+        cached_items, saved_at = local_cache.get('items')
+        cached_branches, _ = local_cache.get('branches')
+        if cached_items is not None and cached_branches is not None:
+            self.all_items = [Item._item_from_row(row) for row in cached_items['rows']]
+            self.filter_items()
+            self.populate_branches([{'id': branch_id, 'branch_name': name} for branch_id, name in cached_branches])
+            self.last_updated_label.show_cached(saved_at)
+        else:
+            self.last_updated_label.show_loading()
+        self.reload_in_background(ExtractItemWidget.fetch_lists)
+    
+    @staticmethod
+    def fetch_lists():
+        """Get all lots and branches, or (None, None) if the lots could not be read; runs in the background"""
+        items = Item.get_all_items()
+        if items is None:
+            return None, None
+        return items, Branch.get_all_branches()
+    
+    @staticmethod
+    def fetch_items():
+        """Get all lots (None on error) and no branches; runs in the background"""
+        return Item.get_all_items(), None
+    
+    def reload_in_background(self, fetch):
+        """Run fetch (fetch_lists or fetch_items) in the background and show what it read"""
+        self.items_generation += 1
+        generation = self.items_generation
+        task = BackgroundTask(fetch, parent=self)
+        task.result_ready.connect(lambda result: self.on_reloaded(generation, result))
+        task.finished.connect(task.deleteLater)
+        task.start()
+    
+    def on_reloaded(self, generation, result):
+        if generation != self.items_generation:
+            return
+        items, branches = result
+        if items is None:
+            # Keep the lots and branches shown, saved or from the last successful read
+            self.last_updated_label.show_failed()
+            return
+        self.all_items = items
+        self.filter_items()
+        if branches is not None:
+            current_branch_id = self.branch_combo.currentData()
+            self.populate_branches(branches)
+            index = self.branch_combo.findData(current_branch_id)
+            if index >= 0:
+                self.branch_combo.setCurrentIndex(index)
+        self.last_updated_label.show_fresh()
     
     def refresh_items(self):
-        # Get all items
-        self.items = Item.get_all_items()
+        # Reload every lot, then show the ones matching the search box
+        self.reload_in_background(ExtractItemWidget.fetch_items)
+    
+    def filter_items(self):
+        """Show the lots matching the search box, best matches first, or all lots
+        Searched in memory once every lot is loaded, otherwise in the database in the background.
+        """
+        self.search_timer.stop()
+        self.search_generation += 1
+        search_term = self.item_search.text().strip()
+        
+        if self.all_items is None:
+            if search_term:
+                generation = self.search_generation
+                task = BackgroundTask(Item.search_items, search_term, True, parent=self)
+                task.result_ready.connect(lambda items: self.on_search_results(generation, items))
+                task.finished.connect(task.deleteLater)
+                task.start()
+            return
+        
+        if not search_term:
+            self.populate_items(self.all_items)
+            return
         
-        # Clear and repopulate combo box
-        self.item_combo.clear()
+        term = normalize_arabic(search_term)
+        ranked = []
+        for item in self.all_items:
+            if item.quantity <= 0:
+                continue
+            normalized_name = self.normalized_names.get(item.item_name)
+            if normalized_name is None:
+                normalized_name = self.normalized_names[item.item_name] = normalize_arabic(item.item_name)
+            rank = match_rank(normalized_name, term)
+            if rank is not None:
+                ranked.append((rank, item.item_name or "", item.id, item))
+        ranked.sort(key=lambda entry: entry[:3])
+        self.populate_items([entry[3] for entry in ranked])
+    
+    def on_search_results(self, generation, items):
+        # Typing or a full load since this search started has superseded it
+        if generation == self.search_generation:
+            self.populate_items(items)
+    
+    def populate_items(self, items):
+        self.items = items
+        self.items_by_id = {item.id: item for item in items}
         
-        for item in self.items:
-            if item.quantity > 0:  # Only show items with stock
-                self.item_combo.addItem(f"{item.item_name} (#{item.id})", item.id)
+        # Only items with stock are listed
+        self.lot_model.set_items(items)
         
         # Update available quantity
         self.update_available_quantity()
     
+    def selected_item(self):
+        """Get the lot picked in the combo, or None if the typed text does not name it
+        (typing leaves the previously picked lot current until a completion is chosen)
+        """
+        index = self.item_combo.currentIndex()
+        if index < 0 or self.item_combo.currentText() != self.item_combo.itemText(index):
+            return None
+        return self.items_by_id.get(self.item_combo.itemData(index))
+    
     def update_available_quantity(self):
-        if self.item_combo.count() == 0:
+        item = self.selected_item()
+        if item is None:
             self.available_label.setText("متاح: 0")
             return
         
-        item_id = self.item_combo.currentData()
-        
-        for item in self.items:
-            if item.id == item_id:
-                # Calculate how much is already allocated in the list
-                allocated = sum(item_data['quantity'] for item_data in self.items_to_extract 
-                              if item_data['item_id'] == item_id)
-                available = item.quantity - allocated
-                self.available_label.setText(f"متاح: {available} {item.quantity_type}")
-                self.quantity.setMaximum(max(1, available))
-                break
+        # Subtract how much is already allocated in the list
+        available = item.quantity - self.allocated.get(item.id, 0)
+        self.available_label.setText(f"متاح: {available} {item.quantity_type}")
+        self.quantity.setMaximum(max(1, available))
     
     def add_item_to_list(self):
         # Validate form
-        if self.item_combo.count() == 0:
+        if not self.items_by_id:
             QMessageBox.warning(self, "خطأ في التحقق", "لا توجد منتجات متاحة للاستخراج")
             return
+        item = self.selected_item()
+        if item is None:
+            QMessageBox.warning(self, "خطأ في التحقق", "يرجى اختيار المنتج من القائمة")
+            return
         
-        item_id = self.item_combo.currentData()
         quantity = self.quantity.value()
-        
-        # Find the item details
-        item_name = ""
-        current_stock = 0
-        for item in self.items:
-            if item.id == item_id:
-                item_name = item.item_name
-                current_stock = item.quantity
-                break
-        
-        # Check if item is already in the list
-        for i, item_data in enumerate(self.items_to_extract):
-            if item_data['item_id'] == item_id:
-                # Update existing item
-                self.items_to_extract[i]['quantity'] += quantity
-                self.update_items_table()
-                self.update_available_quantity()
-                return
-        
-        # Calculate how much is already allocated
-        allocated = sum(item_data['quantity'] for item_data in self.items_to_extract 
-                       if item_data['item_id'] == item_id)
-        available = current_stock - allocated
-        
+        available = item.quantity - self.allocated.get(item.id, 0)
         if quantity > available:
             QMessageBox.warning(self, "خطأ في التحقق", f"لا يوجد مخزون كافي متاح. المتاح: {available}")
             return
         
-        # Add new item to the list
-        self.items_to_extract.append({
-            'item_id': item_id,
-            'item_name': item_name,
-            'current_stock': current_stock,
-            'quantity': quantity
-        })
-        
-        self.update_items_table()
+        self.allocated[item.id] = self.allocated.get(item.id, 0) + quantity
+        row = self.extract_rows.get(item.id)
+        if row is not None:
+            # Item is already in the list
+            self.items_to_extract[row]['quantity'] += quantity
+        else:
+            # Add new item to the list
+            row = len(self.items_to_extract)
+            self.extract_rows[item.id] = row
+            self.items_to_extract.append({
+                'item_id': item.id,
+                'item_name': item.item_name,
+                'current_stock': item.quantity,
+                'quantity': quantity
+            })
+            self.items_table.setRowCount(row + 1)
+        
+        self.set_items_table_row(row)
         self.update_available_quantity()
         self.quantity.setValue(1)  # Reset quantity
     
     def remove_selected_item(self):
         current_row = self.items_table.currentRow()
         if current_row >= 0 and current_row < len(self.items_to_extract):
-            self.items_to_extract.pop(current_row)
-            self.update_items_table()
+            item_data = self.items_to_extract.pop(current_row)
+            del self.allocated[item_data['item_id']]
+            self.items_table.removeRow(current_row)
+            self.extract_rows = {item_data['item_id']: row for row, item_data in enumerate(self.items_to_extract)}
             self.update_available_quantity()
     
     def clear_items_list(self):
         self.items_to_extract.clear()
+        self.allocated.clear()
+        self.extract_rows.clear()
         self.update_items_table()
         self.update_available_quantity()
     
     def update_items_table(self):
         self.items_table.setRowCount(len(self.items_to_extract))
-        
-        for row, item_data in enumerate(self.items_to_extract):
-            # Item name
-            name_item = QTableWidgetItem(item_data['item_name'])
-            name_item.setFlags(name_item.flags() & ~Qt.ItemIsEditable)
-            self.items_table.setItem(row, 0, name_item)
-            
-            # Current stock
-            stock_item = QTableWidgetItem(str(item_data['current_stock']))
-            stock_item.setFlags(stock_item.flags() & ~Qt.ItemIsEditable)
-            self.items_table.setItem(row, 1, stock_item)
-            
-            # Quantity to extract
-            quantity_item = QTableWidgetItem(str(item_data['quantity']))
-            quantity_item.setFlags(quantity_item.flags() & ~Qt.ItemIsEditable)
-            self.items_table.setItem(row, 2, quantity_item)
-            
-            # Remaining after extraction
-            remaining = item_data['current_stock'] - item_data['quantity']
-            remaining_item = QTableWidgetItem(str(remaining))
-            remaining_item.setFlags(remaining_item.flags() & ~Qt.ItemIsEditable)
-            self.items_table.setItem(row, 3, remaining_item)
+        for row in range(len(self.items_to_extract)):
+            self.set_items_table_row(row)
+    
+    def set_items_table_row(self, row):
+        item_data = self.items_to_extract[row]
+        remaining = item_data['current_stock'] - item_data['quantity']
+        # Item name, current stock, quantity to extract, remaining after extraction
+        for column, text in enumerate((item_data['item_name'], str(item_data['current_stock']),
+                                       str(item_data['quantity']), str(remaining))):
+            table_item = QTableWidgetItem(text)
+            table_item.setFlags(table_item.flags() & ~Qt.ItemIsEditable)
+            self.items_table.setItem(row, column, table_item)
     
     def extract_all_items(self):
         # Validate form
@@ -272,23 +444,25 @@ class ExtractItemWidget(QWidget):
             QMessageBox.information(self, "نجح", message)
             # Emit signal with extraction details for printing
             self.extraction_completed.emit(self.items_to_extract, branch_name, extracted_by)
+            # The item list is reloaded by the StockExtracted event
             self.clear_form()
-            self.refresh_items()
         else:
             QMessageBox.warning(self, "خطأ", message)
     
     def load_branches(self):
         """Load branches from the new branches table"""
         try:
-            branches = Branch.get_all_branches()
-            self.branch_combo.clear()
-            self.branch_combo.addItem("-- اختر الفرع --", None)
-            
-            for branch in branches:
-                self.branch_combo.addItem(branch['branch_name'], branch['id'])
+            self.populate_branches(Branch.get_all_branches())
         except Exception as e:
             QMessageBox.warning(self, "خطأ", f"فشل في تحميل الفروع: {e}")
     
+    def populate_branches(self, branches):
+        self.branch_combo.clear()
+        self.branch_combo.addItem("-- اختر الفرع --", None)
+        
+        for branch in branches:
+            self.branch_combo.addItem(branch['branch_name'], branch['id'])
+    
     def clear_form(self):
         self.branch_combo.setCurrentIndex(0)  # Reset to "-- اختر الفرع --"
         self.extracted_by.clear()
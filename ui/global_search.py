@@ -0,0 +1,129 @@
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QLineEdit, QCompleter
+from PySide6.QtCore import Signal, QThread, QStringListModel
+
+from models.product_stock import ProductStock
+from models.invoice import Invoice
+from models.supplier import Supplier
+from models.branch import Branch
+from utils.search_index import SearchIndex, SearchResult
+
+KIND_LABELS = {
+    'item': "منتج",
+    'invoice': "فاتورة",
+    'supplier': "مورد",
+    'branch': "فرع",
+}
+
+def item_result(item_name):
+    return SearchResult('item', item_name, item_name)
+
+def invoice_result(invoice_number, supplier_name):
+    return SearchResult('invoice', invoice_number, f"{invoice_number} - {supplier_name}")
+
+def supplier_result(supplier_name):
+    return SearchResult('supplier', supplier_name, supplier_name)
+
+def branch_result(branch_name):
+    return SearchResult('branch', branch_name, branch_name)
+
+class SearchIndexBuilder(QThread):
+    """Loads every searchable name from the database and builds a SearchIndex off the UI thread"""
+    index_built = Signal(object)  # SearchIndex
+
+    def run(self):
+        results = []
+        results.extend(item_result(name) for name in
+                       {product['item_name'] for product in ProductStock.get_all_products()})
+        results.extend(invoice_result(invoice['invoice_number'], invoice['supplier_name'])
+                       for invoice in Invoice.get_all_invoices())
+        results.extend(supplier_result(name) for name in Supplier.get_supplier_names())
+        results.extend(branch_result(name) for name in Branch.get_branch_names())
+        self.index_built.emit(SearchIndex(results))
+
+class GlobalSearchBar(QWidget):
+    """Search box that finds items, invoices, suppliers and branches as the user types"""
+    # Signal emitted when the user picks a result
+    result_activated = Signal(object)  # SearchResult
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.index = SearchIndex()
+        self.results_by_text = {}
+        # Changes made while the index is being rebuilt, replayed onto the new index
+        self.pending_updates = []
+        self.builder = None
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("بحث في المنتجات والفواتير والموردين والفروع...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setMinimumWidth(350)
+        self.search_input.setStyleSheet("""
+            QLineEdit {
+                background-color: white;
+                border: none;
+                border-radius: 15px;
+                padding: 6px 12px;
+                font-size: 14px;
+            }
+        """)
+        layout.addWidget(self.search_input)
+
+        self.results_model = QStringListModel(self)
+        self.completer = QCompleter(self.results_model, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setMaxVisibleItems(12)
+        self.search_input.setCompleter(self.completer)
+
+        self.search_input.textEdited.connect(self.update_results)
+        self.completer.activated.connect(self.on_result_activated)
+        self.search_input.returnPressed.connect(self.activate_first_result)
+
+    def rebuild_index(self):
+        """Rebuild the index from the database on a background thread"""
+        if self.builder is not None and self.builder.isRunning():
+            return
+        self.pending_updates = []
+        self.builder = SearchIndexBuilder(self)
+        self.builder.index_built.connect(self.on_index_built)
+        self.builder.start()
+
+    def on_index_built(self, index):
+        for method, args in self.pending_updates:
+            getattr(index, method)(*args)
+        self.pending_updates = []
+        self.index = index
+
+    def apply_update(self, method, *args):
+        """Apply an incremental change to the index (and to the one being built, if any)"""
+        getattr(self.index, method)(*args)
+        if self.builder is not None and self.builder.isRunning():
+            self.pending_updates.append((method, args))
+
+    def add_results(self, results):
+        for result in results:
+            self.apply_update('add', result)
+
+    def replace_kind(self, kind, results):
+        self.apply_update('replace_kind', kind, list(results))
+
+    def update_results(self, text):
+        self.results_by_text = {}
+        for result in self.index.search(text):
+            self.results_by_text[f"{KIND_LABELS[result.kind]}: {result.label}"] = result
+        self.results_model.setStringList(list(self.results_by_text))
+        if self.results_by_text:
+            self.completer.complete()
+
+    def on_result_activated(self, text):
+        result = self.results_by_text.get(text)
+        if result is None:
+            return
+        self.search_input.clear()
+        self.result_activated.emit(result)
+
+    def activate_first_result(self):
+        if self.results_model.rowCount() > 0:
+            self.on_result_activated(self.results_model.stringList()[0])
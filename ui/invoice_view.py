@@ -1,12 +1,50 @@
 from PySide6.QtWidgets import (QFrame, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
                               QComboBox, QPushButton, QLabel, QHeaderView, QMessageBox,
                               QDoubleSpinBox, QDialog, QFormLayout, QDialogButtonBox, QScrollArea,
-                              QTextEdit, QGroupBox, QGridLayout)
+                              QTextEdit, QGroupBox, QGridLayout, QTableView)
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QColor, QFont
 
 from models.invoice import Invoice
 from utils.printer_utils import print_invoice as print_invoice_util
+from utils.date_utils import format_date
+from utils.event_bus import event_bus, ItemAdded, InvoiceSaved, PaymentRecorded, SupplierChanged
+from utils.local_cache import local_cache
+from ui.stale_refresh import StaleRefreshMixin
+from ui.background import BackgroundTask, LastUpdatedLabel
+from ui.row_table_model import Column, RowTableModel
+from ui.action_delegate import Action, ActionButtonsDelegate
+
+def status_color(invoice):
+    if invoice['payment_status'] == Invoice.PAYMENT_STATUS['PAID']:
+        return QColor(200, 255, 200)  # Light green
+    if invoice['payment_status'] == Invoice.PAYMENT_STATUS['DELAYED']:
+        return QColor(255, 200, 200)  # Light red
+    return QColor(255, 255, 200)  # Light yellow (partially paid)
+
+def payment_button_color(invoice):
+    if invoice['payment_status'] == Invoice.PAYMENT_STATUS['PAID']:
+        return "#27ae60"
+    if invoice['payment_status'] == Invoice.PAYMENT_STATUS['DELAYED']:
+        return "#e74c3c"
+    return "#f39c12"
+
+# Invoice rows are Invoice.get_invoices_by_supplier dictionaries
+INVOICE_COLUMNS = [
+    Column("رقم الفاتورة", lambda invoice: invoice['invoice_number'], None),
+    Column("إجمالي المبلغ", lambda invoice: f"{invoice['total_amount']:.2f} ج.م", None),
+    Column("المبلغ المدفوع", lambda invoice: f"{invoice['paid_amount']:.2f} ج.م", None),
+    Column("المتبقي", lambda invoice: f"{invoice['outstanding_amount']:.2f} ج.م", None),
+    Column("الحالة", lambda invoice: invoice['payment_status'], None, status_color),
+    Column("تاريخ الإصدار", lambda invoice: format_date(invoice['issue_date']), None),
+    Column("الإجراءات", lambda invoice: "", None),
+]
+ACTIONS_COLUMN = 6
+INVOICE_ACTIONS = [
+    Action('details', "👁️ عرض", "#17a2b8"),
+    Action('payment', "💰 دفع", payment_button_color),
+    Action('print', "🖨️ طباعة", "#3498db"),
+]
 
 class PaymentDialog(QDialog):
     def __init__(self, invoice_id, invoice_number, total_amount, current_paid=0, current_status="", parent=None):
@@ -114,6 +152,15 @@ class PaymentDialog(QDialog):
         """)
         layout.addWidget(self.paid_amount)
         
+        # Payment method
+        method_label = QLabel("طريقة الدفع:")
+        layout.addWidget(method_label)
+        
+        self.method_combo = QComboBox()
+        for method_key, method_name in Invoice.PAYMENT_METHODS.items():
+            self.method_combo.addItem(method_name, method_key)
+        layout.addWidget(self.method_combo)
+        
         # Display total payment after this transaction
         self.total_payment_label = QLabel(f"{current_paid:.2f} ج.م")
         form_layout.addRow("إجمالي المدفوع بعد المعاملة:", self.total_payment_label)
@@ -218,7 +265,8 @@ class PaymentDialog(QDialog):
         
         return {
             'status': status,
-            'paid_amount': total_payment
+            'paid_amount': total_payment,
+            'payment_method': self.method_combo.currentData()
         }
 
 class InvoiceDetailsDialog(QDialog):
@@ -330,6 +378,11 @@ class InvoiceDetailsDialog(QDialog):
         self.setup_payment_details()
         content_layout.addWidget(self.payment_group)
         
+        # Payment history group
+        self.payments_group = QGroupBox("سجل الدفعات")
+        self.setup_payments_table()
+        content_layout.addWidget(self.payments_group)
+        
         # Items table group
         self.items_group = QGroupBox("عناصر الفاتورة")
         self.setup_items_table()
@@ -418,6 +471,23 @@ class InvoiceDetailsDialog(QDialog):
         self.payment_status_label.setProperty("class", "value")
         layout.addWidget(self.payment_status_label, 1, 3)
     
+    def setup_payments_table(self):
+        layout = QVBoxLayout(self.payments_group)
+        
+        self.payments_table = QTableWidget()
+        self.payments_table.setColumnCount(4)
+        self.payments_table.setHorizontalHeaderLabels([
+            "التاريخ", "المبلغ", "طريقة الدفع", "بواسطة"
+        ])
+        
+        header = self.payments_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Stretch)
+        self.payments_table.setAlternatingRowColors(True)
+        self.payments_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.payments_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        
+        layout.addWidget(self.payments_table)
+    
     def setup_items_table(self):
         layout = QVBoxLayout(self.items_group)
         
@@ -460,12 +530,12 @@ class InvoiceDetailsDialog(QDialog):
         # Load invoice header
         self.invoice_num_label.setText(invoice_data['invoice_number'])
         self.supplier_label.setText(invoice_data['supplier_name'])
-        self.issue_date_label.setText(str(invoice_data['issue_date']))
+        self.issue_date_label.setText(format_date(invoice_data['issue_date']))
          
         # Load payment details
         total_amount = invoice_data['total_amount']
         paid_amount = invoice_data['paid_amount']
-        remaining = total_amount - paid_amount
+        remaining = invoice_data['outstanding_amount']
         
         self.total_amount_label.setText(f"{total_amount:.2f} ج.م")
         self.paid_amount_label.setText(f"{paid_amount:.2f} ج.م")
@@ -482,12 +552,33 @@ class InvoiceDetailsDialog(QDialog):
         else:  # Partially paid
             self.payment_status_label.setStyleSheet("color: #ffc107; font-weight: bold;")
         
+        # Load payment history
+        self.load_payments_table(Invoice.get_payments(invoice_data['id']))
+        
         # Load items
         items_data = Invoice.get_items_by_invoice(self.invoice_number)
         self.load_items_table(items_data)
         
         
     
+    def load_payments_table(self, payments):
+        self.payments_table.setRowCount(len(payments))
+        
+        for row, payment in enumerate(payments):
+            self.payments_table.setItem(row, 0, QTableWidgetItem(format_date(payment['payment_date'], with_time=True)))
+            self.payments_table.setItem(row, 1, QTableWidgetItem(f"{payment['amount']:.2f} ج.م"))
+            
+            method = payment['payment_method']
+            if method == 'opening_balance':
+                method_name = "رصيد افتتاحي"
+            else:
+                method_name = Invoice.PAYMENT_METHODS.get(method, method or "")
+            self.payments_table.setItem(row, 2, QTableWidgetItem(method_name))
+            self.payments_table.setItem(row, 3, QTableWidgetItem(payment['recorded_by'] or ""))
+            
+            for col in range(4):
+                self.payments_table.item(row, col).setTextAlignment(Qt.AlignCenter)
+    
     def load_items_table(self, items_data):
         self.items_table.setRowCount(len(items_data))
         
@@ -539,12 +630,13 @@ class InvoiceDetailsDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, "خطأ في الطباعة", f"خطأ في طباعة الفاتورة: {e}")
 
-class InvoiceViewWidget(QWidget):
+class InvoiceViewWidget(StaleRefreshMixin, QWidget):
     # Signal to notify when an invoice payment is updated
     invoice_updated = Signal(str)  # invoice_number
     
-    def __init__(self):
+    def __init__(self, current_user=None):
         super().__init__()
+        self.current_user = current_user
         
         # Create layout
         layout = QVBoxLayout(self)
@@ -560,13 +652,12 @@ class InvoiceViewWidget(QWidget):
         supplier_layout.addWidget(self.refresh_button)
         supplier_layout.addStretch()
         
-        # Create table for invoices
-        self.invoice_table = QTableWidget()
-        self.invoice_table.setColumnCount(7)
-        self.invoice_table.setHorizontalHeaderLabels([
-            "رقم الفاتورة", "إجمالي المبلغ", "المبلغ المدفوع", "المتبقي", 
-            "الحالة", "تاريخ الإصدار", "الإجراءات"
-        ])
+        # Create table for invoices; the action buttons are painted by a delegate, not created per row
+        self.invoice_model = RowTableModel(INVOICE_COLUMNS, self)
+        self.invoice_table = QTableView()
+        self.invoice_table.setModel(self.invoice_model)
+        self.actions_delegate = ActionButtonsDelegate(INVOICE_ACTIONS, self.invoice_table)
+        self.invoice_table.setItemDelegateForColumn(ACTIONS_COLUMN, self.actions_delegate)
         
         # Set table properties
         header = self.invoice_table.horizontalHeader()
@@ -577,28 +668,127 @@ class InvoiceViewWidget(QWidget):
         header.setSectionResizeMode(6, QHeaderView.Fixed)
         self.invoice_table.setColumnWidth(6, 300)  # Set actions column to 250px width
         
-        self.invoice_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.invoice_table.setSelectionBehavior(QTableView.SelectRows)
         self.invoice_table.setAlternatingRowColors(True)
-        self.invoice_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.invoice_table.setEditTriggers(QTableView.NoEditTriggers)
         
         # Set default row height to make rows taller
         self.invoice_table.verticalHeader().setDefaultSectionSize(40)
         
+        self.no_invoices_label = QLabel("لا توجد فواتير. أضف منتجات مع معلومات المورد أولا.")
+        self.no_invoices_label.setAlignment(Qt.AlignCenter)
+        self.no_invoices_label.hide()
+        
+        self.last_updated_label = LastUpdatedLabel()
+        # Invoices shown in the table (saved to the local cache at exit)
+        self.invoices = []
+        
         # Add widgets to layout
         layout.addLayout(supplier_layout)
+        layout.addWidget(self.no_invoices_label)
         layout.addWidget(self.invoice_table)
+        layout.addWidget(self.last_updated_label)
         
         # Connect signals
         self.supplier_combo.currentTextChanged.connect(self.load_invoices)
         self.refresh_button.clicked.connect(self.refresh_suppliers)
-        self.invoice_table.cellDoubleClicked.connect(self.show_invoice_details)
+        self.invoice_table.doubleClicked.connect(self.show_invoice_details)
+        self.actions_delegate.action_clicked.connect(self.on_action_clicked)
+        
+        # Reload the supplier list, or the shown supplier's invoices, when they change
+        event_bus.subscribe(SupplierChanged, self.on_suppliers_changed)
+        event_bus.subscribe(ItemAdded, self.on_invoices_changed)
+        event_bus.subscribe(InvoiceSaved, self.on_invoices_changed)
+        event_bus.subscribe(PaymentRecorded, self.on_invoices_changed)
+        
+        # Paint the suppliers and invoices saved at the last exit, then revalidate in the background
+        local_cache.register('invoice_view', self.local_cache_entry)
+        self.load_from_local_cache()
+    
+    def local_cache_entry(self):
+        suppliers = [self.supplier_combo.itemText(i) for i in range(self.supplier_combo.count())]
+        if not suppliers:
+            return None
+        return {'suppliers': suppliers, 'supplier': self.supplier_combo.currentText(), 'invoices': self.invoices}
+    
+    def load_from_local_cache(self):
+        cached, saved_at = local_cache.get('invoice_view')
+        self.cached_supplier = None
+        if cached is not None:
+            self.cached_supplier = cached['supplier']
+            self.supplier_combo.blockSignals(True)
+            self.supplier_combo.addItems(cached['suppliers'])
+            self.supplier_combo.setCurrentIndex(max(self.supplier_combo.findText(self.cached_supplier), 0))
+            self.supplier_combo.blockSignals(False)
+            self.populate_invoices(cached['invoices'])
+            self.last_updated_label.show_cached(saved_at)
+        else:
+            self.last_updated_label.show_loading()
         
-        # Initialize
-        self.refresh_suppliers()
+        self.revalidate_task = BackgroundTask(InvoiceViewWidget.fetch_view_data, self.cached_supplier, parent=self)
+        self.revalidate_task.result_ready.connect(self.on_revalidated)
+        self.revalidate_task.start()
+    
+    @staticmethod
+    def fetch_view_data(supplier_name):
+        """Get the supplier list and the invoices of the given supplier (or the first one); runs in the background
+        Returns: (suppliers, supplier name, invoices), or None if the database could not be read
+        """
+        suppliers = Invoice.get_all_suppliers()
+        if suppliers is None:
+            return None
+        if supplier_name not in suppliers:
+            supplier_name = suppliers[0] if suppliers else None
+        invoices = Invoice.get_invoices_by_supplier(supplier_name) if supplier_name else []
+        if invoices is None:
+            return None
+        return suppliers, supplier_name, invoices
+    
+    def on_revalidated(self, result):
+        if result is None:
+            # Keep the saved suppliers and invoices on screen
+            self.last_updated_label.show_failed()
+            return
+        suppliers, supplier_name, invoices = result
+        current_supplier = self.supplier_combo.currentText()
+        if current_supplier and current_supplier != self.cached_supplier:
+            # The user picked another supplier meanwhile; its invoices were loaded then
+            supplier_name, invoices = current_supplier, None
+        
+        self.supplier_combo.blockSignals(True)
+        self.supplier_combo.clear()
+        self.supplier_combo.addItems(suppliers)
+        if supplier_name:
+            self.supplier_combo.setCurrentIndex(self.supplier_combo.findText(supplier_name))
+        self.supplier_combo.blockSignals(False)
+        
+        if not suppliers:
+            self.show_no_invoices_message()
+        elif invoices is not None:
+            self.populate_invoices(invoices)
+        self.last_updated_label.show_fresh()
+    
+    def on_suppliers_changed(self, event):
+        self.mark_stale('suppliers')
+    
+    def on_invoices_changed(self, event):
+        # Other suppliers' invoices are not shown; None means the supplier is unknown
+        if event.supplier_name is None or event.supplier_name == self.supplier_combo.currentText():
+            self.mark_stale('invoices')
+    
+    def refresh_parts(self, parts):
+        if 'suppliers' in parts:
+            # Reloads the invoices too when the selected supplier is no longer listed
+            self.refresh_suppliers()
+        if 'invoices' in parts:
+            self.load_invoices(self.supplier_combo.currentText())
     
     def refresh_suppliers(self):
         # Get all suppliers
         suppliers = Invoice.get_all_suppliers()
+        if suppliers is None:
+            self.last_updated_label.show_failed()
+            return
         
         # Clear and update combo box
         current_supplier = self.supplier_combo.currentText()
@@ -614,161 +804,45 @@ class InvoiceViewWidget(QWidget):
                 # Load invoices for the first supplier
                 self.load_invoices(self.supplier_combo.currentText())
         else:
-            self.invoice_table.setRowCount(0)
-            # Display a message in the table
-            self.invoice_table.setRowCount(1)
-            self.invoice_table.setColumnCount(1)
-            self.invoice_table.setHorizontalHeaderLabels(["الحالة"])
-            message_item = QTableWidgetItem("لا توجد فواتير. أضف منتجات مع معلومات المورد أولا.")
-            self.invoice_table.setItem(0, 0, message_item)
-            # Restore original headers after displaying the message
-            self.invoice_table.setColumnCount(7)
-            self.invoice_table.setHorizontalHeaderLabels([
-                "رقم الفاتورة", "إجمالي المبلغ", "المبلغ المدفوع", "المتبقي", 
-                "الحالة", "تاريخ الإصدار", "الإجراءات"
-            ])
+            self.show_no_invoices_message()
+    
+    def show_no_invoices_message(self):
+        self.invoices = []
+        self.invoice_model.set_rows([])
+        self.no_invoices_label.show()
     
     def load_invoices(self, supplier_name):
         if not supplier_name:
-            self.invoice_table.setRowCount(0)
+            self.invoices = []
+            self.invoice_model.set_rows([])
             return
         
         # Get invoices for the selected supplier
         invoices = Invoice.get_invoices_by_supplier(supplier_name)
-        
-        # Clear table
-        self.invoice_table.setRowCount(0)
-        
-        # Add invoices to table
-        for invoice in invoices:
-            row_position = self.invoice_table.rowCount()
-            self.invoice_table.insertRow(row_position)
-            
-            # Extract invoice data
-            invoice_id = invoice['id']
-            invoice_number = invoice['invoice_number']
-            total_amount = invoice['total_amount']
-            payment_status = invoice['payment_status']
-            paid_amount = invoice['paid_amount']
-            issue_date = invoice['issue_date']
-            
-            # Calculate remaining amount
-            remaining = total_amount - paid_amount
-            
-            # Create table items
-            self.invoice_table.setItem(row_position, 0, QTableWidgetItem(invoice_number))
-            self.invoice_table.setItem(row_position, 1, QTableWidgetItem(f"{total_amount:.2f} ج.م"))
-            self.invoice_table.setItem(row_position, 2, QTableWidgetItem(f"{paid_amount:.2f} ج.م"))
-            self.invoice_table.setItem(row_position, 3, QTableWidgetItem(f"{remaining:.2f} ج.م"))
-            
-            # Status with color coding
-            status_item = QTableWidgetItem(payment_status)
-            if payment_status == Invoice.PAYMENT_STATUS['PAID']:
-                status_item.setBackground(QColor(200, 255, 200))  # Light green
-            elif payment_status == Invoice.PAYMENT_STATUS['DELAYED']:
-                status_item.setBackground(QColor(255, 200, 200))  # Light red
-            else:  # Partially paid
-                status_item.setBackground(QColor(255, 255, 200))  # Light yellow
-            
-            self.invoice_table.setItem(row_position, 4, status_item)
-            self.invoice_table.setItem(row_position, 5, QTableWidgetItem(str(issue_date)))
-            
-            # Create a widget to hold all buttons
-            buttons_widget = QWidget()
-            buttons_layout = QHBoxLayout(buttons_widget)
-            buttons_layout.setContentsMargins(2, 2, 2, 2)
-            buttons_layout.setSpacing(5)
-            
-            # Add view details button
-            details_button = QPushButton("👁️ عرض")
-            details_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #17a2b8;
-                    color: white;
-                    border: none;
-                    padding: 6px;
-                    border-radius: 4px;
-                    font-size: 11px;
-                }
-                QPushButton:hover {
-                    background-color: #138496;
-                }
-            """)
-            details_button.clicked.connect(lambda checked=False, num=invoice_number: self.show_invoice_details_by_number(num))
-            
-            # Add update payment button with styling based on payment status
-            update_button = QPushButton("💰 دفع")
-            
-            # Style the update button based on payment status
-            if payment_status == Invoice.PAYMENT_STATUS['PAID']:
-                update_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #27ae60;
-                        color: white;
-                        border: none;
-                        padding: 6px;
-                        border-radius: 4px;
-                        font-size: 11px;
-                    }
-                    QPushButton:hover {
-                        background-color: #2ecc71;
-                    }
-                """)
-            elif payment_status == Invoice.PAYMENT_STATUS['DELAYED']:
-                update_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #e74c3c;
-                        color: white;
-                        border: none;
-                        padding: 6px;
-                        border-radius: 4px;
-                        font-size: 11px;
-                    }
-                    QPushButton:hover {
-                        background-color: #c0392b;
-                    }
-                """)
-            else:  # Partially paid
-                update_button.setStyleSheet("""
-                    QPushButton {
-                        background-color: #f39c12;
-                        color: white;
-                        border: none;
-                        padding: 6px;
-                        border-radius: 4px;
-                        font-size: 11px;
-                    }
-                    QPushButton:hover {
-                        background-color: #d35400;
-                    }
-                """)
-            
-            update_button.clicked.connect(lambda checked=False, id=invoice_id, num=invoice_number, 
-                                         total=total_amount, paid=paid_amount, status=payment_status: 
-                                         self.update_payment(id, num, total, paid, status))
-            
-            # Add print button with styling
-            print_button = QPushButton("🖨️ طباعة")
-            print_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #3498db;
-                    color: white;
-                    border: none;
-                    padding: 6px;
-                    border-radius: 4px;
-                    font-size: 11px;
-                }
-                QPushButton:hover {
-                    background-color: #2980b9;
-                }
-            """)
-            print_button.clicked.connect(lambda checked=False, num=invoice_number: self.print_invoice(num))
-            
-            buttons_layout.addWidget(details_button)
-            buttons_layout.addWidget(update_button)
-            buttons_layout.addWidget(print_button)
-            
-            self.invoice_table.setCellWidget(row_position, 6, buttons_widget)
+        if invoices is None:
+            self.last_updated_label.show_failed()
+            # Keep the invoices shown only if they are this supplier's
+            if any(invoice['supplier_name'] != supplier_name for invoice in self.invoices):
+                self.invoices = []
+                self.invoice_model.set_rows([])
+            return
+        self.populate_invoices(invoices)
+        self.last_updated_label.show_fresh()
+    
+    def populate_invoices(self, invoices):
+        self.invoices = invoices
+        self.no_invoices_label.hide()
+        self.invoice_model.set_rows(invoices)
+    
+    def on_action_clicked(self, action, index):
+        invoice = index.data(Qt.UserRole)
+        if action == 'details':
+            self.show_invoice_details_by_number(invoice['invoice_number'])
+        elif action == 'payment':
+            self.update_payment(invoice['id'], invoice['invoice_number'], invoice['total_amount'],
+                                invoice['paid_amount'], invoice['payment_status'])
+        elif action == 'print':
+            self.print_invoice(invoice['invoice_number'])
     
     def update_payment(self, invoice_id, invoice_number, total_amount, current_paid, payment_status=None):
         # Get current payment status if not provided
@@ -788,14 +862,16 @@ class InvoiceViewWidget(QWidget):
             success = Invoice.update_payment_status(
                 invoice_id, 
                 payment_data['status'], 
-                payment_data['paid_amount']
+                payment_data['paid_amount'],
+                recorded_by=self.current_user['username'] if self.current_user else None,
+                payment_method=payment_data['payment_method']
             )
             
             if success:
                 QMessageBox.information(self, "نجح", "تم تحديث الدفع بنجاح")
                 # Emit signal with invoice number for printing
+                # The table is reloaded by the PaymentRecorded event
                 self.invoice_updated.emit(invoice_number)
-                self.load_invoices(self.supplier_combo.currentText())
             else:
                 QMessageBox.critical(self, "خطأ", "فشل في تحديث الدفع")
         else:
@@ -819,14 +895,11 @@ class InvoiceViewWidget(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "خطأ في الطباعة", f"خطأ في طباعة الفاتورة: {e}")
     
-    def show_invoice_details(self, row, column):
+    def show_invoice_details(self, index):
         """Show invoice details when a row is double-clicked"""
-        if row < self.invoice_table.rowCount():
-            # Get invoice number from the first column
-            invoice_number_item = self.invoice_table.item(row, 0)
-            if invoice_number_item:
-                invoice_number = invoice_number_item.text()
-                self.show_invoice_details_by_number(invoice_number)
+        # Double-clicks on the action buttons are button clicks
+        if index.isValid() and index.column() != ACTIONS_COLUMN:
+            self.show_invoice_details_by_number(index.data(Qt.UserRole)['invoice_number'])
     
     def show_invoice_details_by_number(self, invoice_number):
         """Show detailed invoice dialog for the given invoice number"""
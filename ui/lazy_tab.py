@@ -0,0 +1,61 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+from PySide6.QtCore import Qt, QTimer, Signal
+
+class LazyTab(QWidget):
+    """Tab page that builds its real widget the first time it is shown.
+
+    Screens load their data in their constructors, so building every tab up
+    front makes the window wait for all of them. The placeholder paints a
+    loading message first and builds the widget on the next event loop
+    turn; widget() builds it at once for code that needs it earlier (e.g.
+    navigating to a search result, or prebuilding while the app is idle).
+    """
+    built = Signal(QWidget)
+
+    def __init__(self, factory, parent=None):
+        super().__init__(parent)
+        self.factory = factory
+        self._widget = None
+
+        self.page_layout = QVBoxLayout(self)
+        self.page_layout.setContentsMargins(0, 0, 0, 0)
+        self.loading_label = QLabel("جاري التحميل...")
+        self.loading_label.setAlignment(Qt.AlignCenter)
+        self.loading_label.setStyleSheet("color: #7f8c8d; font-size: 16px;")
+        self.page_layout.addWidget(self.loading_label)
+
+    def is_built(self):
+        return self._widget is not None
+
+    def widget(self):
+        """Get the real widget, building it if needed"""
+        if self._widget is None:
+            self._widget = self.factory()
+            self.page_layout.removeWidget(self.loading_label)
+            self.loading_label.deleteLater()
+            self.page_layout.addWidget(self._widget)
+            self.built.emit(self._widget)
+        return self._widget
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._widget is None:
+            QTimer.singleShot(0, self.widget)
+
+def prebuild_tabs(tabs, delay=500):
+    """Build the tabs that are not built yet one per event loop turn, starting after delay ms,
+    so the app stays responsive while the remaining screens are prepared
+    """
+    pending = [tab for tab in tabs if not tab.is_built()]
+
+    def build_next():
+        while pending:
+            tab = pending.pop(0)
+            if not tab.is_built():
+                tab.widget()
+                break
+        if pending:
+            QTimer.singleShot(0, build_next)
+
+    if pending:
+        QTimer.singleShot(delay, build_next)
@@ -2,29 +2,60 @@ from PySide6.QtWidgets import (QHeaderView, QMainWindow, QTableWidget, QTableWid
                               QPushButton, QHBoxLayout, QStackedWidget,
                               QMessageBox, QToolBar, QDialog, QLabel,
                               QComboBox, QSplitter, QListWidget, QListWidgetItem,
-                              QFrame, QApplication, QTabWidget, QAbstractItemView)
-from PySide6.QtCore import Qt, QSize, Signal, QTimer
+                              QFrame, QApplication, QTabWidget, QAbstractItemView,
+                              QTableView, QLineEdit, QCheckBox, QDateEdit)
+from PySide6.QtCore import Qt, QSize, Signal, QTimer, QDate, QThread, QDeadlineTimer
 from PySide6.QtGui import QIcon, QAction, QColor, QPalette, QFont, QPixmap
 import datetime
 import pyodbc
 
 from utils.resource_utils import get_image_path
+from utils.date_utils import format_date
 
 from ui.add_multiple_items import AddMultipleItemsWidget
 from ui.extract_item import ExtractItemWidget
 from ui.stock_view import StockViewWidget
 from ui.invoice_view import InvoiceViewWidget
-from models.extraction import Extraction
+from models.history import History
 from ui.settings import PrinterSettingsWidget
 # from ui.zzzpizza_main import PizzaMainWidget
 from ui.suppliers import SuppliersWidget
+from ui.lazy_tab import LazyTab, prebuild_tabs
+from ui.row_table_model import Column, RowTableModel
+from ui.background import detach_thread
+from ui.global_search import GlobalSearchBar, item_result, invoice_result, supplier_result, branch_result
 from models.settings import Settings
 from utils.printer_utils import print_invoice, show_print_dialog
 from models.invoice import Invoice
+from models.supplier import Supplier
+from models.branch import Branch
+from utils.event_bus import event_bus, SupplierChanged, BranchChanged, ItemAdded, StockExtracted
 from database import get_db_connection
  
+# History rows are History.get_history entries
+HISTORY_COLUMNS = [
+    Column("التاريخ", lambda entry: format_date(entry['date'], with_time=True), None),
+    Column("اسم المنتج", lambda entry: entry['item_name'], None),
+    Column("نوع العملية", lambda entry: "Addition" if entry['kind'] == History.ADDITION else "Extraction", None),
+    Column("الكمية", lambda entry: str(entry['quantity']), None),
+    Column("التفاصيل", lambda entry: (f"Invoice: {entry['invoice_number']}" if entry['kind'] == History.ADDITION
+                                      else f"To: {entry['branch_name']}"), None),
+]
+
+# Supplier rows are Supplier.get_all_suppliers dictionaries, keyed by id and kept in name order
+SUPPLIER_COLUMNS = [
+    Column("اسم المورد", lambda supplier: supplier['supplier_name'], None),
+    Column("الشخص المسؤول", lambda supplier: supplier['contact_person'] or '', None),
+    Column("الهاتف", lambda supplier: supplier['phone'] or '', None),
+    Column("البريد الإلكتروني", lambda supplier: supplier['email'] or '', None),
+    Column("شروط الدفع", lambda supplier: supplier['payment_terms'] or '', None),
+    Column("تاريخ الإضافة", lambda supplier: format_date(supplier['date_added']), None),
+]
 
 class MainWindow(QMainWindow):
+    # How long closing waits for background queries before leaving them to finish on their own
+    CLOSE_WAIT = 2000  # ms
+    
     def __init__(self, user_data=None):
         super().__init__()
         
@@ -128,6 +159,12 @@ class MainWindow(QMainWindow):
         header_layout.addWidget(current_date)
         header_layout.addWidget(self.current_time)
         header_layout.addStretch()
+        
+        # Global search across items, invoices, suppliers and branches
+        self.global_search = GlobalSearchBar()
+        self.global_search.result_activated.connect(self.navigate_to_search_result)
+        header_layout.addWidget(self.global_search)
+        header_layout.addStretch()
         header_layout.addWidget(invoice_label)
         
         # Pizza Melano logo with actual image on the right
@@ -195,32 +232,49 @@ class MainWindow(QMainWindow):
             }
         """)
         
-        # Create the different screens
-        self.add_item_widget = AddMultipleItemsWidget()
-        self.extract_item_widget = ExtractItemWidget()
-        self.stock_view_widget = StockViewWidget()
-        self.invoice_view_widget = InvoiceViewWidget()
+        # Create the different screens; each one is built (and loads its data) when its tab is first shown
+        self.add_item_page = LazyTab(AddMultipleItemsWidget)
+        self.extract_item_page = LazyTab(ExtractItemWidget)
+        self.stock_view_page = LazyTab(StockViewWidget)
+        self.invoice_view_page = LazyTab(lambda: InvoiceViewWidget(self.user_data))
         # self.pizza_main_widget = PizzaMainWidget()
-        self.suppliers_widget = SuppliersWidget()
-        self.settings_widget = PrinterSettingsWidget(self.user_data)
+        self.suppliers_page = LazyTab(SuppliersWidget)
+        self.settings_page = LazyTab(lambda: PrinterSettingsWidget(self.user_data))
         
         # Create management widget wrapper
-        self.management_widget = self.create_management_widget()
-        
-        # Connect print signals
-        self.add_item_widget.items_added.connect(self.handle_item_added)
-        self.extract_item_widget.extraction_completed.connect(self.handle_item_extracted)
-        self.invoice_view_widget.invoice_updated.connect(self.handle_invoice_updated)
+        self.management_page = LazyTab(self.create_management_widget)
+        self.management_stale = False
+        
+        # Operations history; reloaded when shown after stock moved
+        self.history_page = LazyTab(self.create_history_widget)
+        self.history_stale = False
+        # Ids of the suppliers changed while a supplier dialog or delete is running (None otherwise)
+        self.supplier_changes = None
+        
+        # Keep the management table and the search index in step with supplier/branch edits
+        event_bus.subscribe(SupplierChanged, self.on_suppliers_changed)
+        event_bus.subscribe(BranchChanged, self.on_branches_changed)
+        event_bus.subscribe(ItemAdded, self.on_stock_moved)
+        event_bus.subscribe(StockExtracted, self.on_stock_moved)
+        
+        # Connect print signals once the screens are built
+        self.add_item_page.built.connect(lambda widget: widget.items_added.connect(self.handle_item_added))
+        self.extract_item_page.built.connect(
+            lambda widget: widget.extraction_completed.connect(self.handle_item_extracted))
+        self.invoice_view_page.built.connect(
+            lambda widget: widget.invoice_updated.connect(self.handle_invoice_updated))
+        self.history_page.built.connect(lambda widget: self.refresh_history())
         
         # Add tabs with Arabic text
         # self.tab_widget.addTab(self.pizza_main_widget, "الطولات")  # Tables
-        self.tab_widget.addTab(self.invoice_view_widget, "الفواتير")  # Food Menu
-        self.tab_widget.addTab(self.stock_view_widget, "المخزون")  # Reports
-        self.tab_widget.addTab(self.extract_item_widget, "تصدير منتجات")  # Add Products
-        self.tab_widget.addTab(self.suppliers_widget, "الموردين")  # Suppliers
-        self.tab_widget.addTab(self.management_widget, "إدارة الموردين")  # Suppliers Management
-        self.tab_widget.addTab(self.add_item_widget, "إضافة منتجات")  # Settings
-        self.tab_widget.addTab(self.settings_widget, "إعدادات الطابعة")  # Printer Settings
+        self.tab_widget.addTab(self.invoice_view_page, "الفواتير")  # Food Menu
+        self.tab_widget.addTab(self.stock_view_page, "المخزون")  # Reports
+        self.tab_widget.addTab(self.extract_item_page, "تصدير منتجات")  # Add Products
+        self.tab_widget.addTab(self.suppliers_page, "الموردين")  # Suppliers
+        self.tab_widget.addTab(self.management_page, "إدارة الموردين")  # Suppliers Management
+        self.tab_widget.addTab(self.add_item_page, "إضافة منتجات")  # Settings
+        self.tab_widget.addTab(self.history_page, "سجل العمليات")  # History
+        self.tab_widget.addTab(self.settings_page, "إعدادات الطابعة")  # Printer Settings
         
         # Add tab widget to main layout
         main_layout.addWidget(self.tab_widget)
@@ -230,6 +284,46 @@ class MainWindow(QMainWindow):
         
         # Show pizza main view by default (الطولات)
         self.tab_widget.setCurrentIndex(0)  # Pizza main is at index 0
+        
+        # Build the global search index in the background
+        self.global_search.rebuild_index()
+        
+        # Build the other screens while the app is idle, so opening them later is instant
+        if Settings.get_setting('prebuild_tabs', True):
+            prebuild_tabs([self.tab_widget.widget(index) for index in range(self.tab_widget.count())])
+    
+    # The screens, built on first use
+    @property
+    def add_item_widget(self):
+        return self.add_item_page.widget()
+    
+    @property
+    def extract_item_widget(self):
+        return self.extract_item_page.widget()
+    
+    @property
+    def stock_view_widget(self):
+        return self.stock_view_page.widget()
+    
+    @property
+    def invoice_view_widget(self):
+        return self.invoice_view_page.widget()
+    
+    @property
+    def suppliers_widget(self):
+        return self.suppliers_page.widget()
+    
+    @property
+    def settings_widget(self):
+        return self.settings_page.widget()
+    
+    @property
+    def management_widget(self):
+        return self.management_page.widget()
+    
+    @property
+    def history_widget(self):
+        return self.history_page.widget()
     
     def apply_modern_style(self):
         """Apply modern styling to the entire application"""
@@ -455,22 +549,42 @@ class MainWindow(QMainWindow):
         pass
     
     def change_page(self, index):
-        """Change the current page based on tab selection"""
-        # Refresh data as needed
-        if index == 1:  # Food Menu (Invoice View)
-            self.invoice_view_widget.refresh_suppliers()
-        elif index == 2:  # Reports (Stock View)
-            self.stock_view_widget.refresh_items()
-        elif index == 3:  # Add Products (Extract Items)
-            self.extract_item_widget.refresh_items()
-        elif index == 4:  # Suppliers
-            pass  # No refresh needed for suppliers
-        elif index == 5:  # Suppliers Management
+        """Refresh the management or history page if its data changed while it was hidden
+        The other pages refresh themselves when shown, and only if data they display changed.
+        """
+        if self.tab_widget.widget(index) is self.management_page and self.management_stale:
+            self.management_stale = False
             self.load_management_data()
-        elif index == 6:  # Add Items
-            pass  # No refresh needed for add items
-        elif index == 7:  # Printer Settings
-            pass  # Printer settings widget handles its own refresh
+        elif self.tab_widget.widget(index) is self.history_page and self.history_stale:
+            self.history_stale = False
+            self.refresh_history()
+    
+    def on_suppliers_changed(self, event):
+        if event.supplier_id is None:
+            # Changed by another terminal while the broker was unreachable; the details are unknown
+            if self.management_page.is_built() and self.management_page.isVisible():
+                self.load_management_data()
+                return
+            # A page that is not built yet loads current data when it is
+            self.management_stale = self.management_page.is_built()
+        elif self.management_page.is_built():
+            if self.supplier_changes is not None:
+                # Most likely saved by the dialog that is open; handled when it returns
+                self.supplier_changes.add(event.supplier_id)
+            else:
+                self.refresh_supplier_row(event.supplier_id)
+        self.global_search.replace_kind('supplier', [supplier_result(name)
+                                                     for name in Supplier.get_supplier_names()])
+    
+    def on_stock_moved(self, event):
+        # New operations are read when the history is next shown; a page that is not built yet loads them anyway
+        if self.history_page.is_built() and self.history_page.isVisible():
+            self.refresh_history()
+        else:
+            self.history_stale = self.history_page.is_built()
+    
+    def on_branches_changed(self, event):
+        self.global_search.replace_kind('branch', [branch_result(name) for name in Branch.get_branch_names()])
     
     def create_history_widget(self):
         """Create the history operations widget"""
@@ -488,13 +602,40 @@ class MainWindow(QMainWindow):
         """)
         layout.addWidget(title_label)
         
-        # Create table for history
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(5)
-        self.history_table.setHorizontalHeaderLabels([
-            "التاريخ", "اسم المنتج", "نوع العملية", "الكمية", "التفاصيل"
-        ])
+        # History filters
+        filters_layout = QHBoxLayout()
+        self.history_product_filter = QLineEdit()
+        self.history_product_filter.setPlaceholderText("اسم المنتج...")
+        self.history_user_filter = QLineEdit()
+        self.history_user_filter.setPlaceholderText("مستخرج بواسطة...")
+        self.history_branch_filter = QComboBox()
+        self.history_branch_filter.addItem("كل الفروع", None)
+        for branch in Branch.get_all_branches():
+            self.history_branch_filter.addItem(branch['branch_name'], branch['id'])
+        self.history_date_filter = QCheckBox("من:")
+        self.history_date_from = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.history_date_from.setCalendarPopup(True)
+        self.history_date_to = QDateEdit(QDate.currentDate())
+        self.history_date_to.setCalendarPopup(True)
+        
+        filters_layout.addWidget(QLabel("المنتج:"))
+        filters_layout.addWidget(self.history_product_filter)
+        filters_layout.addWidget(QLabel("الفرع:"))
+        filters_layout.addWidget(self.history_branch_filter)
+        filters_layout.addWidget(QLabel("المستخدم:"))
+        filters_layout.addWidget(self.history_user_filter)
+        filters_layout.addWidget(self.history_date_filter)
+        filters_layout.addWidget(self.history_date_from)
+        filters_layout.addWidget(QLabel("إلى:"))
+        filters_layout.addWidget(self.history_date_to)
+        layout.addLayout(filters_layout)
+        
+        # Create table for history; pages are read from the database as it scrolls
+        self.history_model = RowTableModel(HISTORY_COLUMNS, widget)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.setAlternatingRowColors(True)  # Alternate row colors
+        self.history_table.setEditTriggers(QTableView.NoEditTriggers)
         
         # Set table properties
         header = self.history_table.horizontalHeader()
@@ -538,17 +679,11 @@ class MainWindow(QMainWindow):
     def print_history(self):
         """Print the history operations table"""
         try:
-            # Get all rows from the history table
+            # Print every operation matching the filters, not just the pages scrolled into view
             rows = []
-            for row in range(self.history_table.rowCount()):
-                row_data = {
-                    'date': self.history_table.item(row, 0).text(),
-                    'item_name': self.history_table.item(row, 1).text(),
-                    'operation_type': self.history_table.item(row, 2).text(),
-                    'quantity': self.history_table.item(row, 3).text(),
-                    'details': self.history_table.item(row, 4).text()
-                }
-                rows.append(row_data)
+            for entry in History.get_all_history(**self.history_filters()):
+                rows.append({column: HISTORY_COLUMNS[index].display(entry) for index, column in
+                             enumerate(('date', 'item_name', 'operation_type', 'quantity', 'details'))})
             
             if not rows:
                 QMessageBox.information(self, "لا توجد بيانات", "لا توجد بيانات تاريخ للطباعة.")
@@ -589,45 +724,59 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "خطأ في الطباعة", f"خطأ في طباعة تقرير التاريخ: {e}")
     
+    def history_filters(self):
+        """Get the History.get_history filters chosen in the history widget"""
+        filters = {
+            'product': self.history_product_filter.text().strip() or None,
+            'branch_id': self.history_branch_filter.currentData(),
+            'user': self.history_user_filter.text().strip() or None,
+        }
+        if self.history_date_filter.isChecked():
+            filters['date_from'] = self.history_date_from.date().toPython()
+            filters['date_to'] = self.history_date_to.date().addDays(1).toPython()
+        return filters
+    
     def refresh_history(self):
         """Refresh the history operations table"""
-        # Clear table
-        self.history_table.setRowCount(0)
+        filters = self.history_filters()
         
-        # Get all extractions
-        extractions = Extraction.get_all_extractions()
+        def fetch_page(offset, limit):
+            # Keyset pagination: continue after the last operation already loaded
+            after = History.page_key(self.history_model.row_at(offset - 1)) if offset else None
+            return History.get_history(after=after, limit=limit, **filters), None
         
-        # Add extractions to table
-        for extraction in extractions:
-            row_position = self.history_table.rowCount()
-            self.history_table.insertRow(row_position)
-            
-            self.history_table.setItem(row_position, 0, QTableWidgetItem(extraction['date_extracted']))
-            self.history_table.setItem(row_position, 1, QTableWidgetItem(extraction['item_name']))
-            self.history_table.setItem(row_position, 2, QTableWidgetItem("Extraction"))
-            self.history_table.setItem(row_position, 3, QTableWidgetItem(str(extraction['quantity_extracted'])))
-            self.history_table.setItem(row_position, 4, QTableWidgetItem(f"To: {extraction['branch_name']}"))
-        
-        # Get all items (additions)
-        from models.item import Item
-        items = Item.get_all_items()
-        
-        # Add items to table
-        for item in items:
-            row_position = self.history_table.rowCount()
-            self.history_table.insertRow(row_position)
-            
-            self.history_table.setItem(row_position, 0, QTableWidgetItem(item.date_added))
-            self.history_table.setItem(row_position, 1, QTableWidgetItem(item.item_name))
-            self.history_table.setItem(row_position, 2, QTableWidgetItem("Addition"))
-            self.history_table.setItem(row_position, 3, QTableWidgetItem(str(item.quantity)))
-            self.history_table.setItem(row_position, 4, QTableWidgetItem(f"Invoice: {item.invoice_number}"))
-        
-        # Sort by date (newest first)
-        self.history_table.sortItems(0, Qt.DescendingOrder)
+        self.history_model.set_page_source(fetch_page)
+    
+    def navigate_to_search_result(self, result):
+        """Open the screen that shows a global search result"""
+        if result.kind == 'item':
+            self.tab_widget.setCurrentWidget(self.stock_view_page)
+            self.stock_view_widget.search_input.setText(result.key)
+            self.stock_view_widget.apply_filters()
+        elif result.kind == 'invoice':
+            self.invoice_view_widget.show_invoice_details_by_number(result.key)
+        elif result.kind == 'supplier':
+            self.tab_widget.setCurrentWidget(self.invoice_view_page)
+            self.invoice_view_widget.supplier_combo.setCurrentText(result.key)
+        elif result.kind == 'branch':
+            self.tab_widget.setCurrentWidget(self.suppliers_page)
+            self.suppliers_widget.tab_widget.setCurrentWidget(self.suppliers_widget.branch_tab)
+            index = self.suppliers_widget.branch_combo.findText(result.key)
+            if index >= 0:
+                self.suppliers_widget.branch_combo.setCurrentIndex(index)
+    
+    def update_search_index_for_invoice(self, invoice_number):
+        """Add a newly saved invoice and its item names to the global search index"""
+        invoice_data = Invoice.get_invoice_by_number(invoice_number)
+        if invoice_data:
+            results = [invoice_result(invoice_number, invoice_data['supplier_name'])]
+            results.extend(item_result(name) for name in
+                           {item['item_name'] for item in Invoice.get_items_by_invoice(invoice_number)})
+            self.global_search.add_results(results)
     
     def handle_item_added(self, invoice_number):
         """Handle auto-printing when an item is added"""
+        self.update_search_index_for_invoice(invoice_number)
         if Settings.get_setting('auto_print', True):
             try:
                 # Get invoice data
@@ -701,9 +850,10 @@ class MainWindow(QMainWindow):
                 items_data = []
                 total_amount = 0
                 
+                # Get full item details for every line in one query
+                items_by_id = Item.get_items_by_ids([item_data['item_id'] for item_data in items_list])
                 for item_data in items_list:
-                    # Get full item details
-                    item = Item.get_item_by_id(item_data['item_id'])
+                    item = items_by_id.get(item_data['item_id'])
                     if item:
                         quantity = item_data['quantity']
                         item_total = item.price_per_unit * quantity
@@ -868,16 +1018,15 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(buttons_layout)
         
-        # Suppliers table
-        self.suppliers_table = QTableWidget()
-        self.suppliers_table.setColumnCount(6)
-        self.suppliers_table.setHorizontalHeaderLabels([
-            "اسم المورد", "الشخص المسؤول", "الهاتف", "البريد الإلكتروني", "شروط الدفع", "تاريخ الإضافة"
-        ])
+        # Suppliers table; rows are updated one at a time after an add, edit or delete
+        self.suppliers_model = RowTableModel(SUPPLIER_COLUMNS, widget, key=lambda supplier: supplier['id'],
+                                             order=lambda supplier: (supplier['supplier_name'] or '').casefold())
+        self.suppliers_table = QTableView()
+        self.suppliers_table.setModel(self.suppliers_model)
         
         # Table styling
         self.suppliers_table.setStyleSheet(self.get_management_table_style())
-        self.suppliers_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.suppliers_table.setEditTriggers(QTableView.NoEditTriggers)
         self.suppliers_table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.suppliers_table.setAlternatingRowColors(True)
         
@@ -916,14 +1065,14 @@ class MainWindow(QMainWindow):
     def get_management_table_style(self):
         """Get table style for management tables"""
         return """
-            QTableWidget {
+            QTableView {
                 gridline-color: #bdc3c7;
                 background-color: white;
                 alternate-background-color: #f8f9fa;
                 selection-background-color: #3498db;
                 selection-color: white;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #ecf0f1;
             }
@@ -951,53 +1100,71 @@ class MainWindow(QMainWindow):
         """Load suppliers data into table"""
         from models.supplier import Supplier
         suppliers = Supplier.get_all_suppliers()
-        self.suppliers_table.setRowCount(len(suppliers))
-        
-        for row, supplier in enumerate(suppliers):
-            self.suppliers_table.setItem(row, 0, QTableWidgetItem(supplier['supplier_name']))
-            self.suppliers_table.setItem(row, 1, QTableWidgetItem(supplier['contact_person'] or ''))
-            self.suppliers_table.setItem(row, 2, QTableWidgetItem(supplier['phone'] or ''))
-            self.suppliers_table.setItem(row, 3, QTableWidgetItem(supplier['email'] or ''))
-            self.suppliers_table.setItem(row, 4, QTableWidgetItem(supplier['payment_terms'] or ''))
-            
-            date_added = supplier['date_added']
-            if date_added:
-                date_str = date_added.strftime('%Y-%m-%d') if hasattr(date_added, 'strftime') else str(date_added)
-                self.suppliers_table.setItem(row, 5, QTableWidgetItem(date_str))
+        self.suppliers_model.set_rows(suppliers)
+        self.global_search.replace_kind('supplier', [supplier_result(s['supplier_name']) for s in suppliers])
+    
+    def selected_supplier(self):
+        """Get the supplier row of the current table row, or None if no row is selected"""
+        index = self.suppliers_table.currentIndex()
+        return self.suppliers_model.row_at(index.row()) if index.isValid() else None
+    
+    def apply_supplier_change(self, change):
+        """Run change() (a supplier dialog or a delete) and update the table rows it touched
+        change returns ('saved', supplier dictionary), ('deleted', supplier id) or None if nothing changed
+        """
+        self.supplier_changes = set()
+        try:
+            result = change()
+        finally:
+            changed_ids, self.supplier_changes = self.supplier_changes, None
+        
+        if result is not None:
+            action, value = result
+            if action == 'saved':
+                self.suppliers_model.upsert_row(value)
+                changed_ids.discard(value['id'])
             else:
-                self.suppliers_table.setItem(row, 5, QTableWidgetItem(''))
-            
-            # Store supplier data in the first item for easy access
-            self.suppliers_table.item(row, 0).setData(Qt.UserRole, supplier)
+                self.suppliers_model.remove_row(value)
+                changed_ids.discard(value)
+        # Suppliers that another terminal changed meanwhile
+        for supplier_id in changed_ids:
+            self.refresh_supplier_row(supplier_id)
+    
+    def refresh_supplier_row(self, supplier_id):
+        """Re-read one supplier into the table, e.g. after another terminal changed it"""
+        supplier = Supplier.get_supplier_by_id(supplier_id)
+        if supplier and supplier['is_active']:
+            self.suppliers_model.upsert_row(Supplier.list_entry(supplier))
+        else:
+            self.suppliers_model.remove_row(supplier_id)
+    
+    def run_supplier_dialog(self, dialog):
+        if dialog.exec() == QDialog.Accepted and dialog.supplier:
+            return 'saved', dialog.supplier
+        return None
     
     def add_supplier(self):
         """Add new supplier"""
         from supplier_dialog import SupplierDialog
-        dialog = SupplierDialog(self)
-        if dialog.exec() == QDialog.Accepted:
-            self.load_suppliers_data()
+        self.apply_supplier_change(lambda: self.run_supplier_dialog(SupplierDialog(self)))
     
     def edit_supplier(self):
         """Edit selected supplier"""
-        current_row = self.suppliers_table.currentRow()
-        if current_row < 0:
+        supplier_data = self.selected_supplier()
+        if supplier_data is None:
             QMessageBox.warning(self, "تحذير", "يرجى اختيار مورد للتعديل")
             return
         
-        supplier_data = self.suppliers_table.item(current_row, 0).data(Qt.UserRole)
         from supplier_dialog import SupplierDialog
-        dialog = SupplierDialog(self, supplier_data)
-        if dialog.exec() == QDialog.Accepted:
-            self.load_suppliers_data()
+        self.apply_supplier_change(lambda: self.run_supplier_dialog(SupplierDialog(self, supplier_data)))
     
     def delete_supplier(self):
         """Delete selected supplier"""
-        current_row = self.suppliers_table.currentRow()
-        if current_row < 0:
+        supplier_data = self.selected_supplier()
+        if supplier_data is None:
             QMessageBox.warning(self, "تحذير", "يرجى اختيار مورد للحذف")
             return
         
-        supplier_data = self.suppliers_table.item(current_row, 0).data(Qt.UserRole)
         supplier_name = supplier_data['supplier_name']
         
         reply = QMessageBox.question(self, "تأكيد الحذف", 
@@ -1005,12 +1172,14 @@ class MainWindow(QMainWindow):
                                    QMessageBox.Yes | QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            from models.supplier import Supplier
-            if Supplier.delete_supplier(supplier_data['id']):
-                QMessageBox.information(self, "نجح", "تم حذف المورد بنجاح")
-                self.load_suppliers_data()
-            else:
-                QMessageBox.critical(self, "خطأ", "فشل في حذف المورد")
+            self.apply_supplier_change(lambda: self.run_supplier_delete(supplier_data['id']))
+    
+    def run_supplier_delete(self, supplier_id):
+        if Supplier.delete_supplier(supplier_id):
+            QMessageBox.information(self, "نجح", "تم حذف المورد بنجاح")
+            return 'deleted', supplier_id
+        QMessageBox.critical(self, "خطأ", "فشل في حذف المورد")
+        return None
     
     def add_branch(self):
         """Add new branch"""
@@ -1066,6 +1235,16 @@ class MainWindow(QMainWindow):
         current_time_str = datetime.datetime.now().strftime("%I:%M:%S %p")
         self.current_time.setText(current_time_str)
     
+    def closeEvent(self, event):
+        # The search index builder and the pages' background queries cannot be interrupted. Give them
+        # a moment to finish; a query still running after that (e.g. a hung connection) is detached
+        # so closing does not freeze and Qt does not destroy a running thread
+        deadline = QDeadlineTimer(self.CLOSE_WAIT)
+        for thread in self.findChildren(QThread):
+            if not thread.wait(deadline):
+                detach_thread(thread)
+        super().closeEvent(event)
+    
     def logout(self):
         """Handle logout functionality"""
         reply = QMessageBox.question(self, 'تسجيل الخروج', 
@@ -0,0 +1,224 @@
+from collections import namedtuple
+
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+# header: column title; display: row -> text; sort_key: row -> comparable value (None if not sortable);
+# background: row -> QColor for the cell (optional)
+Column = namedtuple('Column', ['header', 'display', 'sort_key', 'background'], defaults=(None,))
+
+class RowTableModel(QAbstractTableModel):
+    """Read-only table model over a list of row tuples.
+
+    Cells are formatted only when a view asks for them, so a row costs one
+    tuple however many columns it has. Rows are handed to the view in
+    batches through canFetchMore/fetchMore as it scrolls, and sort() orders
+    the row store itself instead of the view's items.
+
+    With set_page_source() the rows are not held up front: each batch is
+    fetched from the source when the view scrolls to it, and the source
+    (usually a query) does the sorting. A source that cannot count its rows
+    (e.g. keyset pagination) reports a total of None; the model then keeps
+    fetching until a page comes back short.
+
+    Given a key function (row -> identity, e.g. a database id), single rows
+    can be replaced, added or removed with upsert_row/remove_row after an
+    edit, without resetting the model. With an order function too (row ->
+    comparable value, matching the order the rows were loaded in), added
+    and edited rows are placed at their position in that order.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, columns, parent=None, key=None, order=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.key = key
+        self.order = order
+        self._positions = {}  # key -> position in _rows (only with a key function)
+        self._rows = []
+        self._loaded = 0  # rows exposed to the view so far
+        self._total = 0   # rows available, in memory or from the page source (None if unknown)
+        self._has_more = False  # whether the page source may have rows after the fetched ones
+        self._fetch_page = None
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._fetch_page = None
+        self._has_more = False
+        self._total = len(self._rows)
+        self._loaded = min(self._total, self.BATCH_SIZE)
+        self._index_rows()
+        self.endResetModel()
+
+    def set_page_source(self, fetch_page, first_page=None):
+        """Load rows page by page; fetch_page(offset, limit) returns (rows, total row count or None)
+        first_page: fetch_page(0, BATCH_SIZE) if the caller already has it (e.g. from a background query)
+        """
+        rows, total = first_page if first_page is not None else fetch_page(0, self.BATCH_SIZE)
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._fetch_page = fetch_page
+        self._update_total(len(self._rows), total)
+        self._loaded = len(self._rows)
+        self._index_rows()
+        self.endResetModel()
+
+    def _update_total(self, page_size, total):
+        if total is None:
+            self._total = None
+            self._has_more = page_size >= self.BATCH_SIZE
+        else:
+            self._total = max(total, len(self._rows))
+            self._has_more = len(self._rows) < self._total
+
+    def _index_rows(self, start=0):
+        if self.key is None:
+            return
+        if start == 0:
+            self._positions = {}
+        for position in range(start, len(self._rows)):
+            self._positions[self.key(self._rows[position])] = position
+
+    def position_of(self, key):
+        """Position of the row with this key, or -1 if the model does not hold it"""
+        return self._positions.get(key, -1)
+
+    def upsert_row(self, row):
+        """Replace the row with the same key, or add it (in order, or after the last row)"""
+        position = self.position_of(self.key(row))
+        if position >= 0:
+            self._rows[position] = row
+            if self._in_order(position):
+                if position < self._loaded:
+                    self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.columns) - 1))
+                return
+            # An edit moved it in the order (e.g. renamed); take it out and put it back in place
+            self.remove_row(self.key(row))
+        self._insert_row(self._insert_position(row), row)
+
+    def _in_order(self, position):
+        if self.order is None:
+            return True
+        value = self.order(self._rows[position])
+        return ((position == 0 or self.order(self._rows[position - 1]) <= value)
+                and (position == len(self._rows) - 1 or value <= self.order(self._rows[position + 1])))
+
+    def _insert_position(self, row):
+        if self.order is None:
+            return len(self._rows)
+        # After the rows that sort before or equal to it
+        value = self.order(row)
+        low, high = 0, len(self._rows)
+        while low < high:
+            middle = (low + high) // 2
+            if self.order(self._rows[middle]) <= value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _insert_row(self, position, row):
+        # Rows past the loaded ones reach the view through fetchMore
+        exposed = position < self._loaded or self._loaded == len(self._rows)
+        if exposed:
+            self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.insert(position, row)
+        if self._total is not None:
+            self._total += 1
+        if exposed:
+            self._loaded += 1
+        self._index_rows(position)
+        if exposed:
+            self.endInsertRows()
+
+    def remove_row(self, key):
+        """Remove the row with this key, if the model holds it"""
+        position = self.position_of(key)
+        if position < 0:
+            return
+        exposed = position < self._loaded
+        if exposed:
+            self.beginRemoveRows(QModelIndex(), position, position)
+        del self._rows[position]
+        del self._positions[key]
+        if self._total is not None:
+            self._total -= 1
+        if exposed:
+            self._loaded -= 1
+        self._index_rows(position)
+        if exposed:
+            self.endRemoveRows()
+
+    def is_paged(self):
+        return self._fetch_page is not None
+
+    def total_count(self):
+        """Number of rows available, including the pages not fetched yet (None if the source cannot tell)"""
+        return self._total
+
+    def rows(self):
+        return self._rows
+
+    def row_at(self, row):
+        return self._rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            text = self.columns[index.column()].display(row)
+            return "" if text is None else text
+        if role == Qt.UserRole:
+            return row
+        if role == Qt.BackgroundRole:
+            background = self.columns[index.column()].background
+            return background(row) if background is not None else None
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section].header
+        return section + 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and (self._loaded < len(self._rows) or self._has_more)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self._fetch_page is not None and self._loaded == len(self._rows):
+            rows, total = self._fetch_page(len(self._rows), self.BATCH_SIZE)
+            if not rows:
+                # The source has no more rows (or shrank since the last page); stop asking
+                self._has_more = False
+                if self._total is not None:
+                    self._total = len(self._rows)
+                return
+            self._rows.extend(rows)
+            self._index_rows(len(self._rows) - len(rows))
+            self._update_total(len(rows), total)
+        count = min(self.BATCH_SIZE, len(self._rows) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        sort_key = self.columns[column].sort_key
+        # Paged rows are ordered by their source; sorting one page would misplace the rest
+        if sort_key is None or self._fetch_page is not None:
+            return
+        self.layoutAboutToBeChanged.emit()
+        self._rows.sort(key=sort_key, reverse=order == Qt.DescendingOrder)
+        self._index_rows()
+        self.layoutChanged.emit()
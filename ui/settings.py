@@ -55,6 +55,9 @@ class PrinterSettingsWidget(QWidget):
         main_layout.addLayout(save_layout)
     
     def load_settings(self):
+        # Pick up changes saved from other terminals
+        Settings.refresh()
+        
         # Load printer settings
         self.load_printers()
         
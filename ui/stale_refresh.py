@@ -0,0 +1,30 @@
+class StaleRefreshMixin:
+    """Refreshes the parts of a widget invalidated by data change events.
+
+    Event handlers call mark_stale() with the names of the parts to reload.
+    A visible widget refreshes them at once; a hidden one (e.g. on another
+    tab) waits until it is shown, so switching tabs costs nothing when
+    nothing changed. Subclasses override refresh_parts(parts).
+    """
+
+    def mark_stale(self, *parts):
+        if not hasattr(self, 'stale_parts'):
+            self.stale_parts = set()
+        self.stale_parts.update(parts)
+        if self.isVisible():
+            self.refresh_stale()
+
+    def refresh_stale(self):
+        parts = getattr(self, 'stale_parts', None)
+        if parts:
+            self.stale_parts = set()
+            self.refresh_parts(parts)
+
+    def refresh_parts(self, parts):
+        """Reload the given stale parts (a set of the names passed to mark_stale)
+        Widgets using the mixin override this; by default nothing is reloaded.
+        """
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_stale()
@@ -1,14 +1,64 @@
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
-                              QTableWidgetItem, QLineEdit, QPushButton, QLabel,
-                              QComboBox, QHeaderView)
-from PySide6.QtCore import Qt, QDate
+from datetime import datetime
+
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView,
+                              QLineEdit, QPushButton, QLabel, QComboBox, QHeaderView)
+from PySide6.QtCore import Qt, QTimer
 
 from models.item import Item
+from models.product_stock import ProductStock
+from utils.date_utils import format_date
+from utils.arabic_utils import normalize_arabic, match_rank
+from utils.event_bus import event_bus, ItemAdded, StockExtracted
+from utils.local_cache import local_cache
+from ui.stale_refresh import StaleRefreshMixin
+from ui.background import BackgroundTask, LastUpdatedLabel
+from ui.row_table_model import Column, RowTableModel
+
+# Lot rows are Item.to_row() tuples: id, name, quantity, quantity type, price, invoice, supplier, date added
+LOT_COLUMNS = [
+    Column("رقم", lambda row: str(row[0]), lambda row: row[0]),
+    # Ordered like Item.SORTS['name'] so filtering in memory and in SQL give the same order
+    Column("اسم المنتج", lambda row: row[1], lambda row: (normalize_arabic(row[1] or ""), row[0])),
+    Column("الكمية", lambda row: f"{row[2]} {row[3]}", lambda row: row[2]),
+    Column("نوع الوحدة", lambda row: row[3], lambda row: row[3] or ""),
+    Column("السعر لكل وحدة", lambda row: f"{row[4]:.2f} ج.م", lambda row: row[4]),
+    Column("رقم الفاتورة", lambda row: row[5], lambda row: row[5] or ""),
+    Column("تاريخ الإضافة", lambda row: format_date(row[7], with_time=True), lambda row: row[7] or datetime.min),
+]
+# Product rows: name, on-hand quantity, quantity type, lot count, stock value
+PRODUCT_COLUMNS = [
+    Column("اسم المنتج", lambda row: row[0], lambda row: row[0] or ""),
+    Column("الكمية المتاحة", lambda row: str(row[1]), lambda row: row[1]),
+    Column("نوع الوحدة", lambda row: row[2], lambda row: row[2] or ""),
+    Column("عدد الدفعات", lambda row: str(row[3]), lambda row: row[3]),
+    Column("قيمة المخزون", lambda row: f"{row[4]:.2f} ج.م", lambda row: row[4]),
+]
+# Sort option -> (lot column, order)
+LOT_SORTS = {
+    "name": (1, Qt.AscendingOrder),
+    "quantity_asc": (2, Qt.AscendingOrder),
+    "quantity_desc": (2, Qt.DescendingOrder),
+    "date_desc": (6, Qt.DescendingOrder),
+    "date_asc": (6, Qt.AscendingOrder),
+}
 
-class StockViewWidget(QWidget):
+class StockViewWidget(StaleRefreshMixin, QWidget):
+    # Typing pause before the filters are applied
+    SEARCH_DELAY = 150  # ms
+    
     def __init__(self):
         super().__init__()
         
+        # Unfiltered lot rows by id, kept current with Item.get_changed_since deltas
+        self.rows_by_id = {}
+        self.change_token = None
+        # Bumped by every revalidation; the result of an older one is dropped
+        self.changes_generation = 0
+        # Normalized lot names for filtering in memory, by name
+        self.normalized_names = {}
+        # Bumped by every filter change; a database search answering an older one is dropped
+        self.search_generation = 0
+        
         # Create layout
         layout = QVBoxLayout(self)
         
@@ -28,6 +78,11 @@ class StockViewWidget(QWidget):
         self.sort_combo.addItem("ترتيب بالتاريخ (الأحدث أولا)", "date_desc")
         self.sort_combo.addItem("ترتيب بالتاريخ (الأقدم أولا)", "date_asc")
         
+        # Lots are listed one by one; products come from the product_stock aggregate
+        self.view_combo = QComboBox()
+        self.view_combo.addItem("عرض الدفعات", "lots")
+        self.view_combo.addItem("عرض المنتجات", "products")
+        
         self.search_button = QPushButton("بحث")
         self.reset_button = QPushButton("إعادة تعيين")
         
@@ -37,89 +92,235 @@ class StockViewWidget(QWidget):
         filter_layout.addWidget(self.invoice_filter)
         filter_layout.addWidget(QLabel("ترتيب:"))
         filter_layout.addWidget(self.sort_combo)
+        filter_layout.addWidget(QLabel("عرض:"))
+        filter_layout.addWidget(self.view_combo)
         filter_layout.addWidget(self.search_button)
         filter_layout.addWidget(self.reset_button)
         
-        # Create table
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(["رقم", "اسم المنتج", "الكمية", "نوع الوحدة", "السعر لكل وحدة", "رقم الفاتورة", "تاريخ الإضافة"])
+        # Create table; only the rows scrolled into view are formatted
+        self.lot_model = RowTableModel(LOT_COLUMNS, self)
+        self.product_model = RowTableModel(PRODUCT_COLUMNS, self)
+        self.table = QTableView()
+        self.table.setModel(self.lot_model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
+        
+        self.last_updated_label = LastUpdatedLabel()
+        self.result_count_label = QLabel()
+        
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self.last_updated_label)
+        status_layout.addStretch()
+        status_layout.addWidget(self.result_count_label)
         
         # Add widgets to layout
         layout.addLayout(filter_layout)
         layout.addWidget(self.table)
+        layout.addLayout(status_layout)
+        
+        # Filter as the user types, once typing pauses
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.apply_filters)
         
         # Connect signals
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.invoice_filter.textChanged.connect(self.search_timer.start)
         self.search_button.clicked.connect(self.apply_filters)
         self.reset_button.clicked.connect(self.reset_filters)
+        self.view_combo.currentIndexChanged.connect(self.refresh_items)
+        self.sort_combo.currentIndexChanged.connect(self.apply_sort)
         
-        # Initialize table
-        self.refresh_items()
+        # Reload when lots are added or extracted
+        event_bus.subscribe(ItemAdded, self.on_stock_changed)
+        event_bus.subscribe(StockExtracted, self.on_stock_changed)
+        
+        # Paint the lots saved at the last exit, then fetch what changed since in the background
+        local_cache.register('items', self.local_cache_entry)
+        self.load_from_local_cache()
+    
+    def local_cache_entry(self):
+        if self.change_token is None:
+            return None
+        return {'token': self.change_token, 'rows': list(self.rows_by_id.values())}
+    
+    def load_from_local_cache(self):
+        cached, saved_at = local_cache.get('items')
+        if cached is not None:
+            self.rows_by_id = {row[0]: tuple(row) for row in cached['rows']}
+            self.change_token = cached['token']
+            self.populate_table(self.rows_by_id.values())
+            self.last_updated_label.show_cached(saved_at)
+        else:
+            self.last_updated_label.show_loading()
+        self.revalidate()
+    
+    def revalidate(self):
+        """Fetch the lots changed since change_token in the background (all lots the first time),
+        then show them with the current filters
+        """
+        self.changes_generation += 1
+        generation = self.changes_generation
+        task = BackgroundTask(Item.get_changed_since, self.change_token, parent=self)
+        task.result_ready.connect(lambda changes: self.on_revalidated(generation, changes))
+        task.finished.connect(task.deleteLater)
+        task.start()
+    
+    def on_revalidated(self, generation, changes):
+        if generation != self.changes_generation:
+            # A newer revalidation was started meanwhile; it reads from the same token or a later one
+            return
+        if not self.apply_item_changes(changes):
+            return
+        # The product view queries the database itself
+        if self.is_product_view():
+            return
+        if self.search_input.text() or self.invoice_filter.text():
+            self.apply_filters()
+        else:
+            self.populate_table(self.rows_by_id.values())
+    
+    def on_stock_changed(self, event):
+        self.mark_stale('items')
+    
+    def refresh_parts(self, parts):
+        # Keeps the current filters; the loaded lots are refreshed from change deltas
+        if self.is_product_view():
+            self.apply_filters()
+        else:
+            self.revalidate()
+    
+    def is_product_view(self):
+        return self.view_combo.currentData() == "products"
+    
+    def has_all_lots(self):
+        """Whether rows_by_id holds every lot, so filters can be answered in memory"""
+        return self.change_token is not None
     
     def refresh_items(self):
-        # Get all items
-        items = Item.get_all_items()
-        self.populate_table(items)
+        self.search_timer.stop()
+        self.search_generation += 1
+        if self.is_product_view():
+            self.populate_products_table(ProductStock.get_all_products(self.search_input.text()))
+            return
+        
+        # Show the loaded lots now; only the ones changed since the last refresh are fetched
+        self.populate_table(self.rows_by_id.values())
+        self.revalidate()
+    
+    def apply_item_changes(self, changes):
+        """Apply the result of Item.get_changed_since to the unfiltered lots
+        Returns: False if it failed (None); the lots and token are kept so the next refresh asks again
+        """
+        if changes is None:
+            self.last_updated_label.show_failed()
+            return False
+        changed_items, deleted_ids, self.change_token = changes
+        for item_id in deleted_ids:
+            self.rows_by_id.pop(item_id, None)
+        for item in changed_items:
+            self.rows_by_id[item.id] = tuple(item.to_row())
+        self.last_updated_label.show_fresh()
+        return True
     
     def apply_filters(self):
         search_term = self.search_input.text()
         invoice_filter = self.invoice_filter.text()
         
-        # Apply filters
-        if search_term and invoice_filter:
-            # If both filters are applied, we need to filter manually
-            all_items = Item.get_all_items()
-            filtered_items = []
-            
-            for item in all_items:
-                if (search_term.lower() in item.item_name.lower() and 
-                    invoice_filter.lower() in item.invoice_number.lower()):
-                    filtered_items.append(item)
-            
-            self.populate_table(filtered_items)
-        elif search_term:
-            items = Item.search_items(search_term)
-            self.populate_table(items)
-        elif invoice_filter:
-            items = Item.filter_by_invoice(invoice_filter)
-            self.populate_table(items)
-        else:
+        if self.is_product_view():
+            # Products aggregate across invoices, so only the name filter applies
+            self.search_timer.stop()
+            self.search_generation += 1
+            self.populate_products_table(ProductStock.get_all_products(search_term))
+            return
+        
+        if not search_term and not invoice_filter:
             self.refresh_items()
+        elif self.has_all_lots():
+            self.search_timer.stop()
+            self.search_generation += 1
+            self.populate_table(self.filter_loaded_lots(search_term, invoice_filter))
+        else:
+            self.populate_query_results()
+    
+    def filter_loaded_lots(self, search_term, invoice_filter):
+        """Get the loaded lot rows matching the filters, with the same matching rules as Item.query_items"""
+        term = normalize_arabic(search_term)
+        invoice_part = invoice_filter.lower()
+        rows = []
+        for row in self.rows_by_id.values():
+            if invoice_part and invoice_part not in (row[5] or "").lower():
+                continue
+            if term:
+                name = row[1] or ""
+                normalized_name = self.normalized_names.get(name)
+                if normalized_name is None:
+                    normalized_name = self.normalized_names[name] = normalize_arabic(name)
+                if match_rank(normalized_name, term) is None:
+                    continue
+            rows.append(row)
+        return rows
+    
+    def populate_query_results(self):
+        """Show the filtered lots, filtered, sorted and paged by the database as the table scrolls
+        The first page is fetched in the background; it is dropped if the filters change meanwhile.
+        """
+        self.search_timer.stop()
+        self.search_generation += 1
+        generation = self.search_generation
+        search_term = self.search_input.text()
+        invoice_filter = self.invoice_filter.text()
+        sort_option = self.sort_combo.currentData()
+        
+        def fetch_page(offset, limit):
+            items, total = Item.query_items(name=search_term, invoice_number=invoice_filter,
+                                            sort=sort_option, offset=offset, limit=limit)
+            return [item.to_row() for item in items], total
+        
+        task = BackgroundTask(fetch_page, 0, RowTableModel.BATCH_SIZE, parent=self)
+        task.result_ready.connect(lambda first_page: self.on_query_results(generation, fetch_page, first_page))
+        task.finished.connect(task.deleteLater)
+        task.start()
+    
+    def on_query_results(self, generation, fetch_page, first_page):
+        if generation != self.search_generation:
+            return
+        self.table.setModel(self.lot_model)
+        self.lot_model.set_page_source(fetch_page, first_page)
+        self.result_count_label.setText(f"عدد النتائج: {self.lot_model.total_count()}")
     
     def reset_filters(self):
         self.search_input.clear()
         self.invoice_filter.clear()
+        self.search_timer.stop()
         self.sort_combo.setCurrentIndex(0)
         self.refresh_items()
     
-    def populate_table(self, items):
-        # Sort items based on selected sort option
+    def populate_table(self, rows):
+        """Show lot rows (Item.to_row() tuples) in the current sort order"""
+        self.table.setModel(self.lot_model)
+        self.lot_model.set_rows(rows)
+        self.result_count_label.setText(f"عدد النتائج: {self.lot_model.total_count()}")
+        self.apply_sort()
+    
+    def populate_products_table(self, products):
+        self.table.setModel(self.product_model)
+        self.product_model.set_rows((product['item_name'], product['on_hand_quantity'], product['quantity_type'],
+                                     product['lot_count'], product['stock_value']) for product in products)
+        self.result_count_label.setText(f"عدد النتائج: {self.product_model.total_count()}")
+        self.apply_sort()
+    
+    def apply_sort(self):
+        """Sort the shown rows by the sort option; products keep the query order unless sorted by quantity"""
         sort_option = self.sort_combo.currentData()
-        
-        if sort_option == "name":
-            items.sort(key=lambda x: x.item_name)
-        elif sort_option == "quantity_asc":
-            items.sort(key=lambda x: x.quantity)
-        elif sort_option == "quantity_desc":
-            items.sort(key=lambda x: x.quantity, reverse=True)
-        elif sort_option == "date_desc":
-            items.sort(key=lambda x: x.date_added, reverse=True)
-        elif sort_option == "date_asc":
-            items.sort(key=lambda x: x.date_added)
-        
-        # Clear table
-        self.table.setRowCount(0)
-        
-        # Populate table
-        for row, item in enumerate(items):
-            self.table.insertRow(row)
-            
-            self.table.setItem(row, 0, QTableWidgetItem(str(item.id)))
-            self.table.setItem(row, 1, QTableWidgetItem(item.item_name))
-            self.table.setItem(row, 2, QTableWidgetItem(f"{item.quantity} {item.quantity_type}"))
-            self.table.setItem(row, 3, QTableWidgetItem(item.quantity_type))
-            self.table.setItem(row, 4, QTableWidgetItem(f"{item.price_per_unit:.2f} ج.م"))
-            self.table.setItem(row, 5, QTableWidgetItem(item.invoice_number))
-            self.table.setItem(row, 6, QTableWidgetItem(str(item.date_added) if item.date_added else ""))
\ No newline at end of file
+        if self.table.model() is self.lot_model and self.lot_model.is_paged():
+            # Filtered lots are sorted by the query, so run it again in the new order
+            self.populate_query_results()
+            return
+        if self.table.model() is self.product_model:
+            if sort_option in ("quantity_asc", "quantity_desc"):
+                self.product_model.sort(1, Qt.AscendingOrder if sort_option == "quantity_asc" else Qt.DescendingOrder)
+            return
+        column, order = LOT_SORTS[sort_option]
+        self.lot_model.sort(column, order)
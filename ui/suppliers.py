@@ -1,9 +1,10 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                                 QTableWidget, QTableWidgetItem, QHeaderView, 
                                 QComboBox, QLabel, QMessageBox, QFrame, QGroupBox,
-                                QDateEdit, QFileDialog, QTabWidget, QScrollArea)
+                                QDateEdit, QFileDialog, QTabWidget, QScrollArea, QTableView,
+                                QProgressBar)
 from PySide6.QtCore import Qt, Signal, QDate
-from PySide6.QtGui import QFont
+from PySide6.QtGui import QFont, QColor
 from database import get_db_connection
 import pyodbc
 from reportlab.lib.pagesizes import letter, A4
@@ -134,14 +135,103 @@ def format_arabic_text(text):
 from models.supplier import Supplier
 from models.branch import Branch
 from models.invoice import Invoice
+from models.supplier_balance import SupplierBalance
+from utils.event_bus import (event_bus, ItemAdded, InvoiceSaved, PaymentRecorded,
+                             SupplierChanged, BranchChanged)
+from ui.stale_refresh import StaleRefreshMixin
+from ui.row_table_model import Column, RowTableModel
+from ui.background import BackgroundTask
 
-class SuppliersWidget(QWidget):
+def payment_status_text(payment_status):
+    """Translate a payment status to Arabic"""
+    payment_status = str(payment_status)
+    if payment_status == "PAID" or payment_status == "Paid":
+        return "مدفوع"
+    if payment_status == "PARTIALLY_PAID" or payment_status == "Partially Paid":
+        return "مدفوع جزئيا"
+    if payment_status == "DELAYED" or payment_status == "Delayed":
+        return "متأخر"
+    return payment_status
+
+def payment_status_color(invoice):
+    payment_status = payment_status_text(invoice[3])
+    if payment_status == "مدفوع":
+        return QColor(Qt.green)
+    if payment_status == "متأخر":
+        return QColor(Qt.red)
+    return QColor(Qt.yellow)
+
+# Supplier invoice rows are Invoice.get_supplier_invoices tuples
+SUPPLIER_INVOICE_COLUMNS = [
+    Column("رقم الفاتورة", lambda invoice: str(invoice[0]), None),
+    Column("المورد", lambda invoice: str(invoice[1]), None),
+    Column("المبلغ الإجمالي", lambda invoice: f"{invoice[2]:.2f}", None),
+    Column("حالة الدفع", lambda invoice: payment_status_text(invoice[3]), None, payment_status_color),
+    Column("المبلغ المدفوع", lambda invoice: f"{invoice[4]:.2f}", None),
+    Column("تاريخ الإصدار", lambda invoice: invoice[5].strftime("%Y-%m-%d") if invoice[5] else "", None),
+]
+
+# Columns of the branch table for the items report of one branch and for the activity report of all branches
+BRANCH_ITEMS_HEADERS = [
+    "رقم الفاتورة", "اسم الصنف", "الوحدة", "الكمية المستخرجة", "تاريخ الاستخراج", "المورد", "مستخرج بواسطة"
+]
+BRANCH_ACTIVITY_HEADERS = [
+    "اسم الفرع", "كود الفرع", "مدير الفرع", "إجمالي الاستخراجات", "إجمالي الكمية", "عدد الأصناف المختلفة"
+]
+
+class SuppliersWidget(StaleRefreshMixin, QWidget):
     def __init__(self):
         super().__init__()
         self.current_branch_data = None
+        # Callbacks waiting for the branch activity report that is being computed
+        self.branch_activity_callbacks = []
+        # Date range of the shown invoices, reapplied when they are reloaded after a change
+        self.invoice_date_range = (None, None)
         self.init_ui()
         self.load_suppliers()
         
+        event_bus.subscribe(SupplierChanged, self.on_suppliers_changed)
+        event_bus.subscribe(BranchChanged, self.on_branches_changed)
+        event_bus.subscribe(ItemAdded, self.on_invoices_changed)
+        event_bus.subscribe(InvoiceSaved, self.on_invoices_changed)
+        event_bus.subscribe(PaymentRecorded, self.on_invoices_changed)
+    
+    def on_suppliers_changed(self, event):
+        self.mark_stale('suppliers')
+    
+    def on_branches_changed(self, event):
+        self.mark_stale('branches')
+    
+    def on_invoices_changed(self, event):
+        # Balances cover every supplier; the invoice table only the selected one
+        self.mark_stale('balances')
+        if event.supplier_name is None or event.supplier_name == self.supplier_combo.currentText():
+            self.mark_stale('invoices')
+    
+    def refresh_parts(self, parts):
+        if 'suppliers' in parts:
+            current_supplier = self.supplier_combo.currentText()
+            self.supplier_combo.blockSignals(True)
+            self.load_suppliers()
+            index = self.supplier_combo.findText(current_supplier)
+            self.supplier_combo.setCurrentIndex(max(index, 0))
+            self.supplier_combo.blockSignals(False)
+            if index < 0:
+                self.on_supplier_changed(self.supplier_combo.currentText())
+        if 'branches' in parts:
+            current_branch_id = self.branch_combo.currentData()
+            self.load_branches_combo()
+            index = self.branch_combo.findData(current_branch_id)
+            if index >= 0:
+                self.branch_combo.setCurrentIndex(index)
+        if 'invoices' in parts:
+            current_supplier = self.supplier_combo.currentText()
+            if current_supplier != "-- اختر المورد --" and current_supplier:
+                self.load_supplier_invoices(current_supplier, *self.invoice_date_range)
+        # Otherwise the balances are loaded when their tab is opened
+        if 'balances' in parts and self.tab_widget.currentWidget() is self.balances_tab:
+            self.load_supplier_balances()
+        
     def init_ui(self):
         # Main layout
         main_layout = QVBoxLayout(self)
@@ -199,71 +289,83 @@ class SuppliersWidget(QWidget):
         self.branch_tab = self.create_branch_tab()
         self.tab_widget.addTab(self.branch_tab, "تقارير الفروع")
         
+        # Create all-suppliers balances tab
+        self.balances_tab = self.create_balances_tab()
+        self.tab_widget.addTab(self.balances_tab, "أرصدة الموردين")
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+        
         main_layout.addWidget(self.tab_widget)
+        
+        # Busy indicator while the branch activity report is computed
+        self.branch_activity_progress = QProgressBar()
+        self.branch_activity_progress.setRange(0, 0)
+        self.branch_activity_progress.setMaximumHeight(12)
+        self.branch_activity_progress.setTextVisible(False)
+        self.branch_activity_progress.setToolTip("جاري إعداد تقرير الفروع...")
+        self.branch_activity_progress.hide()
+        main_layout.addWidget(self.branch_activity_progress)
     
     def generate_branch_report_inline(self):
         """Generate branch report inline in the tab"""
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Get branch extraction data with branch details from new branches table
-            cursor.execute("""
-                SELECT COALESCE(b.branch_name, e.branch_name) as branch_name, 
-                       COUNT(e.id) as total_extractions,
-                       SUM(e.quantity_extracted) as total_quantity,
-                       COUNT(DISTINCT i.item_name) as unique_items,
-                       b.branch_code,
-                       b.manager_name
-                FROM extractions e
-                JOIN items i ON e.item_id = i.id
-                LEFT JOIN branches b ON e.branch_name = b.branch_name AND b.is_active = 1
-                GROUP BY COALESCE(b.branch_name, e.branch_name), b.branch_code, b.manager_name
-                ORDER BY total_quantity DESC
-            """)
-            
-            branch_data = cursor.fetchall()
-            conn.close()
-            
-            if not branch_data:
-                # Clear table and show empty state
-                self.branch_table.setRowCount(0)
-                self.branch_report_frame.show()
-                self.adjust_branch_table_height()
-                
-                # Switch to branch tab and show message
-                self.tab_widget.setCurrentIndex(1)
-                QMessageBox.information(self, "معلومات", "لا توجد بيانات فروع للعرض")
-                return
-            
-            # Store branch data for export
-            self.current_branch_data = branch_data
-            
-            # Clear existing data
+        self.tab_widget.setCurrentIndex(1)
+        self.load_branch_activity(self.show_branch_activity)
+    
+    def load_branch_activity(self, on_loaded):
+        """Compute the branch activity report off the UI thread, then call on_loaded(rows or None)
+        Requests made while the report is running share its result instead of starting another query
+        """
+        self.branch_activity_callbacks.append(on_loaded)
+        if len(self.branch_activity_callbacks) > 1:
+            return
+        self.branch_activity_progress.show()
+        task = BackgroundTask(Branch.get_activity_report, parent=self)
+        task.result_ready.connect(self.on_branch_activity_loaded)
+        task.finished.connect(task.deleteLater)
+        task.start()
+    
+    def on_branch_activity_loaded(self, branch_data):
+        self.branch_activity_progress.hide()
+        callbacks, self.branch_activity_callbacks = self.branch_activity_callbacks, []
+        for callback in callbacks:
+            callback(branch_data)
+    
+    def show_branch_activity(self, branch_data):
+        if branch_data is None:
+            QMessageBox.critical(self, "خطأ في قاعدة البيانات", "فشل في تحميل تقرير الفروع")
+            return
+        
+        # The table also shows the items report of one branch; set the branch summary columns
+        self.branch_report_frame.setTitle("تقرير الفروع")
+        self.branch_table.setColumnCount(len(BRANCH_ACTIVITY_HEADERS))
+        self.branch_table.setHorizontalHeaderLabels(BRANCH_ACTIVITY_HEADERS)
+        
+        if not branch_data:
+            # Clear table and show empty state
             self.branch_table.setRowCount(0)
-            
-            # Populate the branch table
-            self.branch_table.setRowCount(len(branch_data))
-            
-            for row, data in enumerate(branch_data):
-                self.branch_table.setItem(row, 0, QTableWidgetItem(str(data[0]) if data[0] else ""))
-                self.branch_table.setItem(row, 1, QTableWidgetItem(str(data[4]) if data[4] else "غير محدد"))
-                self.branch_table.setItem(row, 2, QTableWidgetItem(str(data[5]) if data[5] else "غير محدد"))
-                self.branch_table.setItem(row, 3, QTableWidgetItem(str(data[1])))
-                self.branch_table.setItem(row, 4, QTableWidgetItem(str(data[2])))
-                self.branch_table.setItem(row, 5, QTableWidgetItem(str(data[3])))
-            
-            # Show the branch report frame
             self.branch_report_frame.show()
-            
-            # Adjust branch table height
             self.adjust_branch_table_height()
-            
-            # Switch to branch tab
-            self.tab_widget.setCurrentIndex(1)
-            
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "خطأ في قاعدة البيانات", f"فشل في تحميل تقرير الفروع: {e}")
+            QMessageBox.information(self, "معلومات", "لا توجد بيانات فروع للعرض")
+            return
+        
+        # Store branch data for export
+        self.current_branch_data = branch_data
+        
+        # Populate the branch table
+        self.branch_table.setRowCount(len(branch_data))
+        
+        for row, data in enumerate(branch_data):
+            self.branch_table.setItem(row, 0, QTableWidgetItem(str(data[0]) if data[0] else ""))
+            self.branch_table.setItem(row, 1, QTableWidgetItem(str(data[4]) if data[4] else "غير محدد"))
+            self.branch_table.setItem(row, 2, QTableWidgetItem(str(data[5]) if data[5] else "غير محدد"))
+            self.branch_table.setItem(row, 3, QTableWidgetItem(str(data[1])))
+            self.branch_table.setItem(row, 4, QTableWidgetItem(str(data[2])))
+            self.branch_table.setItem(row, 5, QTableWidgetItem(str(data[3])))
+        
+        # Show the branch report frame
+        self.branch_report_frame.show()
+        
+        # Adjust branch table height
+        self.adjust_branch_table_height()
     
     def create_supplier_tab(self):
         """Create the supplier reports tab"""
@@ -530,34 +632,33 @@ class SuppliersWidget(QWidget):
         """)
         table_layout = QVBoxLayout(table_frame)
         
-        self.invoices_table = QTableWidget()
-        self.invoices_table.setColumnCount(6)
-        self.invoices_table.setHorizontalHeaderLabels([
-            "رقم الفاتورة", "المورد", "المبلغ الإجمالي", "حالة الدفع", "المبلغ المدفوع", "تاريخ الإصدار"
-        ])
+        # Invoices are read a page at a time as the table scrolls
+        self.invoices_model = RowTableModel(SUPPLIER_INVOICE_COLUMNS, self)
+        self.invoices_table = QTableView()
+        self.invoices_table.setModel(self.invoices_model)
         
         # Set dynamic height based on content
-        self.invoices_table.setSizeAdjustPolicy(QTableWidget.AdjustToContents)
+        self.invoices_table.setSizeAdjustPolicy(QTableView.AdjustToContents)
         self.invoices_table.verticalHeader().setDefaultSectionSize(35)  # Row height
         self.invoices_table.setMaximumHeight(600)  # Maximum height to prevent excessive growth
-        self.invoices_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.invoices_table.setEditTriggers(QTableView.NoEditTriggers)
         
 
         
         # Style the table
         self.invoices_table.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: 1px solid #bdc3c7;
                 border-radius: 4px;
                 background-color: white;
                 gridline-color: #ecf0f1;
                 font-size: 12px;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 8px;
                 border-bottom: 1px solid #ecf0f1;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3498db;
                 color: white;
             }
@@ -575,7 +676,7 @@ class SuppliersWidget(QWidget):
         header = self.invoices_table.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.Stretch)
         self.invoices_table.setAlternatingRowColors(True)
-        self.invoices_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.invoices_table.setSelectionBehavior(QTableView.SelectRows)
         
         table_layout.addWidget(self.invoices_table)
         layout.addWidget(table_frame)
@@ -846,11 +947,9 @@ class SuppliersWidget(QWidget):
         branch_report_layout = QVBoxLayout(self.branch_report_frame)
         
         self.branch_table = QTableWidget()
-        self.branch_table.setColumnCount(7)
+        self.branch_table.setColumnCount(len(BRANCH_ITEMS_HEADERS))
         self.branch_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.branch_table.setHorizontalHeaderLabels([
-            "رقم الفاتورة", "اسم الصنف", "الوحدة", "الكمية المستخرجة", "تاريخ الاستخراج", "المورد", "مستخرج بواسطة"
-        ])
+        self.branch_table.setHorizontalHeaderLabels(BRANCH_ITEMS_HEADERS)
         
         # Style the branch table
         self.branch_table.setStyleSheet("""
@@ -901,10 +1000,97 @@ class SuppliersWidget(QWidget):
         
         return tab
     
+    def create_balances_tab(self):
+        """Create the all-suppliers balances tab"""
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(20)
+        
+        # Refresh button
+        buttons_layout = QHBoxLayout()
+        refresh_btn = QPushButton("تحديث")
+        refresh_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #27ae60;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 16px;
+                font-size: 14px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #229954;
+            }
+            QPushButton:pressed {
+                background-color: #1e8449;
+            }
+        """)
+        refresh_btn.clicked.connect(self.load_supplier_balances)
+        buttons_layout.addWidget(refresh_btn)
+        buttons_layout.addStretch()
+        layout.addLayout(buttons_layout)
+        
+        self.balances_table = QTableWidget()
+        self.balances_table.setColumnCount(5)
+        self.balances_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.balances_table.setHorizontalHeaderLabels([
+            "المورد", "عدد الفواتير", "المبلغ الإجمالي", "المبلغ المدفوع", "المبلغ المتبقي"
+        ])
+        self.balances_table.setStyleSheet("""
+            QTableWidget {
+                border: 1px solid #bdc3c7;
+                border-radius: 4px;
+                background-color: white;
+                gridline-color: #ecf0f1;
+                font-size: 12px;
+            }
+            QTableWidget::item {
+                padding: 8px;
+                border-bottom: 1px solid #ecf0f1;
+            }
+            QTableWidget::item:selected {
+                background-color: #3498db;
+                color: white;
+            }
+            QHeaderView::section {
+                background-color: #34495e;
+                color: white;
+                padding: 10px;
+                border: none;
+                font-weight: bold;
+                font-size: 12px;
+            }
+        """)
+        self.balances_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.balances_table.setAlternatingRowColors(True)
+        self.balances_table.setSelectionBehavior(QTableWidget.SelectRows)
+        
+        layout.addWidget(self.balances_table)
+        return tab
+    
+    def on_tab_changed(self, index):
+        """Load the balances list when its tab is opened"""
+        if self.tab_widget.widget(index) is self.balances_tab:
+            self.load_supplier_balances()
+    
+    def load_supplier_balances(self):
+        """Load the maintained balance row of every supplier"""
+        balances = SupplierBalance.get_all_balances()
+        self.balances_table.setRowCount(len(balances))
+        
+        for row, balance in enumerate(balances):
+            self.balances_table.setItem(row, 0, QTableWidgetItem(str(balance['supplier_name'])))
+            self.balances_table.setItem(row, 1, QTableWidgetItem(str(balance['invoice_count'])))
+            self.balances_table.setItem(row, 2, QTableWidgetItem(f"{balance['total_amount']:.2f}"))
+            self.balances_table.setItem(row, 3, QTableWidgetItem(f"{balance['paid_amount']:.2f}"))
+            self.balances_table.setItem(row, 4, QTableWidgetItem(f"{balance['remaining_amount']:.2f}"))
+    
     def adjust_table_height(self):
         """Dynamically adjust table height based on number of rows"""
         if hasattr(self, 'invoices_table'):
-            row_count = self.invoices_table.rowCount()
+            row_count = self.invoices_model.rowCount()
             if row_count == 0:
                 # Minimum height when no data
                 self.invoices_table.setMinimumHeight(150)
@@ -954,103 +1140,47 @@ class SuppliersWidget(QWidget):
         """Handle supplier selection change"""
         if supplier_name == "-- اختر المورد --" or not supplier_name:
             self.clear_table()
-            self.update_summary([], 0, 0, 0)
+            self.update_summary(0, 0, 0, 0)
             return
             
         self.load_supplier_invoices(supplier_name)
     
     def load_supplier_invoices(self, supplier_name, from_date=None, to_date=None):
         """Load invoices for the selected supplier with optional date filtering"""
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Build query with optional date filtering
-            base_query = """
-                SELECT invoice_number, supplier_name, total_amount, payment_status, 
-                       paid_amount, issue_date
-                FROM invoices 
-                WHERE supplier_name = ?
-            """
-            
-            params = [supplier_name]
-            
-            if from_date and to_date:
-                base_query += " AND issue_date BETWEEN ? AND ?"
-                params.extend([from_date, to_date])
-            
-            base_query += " ORDER BY issue_date DESC"
-            
-            cursor.execute(base_query, params)
-            invoices = cursor.fetchall()
-            
-            # Store current invoices for export
-            self.current_invoices = invoices
-            
-            # Populate the table
-            self.populate_table(invoices)
-            
-            # Calculate summary
-            total_invoices = len(invoices)
-            total_amount = sum(invoice[2] for invoice in invoices)
-            paid_amount = sum(invoice[4] for invoice in invoices)
-            remaining_amount = total_amount - paid_amount
-            
-            self.update_summary(invoices, total_amount, paid_amount, remaining_amount)
-            self.adjust_table_height()  # Adjust height after loading invoices
-            
-            conn.close()
-            
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "خطأ في قاعدة البيانات", f"فشل في تحميل فواتير المورد: {e}")
-    
-    def populate_table(self, invoices):
-        """Populate the invoices table with data"""
-        self.invoices_table.setRowCount(len(invoices))
+        self.invoice_date_range = (from_date, to_date)
+        if from_date and to_date:
+            date_range = (from_date, to_date + timedelta(days=1))
+        else:
+            date_range = (None, None)
+        
+        # The totals are aggregated in SQL (and cached); the rows are read page by page as the table scrolls
+        summary = Invoice.get_supplier_summary(supplier_name, *date_range)
+        if summary is None:
+            self.clear_table()
+            self.update_summary(0, 0, 0, 0)
+            QMessageBox.critical(self, "خطأ في قاعدة البيانات", "فشل في تحميل فواتير المورد")
+            return
+        self.current_invoice_query = (supplier_name, *date_range)
+        self.current_summary = summary
         
-        for row, invoice in enumerate(invoices):
-            # Invoice number
-            self.invoices_table.setItem(row, 0, QTableWidgetItem(str(invoice[0])))
-            
-            # Supplier name
-            self.invoices_table.setItem(row, 1, QTableWidgetItem(str(invoice[1])))
-            
-            # Total amount
-            self.invoices_table.setItem(row, 2, QTableWidgetItem(f"{invoice[2]:.2f}"))
-            
-            # Payment status (translate to Arabic)
-            payment_status = str(invoice[3])
-            if payment_status == "PAID" or payment_status == "Paid":
-                payment_status = "مدفوع"
-            elif payment_status == "PARTIALLY_PAID" or payment_status == "Partially Paid":
-                payment_status = "مدفوع جزئيا"
-            elif payment_status == "DELAYED" or payment_status == "Delayed":
-                payment_status = "متأخر"
-            
-            status_item = QTableWidgetItem(payment_status)
-            if payment_status == "مدفوع":
-                status_item.setBackground(Qt.green)
-            elif payment_status == "متأخر":
-                status_item.setBackground(Qt.red)
-            else:
-                status_item.setBackground(Qt.yellow)
-            self.invoices_table.setItem(row, 3, status_item)
-            
-            # Paid amount
-            self.invoices_table.setItem(row, 4, QTableWidgetItem(f"{invoice[4]:.2f}"))
-            
-            # Issue date
-            date_str = invoice[5].strftime("%Y-%m-%d") if invoice[5] else ""
-            self.invoices_table.setItem(row, 5, QTableWidgetItem(date_str))
+        def fetch_page(offset, limit):
+            return Invoice.get_supplier_invoices(supplier_name, *date_range, offset, limit), summary['invoice_count']
+        
+        self.invoices_model.set_page_source(fetch_page)
+        self.update_summary(summary['invoice_count'], summary['total_amount'],
+                            summary['paid_amount'], summary['remaining_amount'])
+        self.adjust_table_height()  # Adjust height after loading invoices
     
     def clear_table(self):
         """Clear the invoices table"""
-        self.invoices_table.setRowCount(0)
+        self.current_invoice_query = None
+        self.current_summary = None
+        self.invoices_model.set_rows([])
         self.adjust_table_height()  # Adjust height after clearing table
     
-    def update_summary(self, invoices, total_amount, paid_amount, remaining_amount):
+    def update_summary(self, invoice_count, total_amount, paid_amount, remaining_amount):
         """Update the summary labels"""
-        self.total_invoices_label.setText(f"إجمالي الفواتير: {len(invoices)}")
+        self.total_invoices_label.setText(f"إجمالي الفواتير: {invoice_count}")
         self.total_amount_label.setText(f"إجمالي المبلغ: {total_amount:.2f}")
         self.paid_amount_label.setText(f"المبلغ المدفوع: {paid_amount:.2f}")
         self.remaining_amount_label.setText(f"المبلغ المتبقي: {remaining_amount:.2f}")
@@ -1062,8 +1192,8 @@ class SuppliersWidget(QWidget):
             QMessageBox.warning(self, "تحذير", "يرجى اختيار مورد أولاً")
             return
         
-        from_date = self.from_date.date().toString("yyyy-MM-dd")
-        to_date = self.to_date.date().toString("yyyy-MM-dd")
+        from_date = self.from_date.date().toPython()
+        to_date = self.to_date.date().toPython()
         
         if self.from_date.date() > self.to_date.date():
             QMessageBox.warning(self, "تحذير", "تاريخ البداية يجب أن يكون قبل تاريخ النهاية")
@@ -1083,7 +1213,7 @@ class SuppliersWidget(QWidget):
     
     def export_to_pdf(self):
         """Export current invoices to PDF"""
-        if not hasattr(self, 'current_invoices') or not self.current_invoices:
+        if not getattr(self, 'current_summary', None) or not self.current_summary['invoice_count']:
             QMessageBox.warning(self, "تحذير", "لا توجد فواتير للتصدير")
             return
         
@@ -1095,13 +1225,21 @@ class SuppliersWidget(QWidget):
         if not file_path:
             return
         
+        # The report lists every invoice, not only the pages loaded in the table, with totals read
+        # at the same time so they match its rows even if invoices changed since the table was loaded
+        summary = Invoice.get_supplier_summary(*self.current_invoice_query)
+        if summary is None:
+            QMessageBox.critical(self, "خطأ في قاعدة البيانات", "فشل في تحميل فواتير المورد")
+            return
+        
         try:
-            self.create_invoices_pdf(file_path, self.current_invoices)
+            invoices = Invoice.get_supplier_invoices(*self.current_invoice_query)
+            self.create_invoices_pdf(file_path, invoices, summary)
             QMessageBox.information(self, "نجح", f"تم تصدير التقرير بنجاح إلى:\n{file_path}")
         except Exception as e:
             QMessageBox.critical(self, "خطأ", f"فشل في تصدير التقرير: {e}")
     
-    def create_invoices_pdf(self, file_path, invoices):
+    def create_invoices_pdf(self, file_path, invoices, summary):
         """Create PDF report for invoices"""
         doc = SimpleDocTemplate(file_path, pagesize=A4)
         story = []
@@ -1147,20 +1285,12 @@ class SuppliersWidget(QWidget):
         
         for invoice in invoices:
             date_str = invoice[5].strftime("%Y-%m-%d") if invoice[5] else ""
-            # Translate payment status to Arabic
-            payment_status = str(invoice[3])
-            if payment_status == "PAID" or payment_status == "Paid":
-                payment_status = "مدفوع"
-            elif payment_status == "PARTIALLY_PAID" or payment_status == "Partially Paid":
-                payment_status = "مدفوع جزئيا"
-            elif payment_status == "DELAYED" or payment_status == "Delayed":
-                payment_status = "متأخر"
             
             data.append([
                 str(invoice[0]),
                 format_arabic_text(str(invoice[1])),
                 f"{invoice[2]:.2f} ج.م",
-                format_arabic_text(payment_status),
+                format_arabic_text(payment_status_text(invoice[3])),
                 f"{invoice[4]:.2f} ج.م",
                 date_str
             ])
@@ -1183,16 +1313,12 @@ class SuppliersWidget(QWidget):
         story.append(table)
         story.append(Spacer(1, 12))
         
-        # Summary
-        total_amount = sum(invoice[2] for invoice in invoices)
-        paid_amount = sum(invoice[4] for invoice in invoices)
-        remaining_amount = total_amount - paid_amount
-        
+        # Summary, as shown on screen
         summary_data = [
-            [format_arabic_text('إجمالي الفواتير'), str(len(invoices))],
-            [format_arabic_text('إجمالي المبلغ'), f"{total_amount:.2f} ج.م"],
-            [format_arabic_text('المبلغ المدفوع'), f"{paid_amount:.2f} ج.م"],
-            [format_arabic_text('المبلغ المتبقي'), f"{remaining_amount:.2f} ج.م"]
+            [format_arabic_text('إجمالي الفواتير'), str(summary['invoice_count'])],
+            [format_arabic_text('إجمالي المبلغ'), f"{summary['total_amount']:.2f} ج.م"],
+            [format_arabic_text('المبلغ المدفوع'), f"{summary['paid_amount']:.2f} ج.م"],
+            [format_arabic_text('المبلغ المتبقي'), f"{summary['remaining_amount']:.2f} ج.م"]
         ]
         
         summary_table = Table(summary_data)
@@ -1225,11 +1351,9 @@ class SuppliersWidget(QWidget):
         
         # Create table
         table = QTableWidget()
-        table.setColumnCount(6)
+        table.setColumnCount(len(BRANCH_ACTIVITY_HEADERS))
         table.setEditTriggers(QTableWidget.NoEditTriggers)
-        table.setHorizontalHeaderLabels([
-            "اسم الفرع", "كود الفرع", "مدير الفرع", "إجمالي الاستخراجات", "إجمالي الكمية", "عدد الأصناف المختلفة"
-        ])
+        table.setHorizontalHeaderLabels(BRANCH_ACTIVITY_HEADERS)
         
         # Populate table
         table.setRowCount(len(branch_data))
@@ -1251,33 +1375,15 @@ class SuppliersWidget(QWidget):
     
     def export_branch_report_to_pdf(self):
         """Export branch report to PDF"""
-        if not hasattr(self, 'current_branch_data') or not self.current_branch_data:
-            # Generate branch data if not available
-            try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT COALESCE(b.branch_name, e.branch_name) as branch_name, 
-                           COUNT(e.id) as total_extractions,
-                           SUM(e.quantity_extracted) as total_quantity,
-                           COUNT(DISTINCT i.item_name) as unique_items,
-                           b.branch_code,
-                           b.manager_name
-                    FROM extractions e
-                    JOIN items i ON e.item_id = i.id
-                    LEFT JOIN branches b ON e.branch_name = b.branch_name AND b.is_active = 1
-                    GROUP BY COALESCE(b.branch_name, e.branch_name), b.branch_code, b.manager_name
-                    ORDER BY total_quantity DESC
-                """)
-                
-                self.current_branch_data = cursor.fetchall()
-                conn.close()
-                
-            except pyodbc.Error as e:
-                QMessageBox.critical(self, "خطأ في قاعدة البيانات", f"فشل في تحميل بيانات الفروع: {e}")
-                return
+        # The report is cached, so this is immediate unless extractions changed since it was shown
+        self.load_branch_activity(self.save_branch_report_pdf)
+    
+    def save_branch_report_pdf(self, branch_data):
+        if branch_data is None:
+            QMessageBox.critical(self, "خطأ في قاعدة البيانات", "فشل في تحميل بيانات الفروع")
+            return
         
+        self.current_branch_data = branch_data
         if not self.current_branch_data:
             QMessageBox.warning(self, "تحذير", "لا توجد بيانات فروع للتصدير")
             return
@@ -1337,6 +1443,11 @@ class SuppliersWidget(QWidget):
             extraction_data = cursor.fetchall()
             conn.close()
             
+            # The table also shows the activity report of all branches; set the items report columns
+            self.branch_report_frame.setTitle("تقرير الأصناف المستخرجة")
+            self.branch_table.setColumnCount(len(BRANCH_ITEMS_HEADERS))
+            self.branch_table.setHorizontalHeaderLabels(BRANCH_ITEMS_HEADERS)
+            
             if not extraction_data:
                 # Clear table and show empty state
                 self.branch_table.setRowCount(0)
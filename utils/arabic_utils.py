@@ -0,0 +1,51 @@
+"""
+Arabic text normalization for search.
+
+Spelling variants that users type interchangeably are folded to one form so
+that, for example, "أرز", "ارز" and "إرز" all match the same product.
+"""
+import re
+
+# Tashkeel (harakat, tanween, shadda, sukun), superscript alef and tatweel
+_DIACRITICS = re.compile('[\u064B-\u0652\u0670\u0640]')
+_WHITESPACE = re.compile(r'\s+')
+
+_LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و',
+    'ئ': 'ي',
+})
+
+def normalize_arabic(text):
+    """Fold Arabic spelling variants, strip diacritics, lowercase and collapse whitespace"""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub('', str(text))
+    text = text.translate(_LETTER_MAP).lower()
+    return _WHITESPACE.sub(' ', text).strip()
+
+def trigrams(normalized_text):
+    """Get the distinct 3-character substrings of an already normalized string"""
+    return {normalized_text[i:i + 3] for i in range(len(normalized_text) - 2)}
+
+def match_rank(normalized_name, normalized_term):
+    """Match a name against a search term in memory the way NameIndex.build_search does in SQL
+    Returns: 0 for an exact match, 1 prefix, 2 word prefix, 3 infix, or None if the name does not match
+    """
+    if normalized_name == normalized_term:
+        return 0
+    if normalized_name.startswith(normalized_term):
+        return 1
+    # Terms too short for trigrams only match as a prefix
+    if len(normalized_term) < 3:
+        return None
+    if f' {normalized_term}' in normalized_name:
+        return 2
+    if normalized_term in normalized_name:
+        return 3
+    return None
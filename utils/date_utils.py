@@ -0,0 +1,20 @@
+"""
+Display helpers for date values read from the database.
+
+Dates are passed around as native date/datetime objects and only turned into
+text here, at display time.
+"""
+from datetime import date, datetime
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+def format_date(value, with_time=False):
+    """Format a date/datetime for display; strings are returned unchanged and None becomes ''"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime(DATETIME_FORMAT if with_time else DATE_FORMAT)
+    if isinstance(value, date):
+        return value.strftime(DATE_FORMAT)
+    return str(value)
@@ -0,0 +1,74 @@
+"""
+In-process publish/subscribe for committed data changes.
+
+Models publish an event right after a successful commit and widgets
+subscribe to the event types that affect what they show, instead of
+reloading everything whenever a tab is opened. Events are delivered
+synchronously on the publishing thread. A failing subscriber is reported
+and skipped so it cannot turn the caller's successful write into an error.
+Bound methods are held weakly, so a subscribed widget does not outlive
+its window.
+"""
+import threading
+import weakref
+from collections import namedtuple
+
+# Lots were added to an invoice (the invoice may be new)
+ItemAdded = namedtuple('ItemAdded', ['invoice_number', 'supplier_name', 'item_ids'])
+# Lots were extracted to a branch
+StockExtracted = namedtuple('StockExtracted', ['item_ids', 'branch_id'])
+# An invoice was created without lots (add_invoice)
+InvoiceSaved = namedtuple('InvoiceSaved', ['invoice_id', 'invoice_number', 'supplier_name'])
+# An invoice's payments or payment status changed; supplier_name is None when unknown
+PaymentRecorded = namedtuple('PaymentRecorded', ['invoice_id', 'supplier_name', 'amount'])
+# A supplier was added, updated or deleted
+SupplierChanged = namedtuple('SupplierChanged', ['supplier_id'])
+# A branch was added, updated or deleted
+BranchChanged = namedtuple('BranchChanged', ['branch_id'])
+# A setting was updated; setting_name is None when unknown
+SettingsChanged = namedtuple('SettingsChanged', ['setting_name'])
+
+# Event types by name, for sending events to other terminals
+EVENT_TYPES = {event_type.__name__: event_type for event_type in
+               (ItemAdded, StockExtracted, InvoiceSaved, PaymentRecorded,
+                SupplierChanged, BranchChanged, SettingsChanged)}
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # event type -> list of callback references
+
+    @staticmethod
+    def _reference(callback):
+        if hasattr(callback, '__self__'):
+            return weakref.WeakMethod(callback)
+        return lambda: callback
+
+    def subscribe(self, event_type, callback):
+        """Call callback(event) for every published event of this type"""
+        with self._lock:
+            self._subscribers.setdefault(event_type, []).append(self._reference(callback))
+
+    def unsubscribe(self, event_type, callback):
+        with self._lock:
+            self._subscribers[event_type] = [ref for ref in self._subscribers.get(event_type, [])
+                                             if ref() not in (None, callback)]
+
+    def publish(self, event):
+        """Deliver an event to the subscribers of its type"""
+        with self._lock:
+            references = self._subscribers.get(type(event), [])
+            callbacks = [ref() for ref in references]
+            # Forget subscribers that were garbage collected
+            self._subscribers[type(event)] = [ref for ref, callback in zip(references, callbacks)
+                                              if callback is not None]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error handling {type(event).__name__}: {e}")
+
+# Shared by all models and widgets
+event_bus = EventBus()
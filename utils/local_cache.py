@@ -0,0 +1,97 @@
+"""
+On-disk copy of the last data each view showed, for an instant first paint.
+
+Views read their entry at startup, paint it straight away and then
+revalidate against the database in the background. The file is written once,
+at exit: views register a provider per key and flush() collects the current
+values from them, so keeping the cache costs nothing while the app runs.
+Values are JSON with dates, datetimes and Decimals converted; the file is
+gzip-compressed and replaced atomically so a crash never leaves it half
+written. A missing or unreadable file just means an empty cache.
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+def default_cache_path():
+    base_dir = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    return os.path.join(base_dir, 'StockManagementSystem', 'local_cache.json.gz')
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+def _decode(obj):
+    if '$datetime' in obj:
+        return datetime.fromisoformat(obj['$datetime'])
+    if '$date' in obj:
+        return date.fromisoformat(obj['$date'])
+    return obj
+
+class LocalCache:
+    def __init__(self, path=None):
+        self.path = path or default_cache_path()
+        self._lock = threading.Lock()
+        self._entries = None   # key -> {'saved_at': datetime, 'value': ...}
+        self._providers = {}   # key -> callable returning the value to save (None to keep the old one)
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                    self._entries = json.load(f, object_hook=_decode)
+            except (OSError, ValueError) as e:
+                if os.path.exists(self.path):
+                    print(f"Ignoring unreadable local cache {self.path}: {e}")
+                self._entries = {}
+        return self._entries
+
+    def get(self, key):
+        """
+        Get a cached value
+        Returns: (value, datetime it was saved) or (None, None) if there is none
+        """
+        with self._lock:
+            entry = self._load().get(key)
+            if entry is None:
+                return None, None
+            return entry['value'], entry['saved_at']
+
+    def register(self, key, provider):
+        """Save provider() under key at the next flush(); replaces an earlier provider for the key"""
+        with self._lock:
+            self._providers[key] = provider
+
+    def flush(self):
+        """Collect the registered values and write the cache file"""
+        with self._lock:
+            entries = self._load()
+            now = datetime.now()
+            for key, provider in self._providers.items():
+                try:
+                    value = provider()
+                except Exception as e:
+                    print(f"Could not collect local cache entry {key}: {e}")
+                    continue
+                if value is not None:
+                    entries[key] = {'saved_at': now, 'value': value}
+
+            temp_path = self.path + '.tmp'
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                    json.dump(entries, f, default=_encode, ensure_ascii=False, separators=(',', ':'))
+                os.replace(temp_path, self.path)
+            except (OSError, TypeError) as e:
+                print(f"Could not write local cache {self.path}: {e}")
+
+# Shared by all views; main.py flushes it when the application quits
+local_cache = LocalCache()
@@ -0,0 +1,332 @@
+"""
+Change notifications between terminals sharing one database.
+
+Every terminal runs a NotificationClient. It forwards the events published
+on the local event bus to a NotificationBroker, and republishes the events
+sent by other terminals after dropping the caches those events invalidate,
+so views refresh without anyone pressing "refresh". The broker is a relay of
+JSON lines over TCP. Run it on the server with
+``python -m utils.notification_broker [port] [address]`` and set the
+notification_broker_host setting to that server, or set it to a local
+address to let the first terminal on a machine host it for the terminals
+of that machine only.
+
+The broker has no authentication: anyone who can reach its port can read
+the events and send fake ones. Give it the address of the interface the
+terminals use (not every interface) and keep the port behind the firewall.
+
+The client polls instead whenever it is not connected to a shared broker:
+with no broker configured, while the broker cannot be reached, and while
+connected to a broker on this machine, which only hears from the
+terminals of this machine. Polling reads change tokens for the
+change-tracked tables and table_versions for the reference tables in the
+background, so other terminals' writes still show up, only later and with
+less detail. A write made by this terminal starts a poll at once whose
+result leaves out the tables the write touched: the views already
+refreshed for it, so they are not reloaded a second time.
+"""
+import json
+import sys
+import uuid
+from decimal import Decimal
+
+from PySide6.QtCore import QObject, QTimer, QCoreApplication
+from PySide6.QtNetwork import QTcpServer, QTcpSocket, QHostAddress, QAbstractSocket
+import pyodbc
+
+from database import invalidate_tables
+from models.change_tracking import ChangeTracking
+from models.table_versions import TableVersions
+from models.supplier import Supplier
+from models.branch import Branch
+from models.settings import Settings
+from ui.background import BackgroundTask, detach_thread
+from utils.event_bus import (event_bus, EVENT_TYPES, ItemAdded, StockExtracted, InvoiceSaved,
+                             PaymentRecorded, SupplierChanged, BranchChanged, SettingsChanged)
+
+DEFAULT_PORT = 45454
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+# Cached query results each event makes stale (see database.fetch_cached)
+EVENT_TABLES = {
+    ItemAdded: ('items', 'product_stock', 'item_name_trigrams', 'invoices', 'supplier_balances'),
+    StockExtracted: ('items', 'extractions', 'product_stock'),
+    InvoiceSaved: ('invoices', 'invoice_payments', 'supplier_balances'),
+    PaymentRecorded: ('invoices', 'invoice_payments', 'supplier_balances'),
+    SupplierChanged: ('suppliers',),
+    BranchChanged: ('branches',),
+    SettingsChanged: (),
+}
+
+# Events published when polling finds a table changed; the details are unknown
+POLLED_CHANGE_TRACKED_EVENTS = {
+    'items': ItemAdded(None, None, ()),
+    'extractions': StockExtracted((), None),
+    'invoices': PaymentRecorded(None, None, 0),
+}
+POLLED_VERSIONED_EVENTS = {
+    'suppliers': SupplierChanged(None),
+    'branches': BranchChanged(None),
+    'settings': SettingsChanged(None),
+}
+
+def polled_tables(event):
+    """Get the polled tables a local event reports a change of"""
+    tables = {table_name for table_name in EVENT_TABLES[type(event)] if table_name in POLLED_CHANGE_TRACKED_EVENTS}
+    tables.update(table_name for table_name, polled_event in POLLED_VERSIONED_EVENTS.items()
+                  if type(polled_event) is type(event))
+    return tables
+
+def encode_event(event, origin):
+    """Serialize an event as one JSON line"""
+    def default(value):
+        return float(value) if isinstance(value, Decimal) else str(value)
+    message = {'event': type(event).__name__, 'origin': origin, 'fields': event._asdict()}
+    return (json.dumps(message, default=default) + '\n').encode('utf-8')
+
+def decode_event(line):
+    """Parse a JSON line into (event, origin), or (None, None) if it is not a known event"""
+    try:
+        message = json.loads(line)
+        event_type = EVENT_TYPES[message['event']]
+        fields = {name: tuple(value) if isinstance(value, list) else value
+                  for name, value in message['fields'].items()}
+        return event_type(**fields), message.get('origin')
+    except (ValueError, KeyError, TypeError):
+        return None, None
+
+class NotificationBroker(QObject):
+    """Relays every line a terminal sends to all the other connected terminals"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.server = QTcpServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+        self.clients = []
+
+    def listen(self, port=DEFAULT_PORT, address=QHostAddress.Any):
+        """Start accepting terminals; returns False if the port is taken (e.g. by another broker)"""
+        return self.server.listen(QHostAddress(address), port)
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.clients.append(socket)
+            socket.readyRead.connect(lambda socket=socket: self.relay(socket))
+            socket.disconnected.connect(lambda socket=socket: self.on_disconnected(socket))
+
+    def relay(self, sender):
+        while sender.canReadLine():
+            line = bytes(sender.readLine())
+            for socket in self.clients:
+                if socket is not sender:
+                    socket.write(line)
+
+    def on_disconnected(self, socket):
+        if socket in self.clients:
+            self.clients.remove(socket)
+        socket.deleteLater()
+
+class NotificationClient(QObject):
+    """Connects this terminal's event bus to the broker, polling for changes while it is unreachable"""
+    RECONNECT_INTERVAL = 10000  # ms
+    POLL_INTERVAL = 15000       # ms
+    STOP_WAIT = 2000            # ms
+
+    def __init__(self, host=None, port=DEFAULT_PORT, parent=None):
+        super().__init__(parent)
+        self.host = host  # None: no broker, poll only
+        self.port = port
+        # Lets the broker's relays be recognized if they ever come back to this terminal
+        self.client_id = uuid.uuid4().hex
+        # True while republishing a remote event, so it is not sent back to the broker
+        self.relaying = False
+        self.change_token = None
+        self.table_versions = None
+        # The poll running in the background (None if none), and whether to poll again once it is done
+        self.poll_task = None
+        self.poll_pending = False
+        # Polled tables changed by this terminal since the last poll was started
+        self.own_tables = set()
+
+        self.socket = QTcpSocket(self)
+        self.socket.connected.connect(self.on_connected)
+        self.socket.disconnected.connect(self.on_disconnected)
+        self.socket.errorOccurred.connect(self.on_error)
+        self.socket.readyRead.connect(self.on_ready_read)
+
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setInterval(self.RECONNECT_INTERVAL)
+        self.reconnect_timer.timeout.connect(self.connect_to_broker)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.POLL_INTERVAL)
+        self.poll_timer.timeout.connect(self.poll_changes)
+
+        for event_type in EVENT_TYPES.values():
+            event_bus.subscribe(event_type, self.send_event)
+
+    def start(self):
+        """Poll until the broker accepts the connection (or for good if no broker is configured)"""
+        # The first poll only reads the baseline later polls compare with
+        self.poll_changes()
+        self.poll_timer.start()
+        if self.host is not None:
+            self.connect_to_broker()
+
+    def stop(self):
+        """Stop polling and reconnecting, giving a running poll a moment to finish"""
+        self.poll_timer.stop()
+        self.reconnect_timer.stop()
+        self.poll_pending = False
+        if self.poll_task is not None and not self.poll_task.wait(self.STOP_WAIT):
+            # A hung query must not hold up quitting
+            self.poll_task.finished.disconnect(self.on_poll_finished)
+            detach_thread(self.poll_task)
+            self.poll_task = None
+        self.socket.abort()
+
+    def is_shared_broker(self):
+        """Whether the broker relays the terminals of other machines too"""
+        return self.host is not None and self.host not in LOCAL_HOSTS
+
+    def is_connected(self):
+        return self.socket.state() == QAbstractSocket.ConnectedState
+
+    def connect_to_broker(self):
+        if self.socket.state() == QAbstractSocket.UnconnectedState:
+            self.socket.connectToHost(self.host, self.port)
+
+    def on_connected(self):
+        self.reconnect_timer.stop()
+        if self.is_shared_broker():
+            self.poll_timer.stop()
+            # Catch up on changes made since the last poll; from now on the broker reports them
+            self.poll_changes()
+        # A broker on this machine misses other machines' writes, so polling goes on for those
+
+    def on_disconnected(self):
+        # The first poll reports everything since the connection was made, covering dropped messages
+        self.poll_timer.start()
+        self.reconnect_timer.start()
+
+    def on_error(self, error):
+        # Reported once per outage; the reconnect timer runs until the broker is back
+        if not self.reconnect_timer.isActive():
+            print(f"Notification broker unavailable ({self.host}:{self.port}): {self.socket.errorString()}")
+            self.reconnect_timer.start()
+
+    def send_event(self, event):
+        if self.relaying:
+            return
+        if self.is_connected():
+            self.socket.write(encode_event(event, self.client_id))
+        tables = polled_tables(event)
+        if tables and self.poll_timer.isActive():
+            # Move the poll baseline past this write, so the next polls do not report it again
+            self.own_tables.update(tables)
+            self.poll_changes()
+
+    def on_ready_read(self):
+        while self.socket.canReadLine():
+            event, origin = decode_event(bytes(self.socket.readLine()).decode('utf-8'))
+            if event is not None and origin != self.client_id:
+                self.apply_remote_event(event)
+
+    def apply_remote_event(self, event):
+        """Drop the caches an event from another terminal invalidates, then publish it locally"""
+        invalidate_tables(*EVENT_TABLES[type(event)])
+        if isinstance(event, SupplierChanged):
+            Supplier.invalidate_cache()
+        elif isinstance(event, BranchChanged):
+            Branch.invalidate_cache()
+        elif isinstance(event, SettingsChanged):
+            Settings.refresh()
+
+        self.relaying = True
+        try:
+            event_bus.publish(event)
+        finally:
+            self.relaying = False
+
+    @staticmethod
+    def read_changes(change_token):
+        """
+        Read the tables changed since a change token and the reference table versions; runs in the background
+        Returns: (set of changed tables, or None for the first poll, new token, versions), or None on error
+        """
+        try:
+            if change_token is None:
+                changed_tables, new_token = None, ChangeTracking.current_token()
+            else:
+                changed_tables, new_token = ChangeTracking.changed_tables(change_token)
+            return changed_tables, new_token, TableVersions.get_many(list(POLLED_VERSIONED_EVENTS))
+        except pyodbc.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    def poll_changes(self):
+        """Publish an event for every table changed since the last poll, read in the background"""
+        if self.poll_task is not None:
+            # It may have read its token before this terminal's latest write; poll again once it is done
+            self.poll_pending = True
+            return
+        self.poll_pending = False
+        own_tables, self.own_tables = self.own_tables, set()
+        self.poll_task = BackgroundTask(NotificationClient.read_changes, self.change_token, parent=self)
+        self.poll_task.result_ready.connect(lambda result: self.on_polled(result, own_tables))
+        self.poll_task.finished.connect(self.on_poll_finished)
+        self.poll_task.start()
+
+    def on_poll_finished(self):
+        self.poll_task.deleteLater()
+        self.poll_task = None
+        if self.poll_pending:
+            self.poll_changes()
+
+    def on_polled(self, result, own_tables):
+        if result is None:
+            # The baseline did not move, so the next poll sees this terminal's writes again
+            self.own_tables.update(own_tables)
+            return
+        changed_tables, self.change_token, versions = result
+        if changed_tables is not None and self.table_versions is not None:
+            # This terminal's writes were published when it made them; their views already refreshed
+            for table_name, event in POLLED_CHANGE_TRACKED_EVENTS.items():
+                if table_name in changed_tables and table_name not in own_tables:
+                    self.apply_remote_event(event)
+            for table_name, event in POLLED_VERSIONED_EVENTS.items():
+                if versions[table_name] != self.table_versions[table_name] and table_name not in own_tables:
+                    self.apply_remote_event(event)
+        self.table_versions = versions
+
+def start_notifications(parent=None):
+    """
+    Connect this terminal to the broker configured in the settings, hosting the broker
+    here if it is configured on this machine and no other terminal hosts it yet;
+    with no broker configured, the terminal polls for changes
+    Returns: (NotificationBroker or None, NotificationClient); keep references to both
+    """
+    host = (Settings.get_setting('notification_broker_host') or '').strip() or None
+    port = Settings.get_setting('notification_broker_port') or DEFAULT_PORT
+
+    broker = None
+    if host in LOCAL_HOSTS:
+        broker = NotificationBroker(parent)
+        if not broker.listen(port, QHostAddress.LocalHost):
+            broker = None
+
+    client = NotificationClient(host, port, parent)
+    client.start()
+    return broker, client
+
+if __name__ == "__main__":
+    app = QCoreApplication(sys.argv)
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    # Without an address the broker listens on every interface (see the exposure note above)
+    address = sys.argv[2] if len(sys.argv) > 2 else QHostAddress.Any
+    broker = NotificationBroker()
+    if not broker.listen(port, address):
+        print(f"Cannot listen on port {port}")
+        sys.exit(1)
+    print(f"Notification broker listening on {broker.server.serverAddress().toString()}:{port}")
+    sys.exit(app.exec())
@@ -9,6 +9,7 @@ from PySide6.QtPrintSupport import QPrinter, QPrintDialog
 from PySide6.QtCore import QSize, Qt
 
 from models.settings import Settings
+from utils.date_utils import format_date
 
 def get_available_printers():
     """
@@ -126,7 +127,7 @@ def generate_receipt_content(invoice_data, items_data, logo_path=None, is_histor
     # Draw document details
     painter.drawText(x, y, f"رقم المرجع: {str(invoice_data['invoice_number'])}")
     y += line_height
-    painter.drawText(x, y, f"التاريخ: {str(invoice_data['issue_date'])}")
+    painter.drawText(x, y, f"التاريخ: {format_date(invoice_data['issue_date'])}")
     y += line_height
     
     if is_history:
@@ -169,7 +170,7 @@ def generate_receipt_content(invoice_data, items_data, logo_path=None, is_histor
             # For history report
             painter.drawText(x, y, item['item_name'])
             painter.drawText(x + 250, y, str(item['quantity']))
-            painter.drawText(x + 350, y, str(item['date_added']))
+            painter.drawText(x + 350, y, format_date(item['date_added']))
             painter.drawText(x + 450, y, str(item['supplier_name']))  # Using supplier_name field for user/details
         else:
             # For regular invoice
@@ -221,7 +222,8 @@ def generate_receipt_content(invoice_data, items_data, logo_path=None, is_histor
             paid_amount = float(invoice_data['paid_amount']) if invoice_data['paid_amount'] is not None else 0.0
             painter.drawText(x + 400, y, f"{paid_amount:.2f} ج.م")
             y += line_height
-            remaining = total_amount - paid_amount
+            remaining = invoice_data.get('outstanding_amount')
+            remaining = float(remaining) if remaining is not None else total_amount - paid_amount
             painter.drawText(x + 300, y, "المتبقي:")
             painter.drawText(x + 400, y, f"{remaining:.2f} ج.م")
     
@@ -0,0 +1,97 @@
+"""
+Process-wide cache for query results.
+
+Entries are keyed by the whitespace-normalized SQL text and its parameters
+and remember the generation of every table the query reads. Model writes
+call bump() for the tables they change, which makes every entry that read
+those tables stale without having to know which queries they were. Old
+entries are evicted least-recently-used first once the entry or row limits
+are reached, and max_age bounds how long a result can hide changes made by
+other terminals.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r'\s+')
+
+class QueryCache:
+    def __init__(self, max_entries=256, max_rows=200000, max_age=60):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (tables, generations, stored_at, rows)
+        self._generations = {}          # table name -> generation
+        self._row_count = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'stale': 0}
+
+    @staticmethod
+    def make_key(sql, params=()):
+        return _WHITESPACE.sub(' ', sql).strip(), tuple(params)
+
+    def get(self, key, max_age=None):
+        """Get cached rows for a key, or None if missing or stale"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                tables, generations, stored_at, rows = entry
+                if (generations == tuple(self._generations.get(table, 0) for table in tables)
+                        and time.monotonic() - stored_at < max_age):
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return rows
+                self._drop(key)
+                self._stats['stale'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def generations(self, tables):
+        """Snapshot the generations of some tables; take it before running the query"""
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+    def put(self, key, tables, generations, rows):
+        """Store rows read at the given table generations"""
+        rows = tuple(rows)
+        with self._lock:
+            if len(rows) > self.max_rows:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (tuple(tables), generations, time.monotonic(), rows)
+            self._row_count += len(rows)
+            while len(self._entries) > self.max_entries or self._row_count > self.max_rows:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats['evictions'] += 1
+
+    def bump(self, *tables):
+        """Mark every cached result that read any of these tables as stale"""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._row_count = 0
+
+    def stats(self):
+        """Get hit/miss counters plus the current size of the cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['rows'] = self._row_count
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+            return stats
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._row_count -= len(entry[3])
+
+# Shared by all models
+query_cache = QueryCache()
@@ -0,0 +1,119 @@
+"""
+In-memory inverted index for the global search bar.
+
+Every document is a SearchResult (kind, key, label). The key is tokenized
+after Arabic normalization and each word points back at the documents that
+contain it; a sorted word list turns "words starting with X" into a bisect,
+so results can be returned on every keystroke.
+"""
+import bisect
+import threading
+from collections import namedtuple
+
+from utils.arabic_utils import normalize_arabic
+
+# kind: 'item', 'invoice', 'supplier' or 'branch'; key: the name/number to navigate to
+SearchResult = namedtuple('SearchResult', ['kind', 'key', 'label'])
+
+class SearchIndex:
+    # Result order when several kinds match equally well
+    KIND_ORDER = ('item', 'invoice', 'supplier', 'branch')
+
+    def __init__(self, results=None):
+        self._lock = threading.Lock()
+        self._documents = {}  # (kind, key) -> SearchResult
+        self._postings = {}   # word -> set of (kind, key)
+        self._words = []      # sorted list of the words in _postings
+        for result in results or []:
+            self._add(result)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, result):
+        """Add or replace a document"""
+        with self._lock:
+            self._remove(result.kind, result.key)
+            self._add(result)
+
+    def remove(self, kind, key):
+        """Remove a document if it is indexed"""
+        with self._lock:
+            self._remove(kind, key)
+
+    def replace_kind(self, kind, results):
+        """Replace every document of one kind, e.g. after suppliers were edited"""
+        with self._lock:
+            for doc_kind, key in [doc for doc in self._documents if doc[0] == kind]:
+                self._remove(doc_kind, key)
+            for result in results:
+                self._add(result)
+
+    def search(self, query, limit=20):
+        """Get the documents whose words start with every word of the query, best matches first"""
+        tokens = normalize_arabic(query).split()
+        if not tokens:
+            return []
+
+        with self._lock:
+            matches = None
+            for token in tokens:
+                start = bisect.bisect_left(self._words, token)
+                end = bisect.bisect_left(self._words, token + '\uffff')
+                token_docs = set()
+                for word in self._words[start:end]:
+                    token_docs |= self._postings[word]
+                matches = token_docs if matches is None else matches & token_docs
+                if not matches:
+                    return []
+            results = [self._documents[doc] for doc in matches]
+
+        normalized_query = ' '.join(tokens)
+
+        def rank(result):
+            key = normalize_arabic(result.key)
+            if key == normalized_query:
+                match_rank = 0
+            elif key.startswith(normalized_query):
+                match_rank = 1
+            else:
+                match_rank = 2
+            return match_rank, self.KIND_ORDER.index(result.kind), len(key), key
+
+        results.sort(key=rank)
+        return results[:limit]
+
+    @staticmethod
+    def _words_of(text):
+        """Index words of a key; words with the Arabic article are also indexed without it"""
+        words = set()
+        for word in normalize_arabic(text).split():
+            words.add(word)
+            if word.startswith('ال') and len(word) > 3:
+                words.add(word[2:])
+        return words
+
+    def _add(self, result):
+        doc = (result.kind, result.key)
+        self._documents[doc] = result
+        for word in self._words_of(result.key):
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                bisect.insort(self._words, word)
+            postings.add(doc)
+
+    def _remove(self, kind, key):
+        doc = (kind, key)
+        if self._documents.pop(doc, None) is None:
+            return
+        for word in self._words_of(key):
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.discard(doc)
+            if not postings:
+                del self._postings[word]
+                index = bisect.bisect_left(self._words, word)
+                if index < len(self._words) and self._words[index] == word:
+                    del self._words[index]
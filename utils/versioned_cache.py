@@ -0,0 +1,47 @@
+"""
+In-process cache for small reference tables, validated against a version counter.
+
+The cached rows are served without touching the database for check_interval
+seconds. After that one cheap lookup of the table's version (e.g. its row in
+table_versions) decides whether the rows are still current; they are only
+refetched when a writer has bumped the version. Writes made by this process
+call invalidate() so they show up immediately.
+"""
+import threading
+import time
+
+class VersionedCache:
+    def __init__(self, loader, get_version, check_interval=30):
+        """
+        loader: Callable returning the rows to cache; database errors should propagate
+        get_version: Callable returning the table's current version; database errors should propagate
+        check_interval: Seconds during which cached rows are served without checking the version
+        """
+        self.loader = loader
+        self.get_version = get_version
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def get(self):
+        """Get the cached rows, reloading them if the table version changed (raises on database errors)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data
+            
+            # Read the version before the rows so a concurrent write can only cause an extra reload
+            version = self.get_version()
+            if self._data is None or version != self._version:
+                self._data = self.loader()
+                self._version = version
+            self._checked_at = now
+            return self._data
+
+    def invalidate(self):
+        """Drop the cached rows so the next get() reloads them"""
+        with self._lock:
+            self._data = None
+            self._version = None